@@ -1,23 +1,70 @@
 """Cosmetist chat agent for skincare analysis and recommendations."""
 
+import hashlib
 import json
-import os
-from typing import Any
+import logging
+import time
+from typing import Any, Callable
 
 import requests
-from dotenv import load_dotenv
 
+from agents.routing import MODEL_TIERS, record_usage, route
+from services.accounting import count_images, usage_ledger, usage_scope
+from services.admission import admit
+from services.catalog import product_catalog
+from services.face_pose import (
+    FaceVerificationUnavailable,
+    detect_poses_in_pool,
+    summarize_views,
+)
+from services.photo_store import StoredPhoto, photo_bytes, photo_url
+from services.recommendations import (
+    parse_json_object,
+    parse_products,
+    parse_ratings,
+    recommendations,
+)
+from services.skin_metrics import compute_ratings
+from utils.cache import TieredCache
+from utils.cassettes import cassettes
+from utils.env import get_env
+from utils.serialization import dumps_str, loads
+
+logger = logging.getLogger(__name__)
 
-load_dotenv("../../.env")
-
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 OPENAI_API_URL = "https://api.openai.com/v1/chat/completions"
-SERPER_API_KEY = os.getenv("SERPER_API_KEY")
 DEFAULT_MODEL = "gpt-4o-mini"
+# Shopping results change slowly enough to share for a few hours. Entries are
+# the tool result text itself, so a hit is handed to the model as stored.
+serper_cache = TieredCache(
+    "serper",
+    version=2,
+    ttl_seconds=6 * 3600,
+    encode=str.encode,
+    decode=bytes.decode,
+)
+# Bump whenever the workflow prompts or local scoring change so cached
+# workflow results from the old version are not served.
+WORKFLOW_PROMPT_VERSION = "4"
+WORKFLOW_STAGES = ("verification", "analysis", "ratings", "shopping")
+
+SHOPPING_FORMAT = (
+    'Format the response in this format: ```json\n{\n  "products": [\n    {\n      '
+    '"title": "Example Product Title",\n      "source": "ExampleSource.com",\n      '
+    '"link": "https://example.com/product-page",\n      "price": "$0.00",\n      '
+    '"imageUrl": "https://example.com/product-image.jpg",\n      "rating": 0,\n      '
+    '"ratingCount": 0,\n      "productId": "123456789",\n      "position": 1\n    }\n  ]\n}\n```'
+)
 
 COSMETIST_SYSTEM_PROMPT = """You are a licensed aesthetician and cosmetic chemist.
 You can see the provided bare-face scan image via the companion user message. Never claim you cannot view it; describe what you observe and avoid asking for re-uploads.
-Chat naturally using markdown. When the user asks for products or shopping links, call the serper tool with a focused query and return your reply with markdown bullets that include links and thumbnails."""
+Chat naturally using markdown. When the user asks for products or shopping links, call the local_catalog tool with a focused query first and only call the serper tool when it returns no suitable products; return your reply with markdown bullets that include links and thumbnails."""
+
+
+# Identifies the chat prompt and model behind cached chat replies.
+CHAT_PROMPT_VERSION = hashlib.sha256(
+    f"{DEFAULT_MODEL}\n{COSMETIST_SYSTEM_PROMPT}".encode()
+).hexdigest()[:12]
 
 
 class ConversationTurn:
@@ -31,32 +78,68 @@ class ConversationTurn:
         return {"role": self.role, "content": self.content}
 
 
-def _get_openai_key() -> str:
-    if not OPENAI_API_KEY:
+def _get_openai_key() -> str | None:
+    api_key = get_env("OPENAI_API_KEY")
+    if not api_key and cassettes.live:
         raise RuntimeError("OPENAI_API_KEY is not set in the environment")
-    return OPENAI_API_KEY
+    return api_key
 
 
-def _serper_shopping_search(query: str, gl: str = "us") -> str:
-    """Execute a shopping search using Serper API."""
-    if not SERPER_API_KEY:
+def _get_serper_key() -> str | None:
+    api_key = get_env("SERPER_API_KEY")
+    if not api_key and cassettes.live:
         raise RuntimeError("SERPER_API_KEY is not set in the environment")
+    return api_key
 
-    response = requests.post(
-        "https://google.serper.dev/shopping",
-        headers={
-            "Content-Type": "application/json",
-            "X-API-KEY": SERPER_API_KEY,
-        },
-        json={"q": query, "gl": gl, "num": 20},
-        timeout=30,
-    )
 
+def _serper_shopping_search(query: str, gl: str = "us") -> str:
+    """Execute a shopping search using Serper API."""
+    cache_key = hashlib.sha256(f"{gl}:{' '.join(query.lower().split())}".encode())
+    cached = serper_cache.get(cache_key.hexdigest())
+    if cached is not None:
+        usage_ledger.record_serper(cached=True)
+        return cached
+
+    api_key = _get_serper_key()
+    headers = {"Content-Type": "application/json"}
+    # Replay mode runs without keys; send no placeholder credential.
+    if api_key:
+        headers["X-API-KEY"] = api_key
+
+    started = time.perf_counter()
+    with admit("serper"):
+        response = cassettes.post(
+            "serper",
+            "https://google.serper.dev/shopping",
+            headers=headers,
+            json={"q": query, "gl": gl, "num": 20},
+            timeout=30,
+        )
+
+    usage_ledger.record_serper(seconds=time.perf_counter() - started)
     if response.status_code != 200:
         raise RuntimeError(f"Serper search failed ({response.status_code})")
 
-    payload = response.json()
-    return json.dumps(payload.get("shopping", []))
+    results = loads(response.content).get("shopping", [])
+    try:
+        product_catalog.ingest(results, country=gl)
+    except Exception as exc:
+        logger.warning("Could not add Serper results to the catalog: %s", exc)
+    tool_result = dumps_str(results)
+    serper_cache.set(cache_key.hexdigest(), tool_result)
+    return tool_result
+
+
+def _local_catalog_search(args: dict[str, Any], country: str = "us") -> str:
+    """Look products up in the local catalog; an empty list means use serper."""
+    return dumps_str(
+        product_catalog.search(
+            args.get("q", ""),
+            country=country,
+            max_price=args.get("max_price"),
+            min_rating=args.get("min_rating"),
+        )
+    )
 
 
 SERPER_TOOL = {
@@ -79,20 +162,102 @@ SERPER_TOOL = {
 }
 
 
+LOCAL_CATALOG_TOOL = {
+    "type": "function",
+    "function": {
+        "name": "local_catalog",
+        "description": (
+            "Search products already seen in earlier shopping searches. Fast and "
+            "free; returns [] when nothing matches."
+        ),
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "q": {
+                    "type": "string",
+                    "description": "Product type, ingredient, brand or store keywords",
+                },
+                "max_price": {
+                    "type": "number",
+                    "description": "Optional upper price limit",
+                },
+                "min_rating": {
+                    "type": "number",
+                    "description": "Optional minimum star rating (0-5)",
+                },
+            },
+            "required": ["q"],
+            "additionalProperties": False,
+        },
+    },
+}
+SHOPPING_TOOLS = [LOCAL_CATALOG_TOOL, SERPER_TOOL]
+
+
+def _read_stream(response: requests.Response, on_delta: Callable[[str], None]) -> dict:
+    """Assemble a streamed chat completion, forwarding content as it arrives.
+
+    Returns the same shape as a non-streamed response body, with tool call
+    fragments joined by index.
+    """
+    content: list[str] = []
+    tool_calls: dict[int, dict] = {}
+    usage = None
+    for line in response.iter_lines(decode_unicode=True):
+        if not line or not line.startswith("data: "):
+            continue
+        data = line[len("data: ") :]
+        if data == "[DONE]":
+            break
+        chunk = loads(data)
+        usage = chunk.get("usage") or usage
+        if not chunk.get("choices"):
+            continue
+        delta = chunk["choices"][0].get("delta", {})
+        if delta.get("content"):
+            content.append(delta["content"])
+            on_delta(delta["content"])
+        for fragment in delta.get("tool_calls") or []:
+            call = tool_calls.setdefault(
+                fragment["index"],
+                {
+                    "id": "",
+                    "type": "function",
+                    "function": {"name": "", "arguments": ""},
+                },
+            )
+            call["id"] = fragment.get("id") or call["id"]
+            function = fragment.get("function") or {}
+            call["function"]["name"] += function.get("name") or ""
+            call["function"]["arguments"] += function.get("arguments") or ""
+
+    message = {"content": "".join(content)}
+    if tool_calls:
+        message["tool_calls"] = [tool_calls[i] for i in sorted(tool_calls)]
+    return {"choices": [{"message": message}], "usage": usage}
+
+
 def _make_openai_request(
     messages: list[dict],
     model: str = DEFAULT_MODEL,
     tools: list[dict] | None = None,
     max_turns: int = 6,
     country: str = "us",
+    on_delta: Callable[[str], None] | None = None,
+    on_tool: Callable[[str, dict, str], None] | None = None,
 ) -> str:
-    """Make a request to OpenAI API with tool support."""
+    """Make a request to OpenAI API with tool support.
+
+    With ``on_delta`` the completion is streamed and each content fragment is
+    passed to it as it arrives; the full reply is still returned. ``on_tool``
+    is called with the name, arguments and result of every tool call.
+    """
     api_key = _get_openai_key()
 
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json",
-    }
+    headers = {"Content-Type": "application/json"}
+    # Replay mode runs without keys; send no placeholder credential.
+    if api_key:
+        headers["Authorization"] = f"Bearer {api_key}"
 
     for turn in range(max_turns):
         payload: dict[str, Any] = {
@@ -103,20 +268,33 @@ def _make_openai_request(
         if tools:
             payload["tools"] = tools
             payload["tool_choice"] = "auto"
-
-        response = requests.post(
-            OPENAI_API_URL,
-            headers=headers,
-            json=payload,
-            timeout=120,
-        )
-
-        if response.status_code != 200:
-            raise RuntimeError(
-                f"OpenAI API error: {response.status_code} - {response.text}"
+        if on_delta:
+            payload["stream"] = True
+            payload["stream_options"] = {"include_usage": True}
+
+        started = time.perf_counter()
+        with admit("openai"):
+            response = cassettes.post(
+                "openai",
+                OPENAI_API_URL,
+                headers=headers,
+                json=payload,
+                timeout=120,
+                stream=bool(on_delta),
             )
 
-        result = response.json()
+            if response.status_code != 200:
+                raise RuntimeError(
+                    f"OpenAI API error: {response.status_code} - {response.text}"
+                )
+
+            result = _read_stream(response, on_delta) if on_delta else response.json()
+        record_usage(
+            model,
+            result.get("usage"),
+            seconds=time.perf_counter() - started,
+            images=count_images(messages),
+        )
         choice = result["choices"][0]
         message = choice["message"]
 
@@ -136,7 +314,7 @@ def _make_openai_request(
             for tool_call in tool_calls:
                 func = tool_call.get("function", {})
                 func_name = func.get("name", "")
-                func_args = json.loads(func.get("arguments", "{}"))
+                func_args = loads(func.get("arguments") or "{}")
 
                 if func_name == "serper":
                     try:
@@ -145,8 +323,15 @@ def _make_openai_request(
                         )
                     except Exception as e:
                         tool_result = f"Tool error: {str(e)}"
+                elif func_name == "local_catalog":
+                    try:
+                        tool_result = _local_catalog_search(func_args, country)
+                    except Exception as e:
+                        tool_result = f"Tool error: {str(e)}"
                 else:
                     tool_result = f'Tool "{func_name}" is not available.'
+                if on_tool:
+                    on_tool(func_name, func_args, tool_result)
 
                 messages.append(
                     {
@@ -166,22 +351,39 @@ def _make_openai_request(
 
 
 def run_chat_turn(
-    photo_data_urls: list[str],
+    photo_data_urls: list["str | StoredPhoto"],
     history: list[dict],
     country: str = "us",
     memory: dict = None,
+    model: str | None = None,
+    on_delta: Callable[[str], None] | None = None,
+    on_tool: Callable[[str, dict, str], None] | None = None,
 ) -> str:
     """
     Run a single chat turn with the cosmetist agent.
 
     Args:
-        photo_data_urls: List of base64 image data URLs
+        photo_data_urls: Base64 image data URLs or stored photos (encoded lazily)
         history: Conversation history as list of {role, content} dicts
         country: Country code for shopping searches
+        model: OpenAI model to use; the workflow picks one per task. Without
+            one this is a chat turn and follows the user's usage budget.
+        on_delta: Called with each reply fragment when streaming
+        on_tool: Called with (name, arguments, result) for each tool call
 
     Returns:
         The assistant's response
     """
+    tools = SHOPPING_TOOLS
+    task = None
+    if model is None:
+        task = "chat"
+        state = usage_ledger.budget_state()
+        model = DEFAULT_MODEL if state == "ok" else MODEL_TIERS["openai"]["small"]
+        if state == "exhausted":
+            # Images and live searches are the expensive parts of a turn.
+            photo_data_urls, tools = [], [LOCAL_CATALOG_TOOL]
+
     messages: list[dict] = [{"role": "system", "content": COSMETIST_SYSTEM_PROMPT}]
 
     # Format memory context if available
@@ -204,8 +406,8 @@ def run_chat_turn(
                 "content": [
                     {"type": "text", "text": f"{text}{memory_context}"},
                     *[
-                        {"type": "image_url", "image_url": {"url": url}}
-                        for url in photo_data_urls
+                        {"type": "image_url", "image_url": {"url": photo_url(photo)}}
+                        for photo in photo_data_urls
                     ],
                 ],
             }
@@ -223,20 +425,92 @@ def run_chat_turn(
     for turn in history:
         messages.append({"role": turn["role"], "content": turn["content"]})
 
-    return _make_openai_request(
-        messages=messages,
-        tools=[SERPER_TOOL],
-        country=country,
+    with usage_scope(task=task):
+        return _make_openai_request(
+            messages=messages,
+            model=model,
+            tools=tools,
+            country=country,
+            on_delta=on_delta,
+            on_tool=on_tool,
+        )
+
+
+def has_text(reply: str) -> bool:
+    return bool(reply and reply.strip())
+
+
+def is_verification(reply: str) -> bool:
+    return "success" in (parse_json_object(reply) or {})
+
+
+def has_ratings(reply: str) -> bool:
+    return parse_ratings(reply) is not None
+
+
+def has_products(reply: str) -> bool:
+    return bool(parse_products(reply))
+
+
+def recommend_products(ratings: dict[str, int], country: str = "us") -> str:
+    """Shopping reply for a skin profile alone, used to fill recommendation buckets."""
+    profile = ", ".join(f"{key} {value}/5" for key, value in ratings.items())
+    messages = [
+        {"role": "system", "content": COSMETIST_SYSTEM_PROMPT},
+        {
+            "role": "user",
+            "content": (
+                f"My skin ratings (1-5, 5 is healthiest) are: {profile}. Fetch current "
+                "shopping options with links and thumbnails for an AM/PM plan suited "
+                "to this profile. Use tools if needed. " + SHOPPING_FORMAT
+            ),
+        },
+    ]
+    return route(
+        "shopping",
+        lambda model: _make_openai_request(
+            messages=list(messages), model=model, tools=SHOPPING_TOOLS, country=country
+        ),
+        validate=has_products,
     )
 
 
+def _detect_faces_locally(images: list[bytes]) -> list[dict] | None:
+    """Classify face views with the on-CPU detector; None means use the LLM step."""
+    try:
+        return detect_poses_in_pool(images)
+    except FaceVerificationUnavailable as exc:
+        logger.info("Local face verification unavailable: %s", exc)
+    except Exception as exc:
+        logger.warning("Local face verification failed: %s", exc)
+    return None
+
+
+def _rate_locally(
+    images: list[bytes],
+    detections: list[dict] | None,
+) -> dict[str, int] | None:
+    """Pixel-metric ratings cropped to detected faces; None means ask the LLM."""
+    boxes = [d["box"] for d in detections] if detections else None
+    try:
+        return compute_ratings(images, boxes)
+    except Exception as exc:
+        logger.warning("Local skin metrics failed: %s", exc)
+    return None
+
+
 def run_initial_workflow(
-    photo_data_urls: list[str],
+    photo_data_urls: list["str | StoredPhoto"],
     country: str = "us",
+    on_stage: Callable[[str, str | None], None] | None = None,
 ) -> dict[str, Any]:
     """
     Run the initial skincare analysis workflow.
 
+    Args:
+        on_stage: Called with (stage, result) as each of verification,
+            analysis, ratings and shopping completes
+
     Returns:
         Dict with keys: verification, analysis, ratings, shopping, history
     """
@@ -252,21 +526,44 @@ def run_initial_workflow(
         "history": [],
     }
 
-    def prompt_and_respond(content: str) -> str:
+    def prompt_and_respond(
+        content: str,
+        task: str,
+        validate: Callable[[str], bool] | None = None,
+    ) -> str:
         history.append({"role": "user", "content": content})
-        reply = run_chat_turn(photo_data_urls, history, country)
+        reply = route(
+            task,
+            lambda model: run_chat_turn(photo_data_urls, history, country, model=model),
+            validate=validate,
+        )
         history.append({"role": "assistant", "content": reply})
         return reply
 
+    def complete_stage(stage: str, value: str | None) -> None:
+        results[stage] = value
+        if on_stage:
+            on_stage(stage, value)
+
     # Step 1: Verify images
-    verification_prompt = (
-        "Here are 3 images of human face. requires images to be front face, left side face, "
-        "and right side face. If you find that the required images are not present, give negative "
-        "response and ask tell the user what they are missing in simple and less words. "
-        "give response in json like {success: false/true, message: '...'}"
-    )
-    verification_reply = prompt_and_respond(verification_prompt)
-    results["verification"] = verification_reply
+    try:
+        images = [photo_bytes(photo) for photo in photo_data_urls]
+    except ValueError:
+        images = []
+    detections = _detect_faces_locally(images) if images else None
+    if detections is not None:
+        verification_reply = json.dumps(summarize_views(detections))
+    else:
+        verification_prompt = (
+            "Here are 3 images of human face. requires images to be front face, left side face, "
+            "and right side face. If you find that the required images are not present, give negative "
+            "response and ask tell the user what they are missing in simple and less words. "
+            "give response in json like {success: false/true, message: '...'}"
+        )
+        verification_reply = prompt_and_respond(
+            verification_prompt, "verification", is_verification
+        )
+    complete_stage("verification", verification_reply)
 
     try:
         verification_json = json.loads(verification_reply)
@@ -276,32 +573,55 @@ def run_initial_workflow(
     except json.JSONDecodeError:
         pass  # Continue anyway if parsing fails
 
+    local_ratings = _rate_locally(images, detections) if images else None
+
     # Step 2: Analyze skin
     analysis_prompt = (
         "Please analyze my bare-face photo. List bullet-point concerns (acne, pigmentation, "
         "redness, wrinkles, etc.) and rate Hydration, Oil Balance, Tone, Barrier Strength, "
         "and Sensitivity on a 1–5 scale. Keep it concise."
     )
-    results["analysis"] = prompt_and_respond(analysis_prompt)
+    if local_ratings:
+        analysis_prompt += (
+            " Pixel measurements from the scan rated them (1-5): "
+            f"{json.dumps(local_ratings)}. Use these ratings unless the photos "
+            "clearly contradict them."
+        )
+    complete_stage(
+        "analysis", prompt_and_respond(analysis_prompt, "analysis", has_text)
+    )
 
     # Step 3: Get ratings JSON
-    ratings_prompt = (
-        "From that analysis, output a JSON object with keys hydration, oilBalance, tone, "
-        "barrierStrength, sensitivity (numbers 1-5). No prose."
-    )
-    results["ratings"] = prompt_and_respond(ratings_prompt)
+    if local_ratings:
+        complete_stage("ratings", json.dumps(local_ratings))
+    else:
+        ratings_prompt = (
+            "From that analysis, output a JSON object with keys hydration, oilBalance, tone, "
+            "barrierStrength, sensitivity (numbers 1-5). No prose."
+        )
+        complete_stage(
+            "ratings", prompt_and_respond(ratings_prompt, "ratings", has_ratings)
+        )
 
     # Step 4: Get shopping recommendations
     shopping_prompt = (
         "Using that assessment, fetch current shopping options with links and thumbnails "
         "for the AM/PM plan. Use tools if needed and return markdown with inline product cards. "
-        'Format the response in this format: ```json\n{\n  "products": [\n    {\n      '
-        '"title": "Example Product Title",\n      "source": "ExampleSource.com",\n      '
-        '"link": "https://example.com/product-page",\n      "price": "$0.00",\n      '
-        '"imageUrl": "https://example.com/product-image.jpg",\n      "rating": 0,\n      '
-        '"ratingCount": 0,\n      "productId": "123456789",\n      "position": 1\n    }\n  ]\n}\n```'
+        + SHOPPING_FORMAT
     )
-    results["shopping"] = prompt_and_respond(shopping_prompt)
+    profile = parse_ratings(results["ratings"])
+    cached_shopping = recommendations.get(profile, country) if profile else None
+    if cached_shopping:
+        # Same quantized profile and country: reuse the bucket's product cards
+        # and keep the history shaped as if the step had run.
+        history.append({"role": "user", "content": shopping_prompt})
+        history.append({"role": "assistant", "content": cached_shopping})
+        complete_stage("shopping", cached_shopping)
+    else:
+        shopping = prompt_and_respond(shopping_prompt, "shopping", has_products)
+        if profile:
+            recommendations.put(profile, country, shopping)
+        complete_stage("shopping", shopping)
 
     results["history"] = history
     return results
@@ -1,18 +1,26 @@
 import json
-import os
+import logging
 import re
+import time
 from datetime import datetime, timezone
 from typing import Dict, List
 
-import requests
-from dotenv import load_dotenv
+from agents.routing import record_usage, route
+from services.admission import admit
+from services.search import DEFAULT_SCORING, multi_query_search, search_memories
+from utils.cassettes import cassettes
+from utils.env import get_env
+from utils.ranking import MemoryScoring
 
-from services.search import search_memories
+logger = logging.getLogger(__name__)
 
-load_dotenv()
-
-MODEL_NAME = os.getenv("OPENROUTER_MODEL", "openai/gpt-oss-20b:free")
+MODEL_NAME = get_env("OPENROUTER_MODEL", "openai/gpt-oss-20b:free")
 OPENROUTER_API_URL = "https://openrouter.ai/api/v1/chat/completions"
+# Fan-out retrieval: probe queries generated per question (besides the
+# question itself) and chunks shown to the answer call.
+MEMORY_FAN_OUT = get_env("MEMORY_FAN_OUT", "false").lower() == "true"
+FAN_OUT_QUERIES = int(get_env("MEMORY_FAN_OUT_QUERIES", "4"))
+FAN_OUT_CONTEXT_K = 8
 
 
 class Tools:
@@ -37,6 +45,7 @@ class RAGTool(Tools):
         uid: str,
         timestamp: datetime,
         default_k: int = 5,
+        scoring: MemoryScoring | None = DEFAULT_SCORING,
     ) -> None:
         super().__init__(
             name="RAGTool",
@@ -46,16 +55,19 @@ class RAGTool(Tools):
         self.uid = uid
         self.timestamp = timestamp
         self.default_k = default_k
+        self.scoring = scoring
 
     def __call__(self, query: str, k: int = 5) -> list[dict]:
         """Retrieve information from the vector index."""
         top_k = k or self.default_k
-        return retrieve_top_k_chunks(query, self.uid, self.timestamp, k=top_k)
+        return retrieve_top_k_chunks(
+            query, self.uid, self.timestamp, k=top_k, scoring=self.scoring
+        )
 
 
-def _get_api_key() -> str:
-    api_key = os.getenv("OPENROUTER_API_KEY")
-    if not api_key:
+def _get_api_key() -> str | None:
+    api_key = get_env("OPENROUTER_API_KEY")
+    if not api_key and cassettes.live:
         raise RuntimeError("OPENROUTER_API_KEY is not set in the environment")
     return api_key
 
@@ -87,10 +99,12 @@ def _make_openrouter_request(
     target_model = model_name or MODEL_NAME
 
     headers = {
-        "Authorization": f"Bearer {api_key}",
         "Content-Type": "application/json",
         "HTTP-Referer": "https://github.com/llm-memory",  # Optional, for OpenRouter rankings
     }
+    # Replay mode runs without keys; send no placeholder credential.
+    if api_key:
+        headers["Authorization"] = f"Bearer {api_key}"
 
     # For free models, we need to allow data sharing
     # You can also set this globally at https://openrouter.ai/settings/privacy
@@ -107,12 +121,15 @@ def _make_openrouter_request(
     if enable_reasoning and _is_reasoning_model(target_model):
         payload["reasoning"] = {"enabled": True}
 
-    response = requests.post(
-        OPENROUTER_API_URL,
-        headers=headers,
-        json=payload,
-        timeout=300,  # Longer timeout for reasoning models
-    )
+    started = time.perf_counter()
+    with admit("openrouter"):
+        response = cassettes.post(
+            "openrouter",
+            OPENROUTER_API_URL,
+            headers=headers,
+            json=payload,
+            timeout=300,  # Longer timeout for reasoning models
+        )
 
     if response.status_code != 200:
         raise RuntimeError(
@@ -120,6 +137,9 @@ def _make_openrouter_request(
         )
 
     result = response.json()
+    record_usage(
+        target_model, result.get("usage"), seconds=time.perf_counter() - started
+    )
 
     # Extract response content
     message = result["choices"][0]["message"]
@@ -136,11 +156,7 @@ def _make_openrouter_request(
         elif isinstance(reasoning_details, str):
             reasoning_text = reasoning_details
 
-        print(
-            f"[Reasoning]: {reasoning_text[:500]}..."
-            if len(reasoning_text) > 500
-            else f"[Reasoning]: {reasoning_text}"
-        )
+        logger.debug("Reasoning: %.500s", reasoning_text)
 
         # If content is empty, try to extract JSON from reasoning
         if not content and reasoning_text:
@@ -224,16 +240,25 @@ def parse_agent_response(response: str) -> dict:
     return {"found": False, "answer": "", "error": "Could not parse response"}
 
 
+def is_search_reply(response: str) -> bool:
+    """A search-agent reply is a RAGTool call or a found/not-found answer."""
+    parsed = parse_agent_response(response)
+    return "error" not in parsed and ("found" in parsed or "tool" in parsed)
+
+
 def retrieve_top_k_chunks(
     query: str,
     uid: str,
     timestamp: datetime,
     *,
     k: int = 5,
+    scoring: MemoryScoring | None = DEFAULT_SCORING,
 ) -> List[dict]:
     """Retrieve top-k chunks using the shared search service."""
 
-    results = search_memories(query, uid, timestamp, top_k=k)
+    results = search_memories(
+        query, uid, timestamp, top_k=k, mode="hybrid", scoring=scoring
+    )
 
     chunks: List[dict] = []
     for i, result in enumerate(results, start=1):
@@ -257,14 +282,82 @@ def query_generate_agent(question: str) -> str:
         {"role": "user", "content": f"Given Question: {question}"},
     ]
 
-    response = generate_chat_completion(
-        messages=messages,
-        system_instruction=system_prompt,
+    response = route(
+        "memory_search",
+        lambda model: generate_chat_completion(
+            messages=messages,
+            system_instruction=system_prompt,
+            model_name=model,
+        ),
+        validate=lambda reply: bool(parse_agent_response(reply).get("query")),
     )
     parsed_response = parse_agent_response(response)
     return parsed_response.get("query", "")
 
 
+def fan_out_query_agent(question: str, count: int = FAN_OUT_QUERIES) -> list[str]:
+    """Several distinct retrieval queries for ``question`` from one LLM call."""
+    system_prompt = (
+        "You are a memory search agent. All conversation history lives in a vector DB. "
+        f"Write up to {count} short, distinct retrieval queries that together cover "
+        "what is needed to answer the user: the products, brands, dates, skin "
+        "concerns and routine steps the question depends on, phrased the way "
+        'they would appear in past chats. Respond with JSON only: {"queries": [...]}.'
+    )
+    messages = [
+        {"role": "user", "content": f"Given Question: {question}"},
+    ]
+
+    def has_queries(reply: str) -> bool:
+        queries = parse_agent_response(reply).get("queries")
+        return isinstance(queries, list) and any(
+            isinstance(q, str) and q.strip() for q in queries
+        )
+
+    response = route(
+        "memory_search",
+        lambda model: generate_chat_completion(
+            messages=messages,
+            system_instruction=system_prompt,
+            model_name=model,
+        ),
+        validate=has_queries,
+    )
+    queries = parse_agent_response(response).get("queries")
+    if not isinstance(queries, list):
+        return []
+    return [q.strip() for q in queries if isinstance(q, str) and q.strip()][:count]
+
+
+def retrieve_fan_out(
+    question: str,
+    uid: str,
+    timestamp: datetime,
+    *,
+    k: int = FAN_OUT_CONTEXT_K,
+    scoring: MemoryScoring | None = DEFAULT_SCORING,
+) -> List[dict]:
+    """One query-generation call, then a batched multi-query retrieval."""
+    try:
+        queries = fan_out_query_agent(question)
+    except Exception as exc:
+        logger.warning("Fan-out query generation failed: %s", exc)
+        queries = []
+
+    results = multi_query_search(
+        [question, *queries], uid, timestamp, top_k=k, scoring=scoring
+    )
+    return [{**result, "rank": i} for i, result in enumerate(results, start=1)]
+
+
+def _merge_chunks(*chunk_lists: List[dict]) -> List[dict]:
+    merged: dict[str, dict] = {}
+    for chunks in chunk_lists:
+        for chunk in chunks or []:
+            merged.setdefault(chunk.get("id") or chunk.get("content", ""), chunk)
+    return [{**c, "rank": i} for i, c in enumerate(merged.values(), start=1)]
+
+
 def remember_agent(question: str) -> str:
     system_prompt = (
         "You are a memory remember agent, you are responsible for saving the particular details for the conversation in the vector db",
@@ -278,9 +371,16 @@ def remember_agent(question: str) -> str:
     messages = [
         {"role": "user", "content": f"Given Question: {question}"},
     ]
-    response = generate_chat_completion(
-        messages=messages,
-        system_instruction=system_prompt,
+    response = route(
+        "remember",
+        lambda model: generate_chat_completion(
+            messages=messages,
+            system_instruction=system_prompt,
+            model_name=model,
+        ),
+        validate=lambda reply: isinstance(
+            parse_agent_response(reply).get("remember"), bool
+        ),
     )
     parsed_response = parse_agent_response(response)
     return parsed_response.get("remember", "")
@@ -292,9 +392,17 @@ def search_agent(
     uid: str,
     timestamp: datetime | None = None,
     chunks: List[dict] | None = None,
+    scoring: MemoryScoring | None = DEFAULT_SCORING,
+    fan_out: bool = MEMORY_FAN_OUT,
 ) -> dict:
+    """Answer ``question`` from the user's memories.
+
+    With ``fan_out`` the first retrieval covers several generated queries at
+    once, and a follow-up RAGTool request gets exactly one more retrieval
+    and answer call instead of an open-ended loop.
+    """
     timestamp = timestamp or datetime.now(timezone.utc)
-    rag_tool = RAGTool(uid=uid, timestamp=timestamp)
+    rag_tool = RAGTool(uid=uid, timestamp=timestamp, scoring=scoring)
 
     system_prompt = """You are a search agent. Your task is to find answers in conversation history using RAGTool.
 
@@ -320,12 +428,25 @@ Rules:
 - Extract specific answers, not summaries
 - Do not wrap JSON in markdown code blocks"""
 
+    # Prefetch with hybrid retrieval so the first LLM call already has context
+    # instead of spending a round-trip just to ask for a RAGTool search.
+    context_k = FAN_OUT_CONTEXT_K if fan_out else 5
+    if chunks is None:
+        try:
+            if fan_out:
+                chunks = retrieve_fan_out(question, uid, timestamp, scoring=scoring)
+            else:
+                chunks = rag_tool(question, rag_tool.default_k)
+        except Exception as exc:
+            logger.warning("Memory prefetch failed: %s", exc)
+            chunks = []
+
     # Format context clearly
     if chunks:
         context_str = "\n".join(
             [
                 f"[Chunk {c.get('rank', i + 1)}]: {c.get('text', c.get('content', str(c)))}"
-                for i, c in enumerate((chunks or [])[:5])
+                for i, c in enumerate((chunks or [])[:context_k])
             ]
         )
     else:
@@ -341,35 +462,37 @@ Respond with JSON only:"""
     messages = [
         {"role": "user", "content": user_content},
     ]
-    print("calling OpenRouter request")
-
-    response = generate_chat_completion(
-        messages=messages,
-        system_instruction=system_prompt,
+    response = route(
+        "memory_search",
+        lambda model: generate_chat_completion(
+            messages=messages,
+            system_instruction=system_prompt,
+            model_name=model,
+        ),
+        validate=is_search_reply,
     )
 
-    print("response: ", response)
-
     parsed_response = parse_agent_response(response)
-    print("parsed_response: ", parsed_response)
+    logger.debug("Memory search reply: %s", parsed_response)
 
     if parsed_response.get("tool") == "RAGTool":
         args = parsed_response.get("args")
-        print("args: ", args)
         if args:
-            print("calling RAGTool")
             desired_k = args.get("k") or 5
             chunk = rag_tool(args["query"], desired_k)
-            print("chunk: ", chunk)
+            logger.debug("RAGTool(%s) returned %d memories", args, len(chunk))
+            if fan_out:
+                # Second and last hop: answer from the widened context.
+                answer = search_agent(
+                    question,
+                    uid=uid,
+                    timestamp=timestamp,
+                    chunks=_merge_chunks(chunk, chunks),
+                    scoring=scoring,
+                    fan_out=False,
+                )
+                return answer or {"found": False, "answer": ""}
             return None
-
-            # return search_agent(
-            #     question,
-            #     uid=uid,
-            #     timestamp=timestamp,
-            #     chunks=chunk,
-            # )
-        else:
-            print("no args found")
+        logger.debug("RAGTool call without arguments")
 
     return parsed_response
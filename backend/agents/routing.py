@@ -0,0 +1,223 @@
+"""Per-task model routing with validation-driven escalation.
+
+Each agent task starts on the cheapest tier expected to handle it. The
+reply is only re-asked on the next tier when it fails the task's
+validator, or when the call itself errors. Latency, token cost and
+escalations are recorded per task.
+"""
+
+import contextvars
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable
+
+from services.accounting import usage_ledger, usage_scope
+from services.admission import Overloaded
+from utils.env import get_env
+
+logger = logging.getLogger(__name__)
+
+# Tier -> model per provider. Override with e.g. OPENAI_SMALL_MODEL.
+MODEL_TIERS = {
+    "openai": {
+        "small": get_env("OPENAI_SMALL_MODEL", "gpt-4.1-nano"),
+        "medium": get_env("OPENAI_MEDIUM_MODEL", "gpt-4o-mini"),
+        "large": get_env("OPENAI_LARGE_MODEL", "gpt-4o"),
+    },
+    "openrouter": {
+        "small": get_env("OPENROUTER_MODEL", "openai/gpt-oss-20b:free"),
+        "large": get_env("OPENROUTER_LARGE_MODEL", "openai/gpt-oss-120b"),
+    },
+}
+# Approximate USD per million (prompt, completion) tokens, for cost targets.
+MODEL_PRICES = {
+    "gpt-4.1-nano": (0.10, 0.40),
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+    "openai/gpt-oss-120b": (0.10, 0.50),
+}
+# Cached prompt tokens are billed at this fraction of the prompt price.
+CACHED_PROMPT_PRICE = 0.5
+
+
+@dataclass(frozen=True)
+class TaskRoute:
+    provider: str
+    tiers: tuple[str, ...]
+    latency_target: float
+    cost_target: float
+
+
+ROUTES = {
+    "verification": TaskRoute("openai", ("medium", "large"), 6.0, 0.002),
+    "analysis": TaskRoute("openai", ("medium", "large"), 15.0, 0.005),
+    "ratings": TaskRoute("openai", ("small", "medium"), 4.0, 0.001),
+    "shopping": TaskRoute("openai", ("medium", "large"), 25.0, 0.01),
+    "memory_search": TaskRoute("openrouter", ("small", "large"), 5.0, 0.001),
+    "remember": TaskRoute("openrouter", ("small", "large"), 3.0, 0.0005),
+}
+
+Validator = Callable[[str], bool]
+
+_usage: contextvars.ContextVar[dict[str, float] | None] = contextvars.ContextVar(
+    "routing_usage", default=None
+)
+
+
+def record_usage(
+    model: str,
+    usage: dict[str, Any] | None,
+    *,
+    seconds: float = 0.0,
+    images: int = 0,
+) -> None:
+    """Called by provider clients with the response ``usage`` block.
+
+    Feeds the per-task routing totals and the per-user usage ledger.
+    """
+    usage = usage or {}
+    prompt = usage.get("prompt_tokens", 0) or 0
+    completion = usage.get("completion_tokens", 0) or 0
+    cached = (usage.get("prompt_tokens_details") or {}).get("cached_tokens", 0) or 0
+    prompt_price, completion_price = MODEL_PRICES.get(model, (0.0, 0.0))
+    billed_prompt = prompt - cached * (1 - CACHED_PROMPT_PRICE)
+    cost = (billed_prompt * prompt_price + completion * completion_price) / 1e6
+    usage_ledger.record_completion(usage, cost=cost, seconds=seconds, images=images)
+
+    totals = _usage.get()
+    if totals is None:
+        return
+    totals["prompt_tokens"] += prompt
+    totals["completion_tokens"] += completion
+    totals["cost"] += cost
+
+
+class RoutingStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tasks: dict[str, dict[str, Any]] = {}
+
+    def record(
+        self,
+        task: str,
+        *,
+        model: str,
+        seconds: float,
+        usage: dict[str, float],
+        valid: bool,
+        escalated: bool,
+        failed: bool = False,
+    ) -> None:
+        route = ROUTES[task]
+        with self._lock:
+            stats = self._tasks.setdefault(
+                task,
+                {
+                    "calls": 0,
+                    "escalations": 0,
+                    "invalid": 0,
+                    "errors": 0,
+                    "seconds": 0.0,
+                    "max_seconds": 0.0,
+                    "over_latency_target": 0,
+                    "prompt_tokens": 0,
+                    "completion_tokens": 0,
+                    "cost": 0.0,
+                    "over_cost_target": 0,
+                    "models": {},
+                },
+            )
+            stats["calls"] += 1
+            stats["escalations"] += escalated
+            stats["invalid"] += not valid and not failed
+            stats["errors"] += failed
+            stats["seconds"] += seconds
+            stats["max_seconds"] = max(stats["max_seconds"], seconds)
+            stats["over_latency_target"] += seconds > route.latency_target
+            stats["prompt_tokens"] += usage["prompt_tokens"]
+            stats["completion_tokens"] += usage["completion_tokens"]
+            stats["cost"] += usage["cost"]
+            stats["over_cost_target"] += usage["cost"] > route.cost_target
+            stats["models"][model] = stats["models"].get(model, 0) + 1
+
+    def snapshot(self) -> dict[str, dict[str, Any]]:
+        with self._lock:
+            return {
+                task: {
+                    **stats,
+                    "models": dict(stats["models"]),
+                    "mean_seconds": stats["seconds"] / stats["calls"],
+                }
+                for task, stats in self._tasks.items()
+            }
+
+
+routing_stats = RoutingStats()
+
+
+def model_for(task: str, tier: int = 0) -> str:
+    route = ROUTES[task]
+    return MODEL_TIERS[route.provider][route.tiers[tier]]
+
+
+def route(
+    task: str,
+    call: Callable[[str], str],
+    validate: Validator | None = None,
+) -> str:
+    """Run ``call(model)`` on the task's first tier, escalating on failure.
+
+    If every tier's reply fails validation, the last reply is returned so
+    callers keep their existing fallback handling. Errors on the last tier
+    and admission ``Overloaded`` errors are raised. Callers over their usage
+    budget stay on the first tier.
+    """
+    tiers = ROUTES[task].tiers
+    if usage_ledger.budget_state() != "ok":
+        tiers = tiers[:1]
+    reply = ""
+    for tier in range(len(tiers)):
+        model = model_for(task, tier)
+        last = tier == len(tiers) - 1
+        usage = {"prompt_tokens": 0, "completion_tokens": 0, "cost": 0.0}
+        token = _usage.set(usage)
+        started = time.perf_counter()
+        try:
+            with usage_scope(task=task):
+                reply = call(model)
+        except Overloaded:
+            # A bigger model on the same provider would queue just the same.
+            raise
+        except Exception as exc:
+            routing_stats.record(
+                task,
+                model=model,
+                seconds=time.perf_counter() - started,
+                usage=usage,
+                valid=False,
+                escalated=tier > 0,
+                failed=True,
+            )
+            if last:
+                raise
+            logger.warning("%s on %s failed (%s); escalating", task, model, exc)
+            continue
+        finally:
+            _usage.reset(token)
+
+        valid = validate is None or validate(reply)
+        routing_stats.record(
+            task,
+            model=model,
+            seconds=time.perf_counter() - started,
+            usage=usage,
+            valid=valid,
+            escalated=tier > 0,
+        )
+        if valid:
+            return reply
+        if not last:
+            logger.info("%s reply from %s failed validation; escalating", task, model)
+    return reply
@@ -1,22 +1,47 @@
 from contextlib import asynccontextmanager
 
+from services.startup import initialize_providers
+
 import fastapi
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 
-from database.firebase import init_firebase
 from routers.auth import auth_router
+from routers.health import health_router
 from routers.search import search_router
 from routers.chat import chat_router
+from routers.usage import usage_router
+from services.accounting import usage_ledger
+from services.admission import Overloaded
+from services.catalog import product_catalog
+from services.consolidation import consolidation_scheduler
+from services.photo_store import photo_sweeper
+from services.recommendations import recommendation_refresher
+from services.semantic_cache import semantic_cache
+from utils.compression import CompressionMiddleware
 
 
 @asynccontextmanager
 async def lifespan(app: fastapi.FastAPI):
-    init_firebase()
+    await initialize_providers()
+    consolidation_scheduler.start()
+    recommendation_refresher.start()
+    product_catalog.start()
+    semantic_cache.start()
+    photo_sweeper.start()
+    await usage_ledger.start()
     yield
+    await usage_ledger.stop()
+    await photo_sweeper.stop()
+    await semantic_cache.stop()
+    await product_catalog.stop()
+    await recommendation_refresher.stop()
+    await consolidation_scheduler.stop()
 
 
 app = fastapi.FastAPI(lifespan=lifespan)
 
+app.add_middleware(CompressionMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["http://localhost:5173"],
@@ -25,9 +50,21 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+
+@app.exception_handler(Overloaded)
+async def overloaded_handler(request: fastapi.Request, exc: Overloaded):
+    return JSONResponse(
+        {"detail": str(exc)},
+        status_code=503,
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+
 app.include_router(auth_router)
+app.include_router(health_router)
 app.include_router(search_router)
 app.include_router(chat_router)
+app.include_router(usage_router)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,276 @@
+# Recall vs. latency vs. build time sweep over HNSW parameters
+#
+# Ground truth is exact top-k computed locally with NumPy. Each (m,
+# efConstruction) pair is built once and queried at every efSearch value.
+# The default backend is hnswlib (pip install hnswlib), a local stand-in with
+# the same parameters as Azure's HNSW. --backend azure builds throwaway
+# indexes in the configured search service and deletes them afterwards;
+# those latencies include the network round trip. Azure only accepts m 4-10
+# and efConstruction/efSearch 100-1000; values outside a backend's range are
+# dropped from the sweep with a note, and a combination that fails to build
+# or query is reported and skipped.
+
+import importlib.util
+import itertools
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from utils.vectors import as_vector_matrix, normalize_rows, to_json_vector  # noqa: E402
+
+
+def _load_sibling(filename: str, name: str):
+    spec = importlib.util.spec_from_file_location(
+        name, Path(__file__).with_name(filename)
+    )
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+quantization = _load_sibling("benchmark-quantization.py", "benchmark_quantization")
+synthetic_corpus = quantization.synthetic_corpus
+sample_queries = quantization.sample_queries
+exact_top_k = quantization.exact_top_k
+recall_at_k = quantization.recall_at_k
+
+
+class HnswlibBackend:
+    """In-process HNSW graph; measures the algorithm without network noise."""
+
+    LIMITS = {"m": (2, 100), "ef_construction": (1, 10_000), "ef_search": (1, 10_000)}
+
+    def __init__(self, threads: int = -1):
+        try:
+            import hnswlib
+        except ImportError as exc:
+            raise SystemExit(
+                "The local backend needs hnswlib: pip install hnswlib"
+            ) from exc
+        self._hnswlib = hnswlib
+        self.threads = threads
+        self._index = None
+
+    def build(self, corpus: np.ndarray, *, m: int, ef_construction: int) -> None:
+        index = self._hnswlib.Index(space="ip", dim=corpus.shape[1])
+        index.init_index(
+            max_elements=corpus.shape[0], M=m, ef_construction=ef_construction
+        )
+        index.add_items(corpus, np.arange(corpus.shape[0]), num_threads=self.threads)
+        self._index = index
+
+    def search(self, query: np.ndarray, k: int, *, ef_search: int) -> np.ndarray:
+        self._index.set_ef(max(ef_search, k))
+        labels, _ = self._index.knn_query(query[np.newaxis, :], k=k, num_threads=1)
+        return labels[0]
+
+    def close(self) -> None:
+        self._index = None
+
+
+class AzureBackend:
+    """Temporary Azure AI Search index per (m, efConstruction) pair."""
+
+    UPLOAD_BATCH = 1000
+    LIMITS = {"m": (4, 10), "ef_construction": (100, 1000), "ef_search": (100, 1000)}
+
+    def __init__(self, prefix: str = "glowly-hnsw-bench"):
+        self.schema = _load_sibling(
+            "build-azure-vector-db-schema.py", "build_azure_vector_db_schema"
+        )
+        self.prefix = prefix
+        self.index_client = self.schema.get_index_client()
+        self._index = None
+        self._search = None
+        self._ef_search = None
+
+    def build(self, corpus: np.ndarray, *, m: int, ef_construction: int) -> None:
+        from azure.core.credentials import AzureKeyCredential
+        from azure.search.documents import SearchClient
+
+        self.close()
+        name = f"{self.prefix}-m{m}-ef{ef_construction}"
+        schema = self.schema.create_index_schema(
+            dimensions=corpus.shape[1],
+            name=name,
+            m=m,
+            ef_construction=ef_construction,
+        )
+        self._index = self.index_client.create_index(schema)
+        endpoint, api_key = self.schema.get_azure_search_config()
+        self._search = SearchClient(endpoint, name, AzureKeyCredential(api_key))
+        for start in range(0, corpus.shape[0], self.UPLOAD_BATCH):
+            rows = corpus[start : start + self.UPLOAD_BATCH]
+            self._search.upload_documents(
+                documents=[
+                    {"id": str(start + i), "embedding": to_json_vector(row)}
+                    for i, row in enumerate(rows)
+                ]
+            )
+        # Indexing is asynchronous; the build is done when every vector counts.
+        while self._search.get_document_count() < corpus.shape[0]:
+            time.sleep(1)
+
+    def _set_ef_search(self, ef_search: int) -> None:
+        if ef_search == self._ef_search:
+            return
+        # efSearch is the one HNSW parameter Azure lets you change in place.
+        self._index.vector_search.algorithms[0].parameters.ef_search = ef_search
+        self._index = self.index_client.create_or_update_index(self._index)
+        self._ef_search = ef_search
+
+    def search(self, query: np.ndarray, k: int, *, ef_search: int) -> np.ndarray:
+        from azure.search.documents.models import VectorizedQuery
+
+        self._set_ef_search(ef_search)
+        results = self._search.search(
+            search_text=None,
+            vector_queries=[
+                VectorizedQuery(
+                    vector=to_json_vector(query),
+                    k_nearest_neighbors=k,
+                    fields="embedding",
+                )
+            ],
+            select=["id"],
+            top=k,
+        )
+        return np.array([int(result["id"]) for result in results], dtype=np.int64)
+
+    def close(self) -> None:
+        if self._index is not None:
+            self.index_client.delete_index(self._index.name)
+            self._index = self._search = self._ef_search = None
+
+
+def supported_values(backend, name: str, values: tuple[int, ...]) -> tuple[int, ...]:
+    """``values`` within the backend's range for ``name``, in order, deduplicated."""
+    low, high = backend.LIMITS[name]
+    kept = tuple(dict.fromkeys(v for v in values if low <= v <= high))
+    dropped = sorted(set(values) - set(kept))
+    if dropped:
+        print(
+            f"Skipping {name} {dropped}: {type(backend).__name__} accepts {low}-{high}",
+            file=sys.stderr,
+        )
+    return kept
+
+
+def run_sweep(
+    backend,
+    corpus: np.ndarray,
+    queries: np.ndarray,
+    *,
+    k: int = 10,
+    m_values: tuple[int, ...] = (4, 8, 16, 32),
+    ef_construction_values: tuple[int, ...] = (100, 200, 400),
+    ef_search_values: tuple[int, ...] = (50, 100, 200, 500),
+) -> list[dict]:
+    corpus = as_vector_matrix(corpus)
+    queries = as_vector_matrix(queries)
+    truth = exact_top_k(corpus, queries, k)
+    rows: list[dict] = []
+
+    m_values = supported_values(backend, "m", m_values)
+    ef_construction_values = supported_values(
+        backend, "ef_construction", ef_construction_values
+    )
+    ef_search_values = supported_values(backend, "ef_search", ef_search_values)
+
+    for m, ef_construction in itertools.product(m_values, ef_construction_values):
+        try:
+            started = time.perf_counter()
+            backend.build(corpus, m=m, ef_construction=ef_construction)
+            build_seconds = time.perf_counter() - started
+            for ef_search in ef_search_values:
+                try:
+                    backend.search(queries[0], k, ef_search=ef_search)  # warm-up
+                    found, latencies = [], []
+                    for query in queries:
+                        started = time.perf_counter()
+                        found.append(backend.search(query, k, ef_search=ef_search))
+                        latencies.append(time.perf_counter() - started)
+                except Exception as exc:
+                    print(
+                        f"Skipping m={m} efC={ef_construction} efS={ef_search}: {exc}",
+                        file=sys.stderr,
+                    )
+                    continue
+                ms = np.array(latencies) * 1000
+                rows.append(
+                    {
+                        "m": m,
+                        "ef_construction": ef_construction,
+                        "ef_search": ef_search,
+                        "build_seconds": build_seconds,
+                        "recall": recall_at_k(truth, found),
+                        "p50_ms": float(np.percentile(ms, 50)),
+                        "p95_ms": float(np.percentile(ms, 95)),
+                    }
+                )
+        except Exception as exc:
+            print(f"Skipping m={m} efC={ef_construction}: {exc}", file=sys.stderr)
+        finally:
+            try:
+                backend.close()
+            except Exception as exc:
+                print(
+                    f"Could not clean up m={m} efC={ef_construction}: {exc}",
+                    file=sys.stderr,
+                )
+    return rows
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Sweep HNSW parameters and report recall@k, latency and build time"
+    )
+    parser.add_argument("--backend", choices=("local", "azure"), default="local")
+    parser.add_argument("--size", type=int, default=20000, help="Synthetic corpus size")
+    parser.add_argument("--dimensions", type=int, default=768)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument(
+        "--corpus",
+        type=Path,
+        default=None,
+        help="Optional .npy file of exported memory embeddings (rows are vectors)",
+    )
+    parser.add_argument("--m", type=int, nargs="+", default=[4, 8, 16, 32])
+    parser.add_argument(
+        "--ef-construction", type=int, nargs="+", default=[100, 200, 400]
+    )
+    parser.add_argument("--ef-search", type=int, nargs="+", default=[50, 100, 200, 500])
+    args = parser.parse_args()
+
+    if args.corpus:
+        corpus = normalize_rows(np.load(args.corpus))
+    else:
+        corpus = synthetic_corpus(args.size, args.dimensions)
+    queries = sample_queries(corpus, args.queries)
+    backend = HnswlibBackend() if args.backend == "local" else AzureBackend()
+
+    print(
+        f"{'m':>3} {'efC':>5} {'efS':>5} {'build_s':>8} "
+        f"{'recall@' + str(args.k):>9} {'p50_ms':>7} {'p95_ms':>7}"
+    )
+    for row in run_sweep(
+        backend,
+        corpus,
+        queries,
+        k=args.k,
+        m_values=tuple(args.m),
+        ef_construction_values=tuple(args.ef_construction),
+        ef_search_values=tuple(args.ef_search),
+    ):
+        print(
+            f"{row['m']:>3} {row['ef_construction']:>5} {row['ef_search']:>5} "
+            f"{row['build_seconds']:>8.2f} {row['recall']:>9.3f} "
+            f"{row['p50_ms']:>7.2f} {row['p95_ms']:>7.2f}"
+        )
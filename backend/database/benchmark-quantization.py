@@ -0,0 +1,157 @@
+# Recall vs. size benchmark for quantized / truncated memory embeddings
+
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from utils.vectors import (  # noqa: E402
+    as_vector_matrix,
+    binary_scores,
+    int8_scores,
+    normalize_rows,
+    quantize_binary,
+    quantize_int8,
+    rescore,
+    top_k_indices,
+    truncate_dimensions,
+)
+
+FLOAT32_BYTES = 4
+
+
+def synthetic_corpus(
+    size: int,
+    dimensions: int,
+    *,
+    topics: int = 64,
+    seed: int = 0,
+) -> np.ndarray:
+    """Clustered unit vectors whose variance decays with the dimension index.
+
+    The decaying spectrum mimics Matryoshka-trained embeddings, where the
+    leading dimensions carry most of the signal.
+    """
+    rng = np.random.default_rng(seed)
+    spectrum = 1.0 / np.sqrt(np.arange(1, dimensions + 1, dtype=np.float32))
+    centroids = rng.standard_normal((topics, dimensions)).astype(np.float32)
+    assignments = rng.integers(0, topics, size)
+    noise = rng.standard_normal((size, dimensions)).astype(np.float32) * 0.6
+    return normalize_rows((centroids[assignments] + noise) * spectrum)
+
+
+def sample_queries(corpus: np.ndarray, count: int, *, seed: int = 1) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    picks = corpus[rng.integers(0, corpus.shape[0], count)]
+    jitter = rng.standard_normal(picks.shape).astype(np.float32) * 0.02
+    return normalize_rows(picks + jitter)
+
+
+def exact_top_k(corpus: np.ndarray, queries: np.ndarray, k: int) -> np.ndarray:
+    scores = queries @ corpus.T
+    return np.stack([top_k_indices(row, k) for row in scores])
+
+
+def recall_at_k(truth: np.ndarray, found: list[np.ndarray]) -> float:
+    hits = sum(len(set(t) & set(f)) for t, f in zip(truth, found, strict=True))
+    return hits / truth.size
+
+
+def run_benchmark(
+    corpus: np.ndarray,
+    queries: np.ndarray,
+    *,
+    k: int = 10,
+    oversampling: tuple[float, ...] = (1.0, 2.0, 4.0, 10.0),
+    truncations: tuple[int, ...] = (),
+) -> list[dict]:
+    corpus = as_vector_matrix(corpus)
+    truth = exact_top_k(corpus, queries, k)
+    full_dims = corpus.shape[1]
+    rows: list[dict] = []
+
+    for dims in (full_dims, *sorted(set(truncations), reverse=True)):
+        reduced = truncate_dimensions(corpus, dims)
+        reduced_queries = truncate_dimensions(queries, dims)
+        int8_codes, int8_scale = quantize_int8(reduced)
+        packed = quantize_binary(reduced)
+
+        methods = {
+            "float32": (dims * FLOAT32_BYTES, lambda q: reduced @ q[0]),
+            "int8": (dims, lambda q: int8_scores(q, int8_codes, int8_scale)),
+            "binary": (packed.shape[1], lambda q: binary_scores(q, packed)),
+        }
+        for method, (bytes_per_vector, scorer) in methods.items():
+            factors = (1.0,) if method == "float32" else oversampling
+            for factor in factors:
+                candidates_k = int(np.ceil(k * factor))
+                found = []
+                started = time.perf_counter()
+                for query, original in zip(reduced_queries, queries, strict=True):
+                    candidates = top_k_indices(
+                        scorer(query[np.newaxis, :]), candidates_k
+                    )
+                    # Rescore against the original full-dimension vectors,
+                    # which Azure keeps with PRESERVE_ORIGINALS.
+                    found.append(rescore(original, corpus, candidates, k))
+                elapsed = time.perf_counter() - started
+                rows.append(
+                    {
+                        "method": method,
+                        "dims": dims,
+                        "oversampling": factor,
+                        "bytes_per_vector": bytes_per_vector,
+                        "compression": full_dims * FLOAT32_BYTES / bytes_per_vector,
+                        "recall": recall_at_k(truth, found),
+                        "ms_per_query": elapsed * 1000 / len(reduced_queries),
+                    }
+                )
+    return rows
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Measure recall@k against stored bytes for quantized embeddings"
+    )
+    parser.add_argument("--size", type=int, default=20000, help="Synthetic corpus size")
+    parser.add_argument("--dimensions", type=int, default=768)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument(
+        "--corpus",
+        type=Path,
+        default=None,
+        help="Optional .npy file of exported memory embeddings (rows are vectors)",
+    )
+    parser.add_argument(
+        "--truncate",
+        type=int,
+        nargs="*",
+        default=[512, 256],
+        help="Matryoshka truncation dimensions to include",
+    )
+    args = parser.parse_args()
+
+    if args.corpus:
+        corpus = normalize_rows(np.load(args.corpus))
+    else:
+        corpus = synthetic_corpus(args.size, args.dimensions)
+    queries = sample_queries(corpus, args.queries)
+
+    print(
+        f"{'method':<8} {'dims':>5} {'over':>5} {'bytes':>6} {'ratio':>6} "
+        f"{'recall@' + str(args.k):>9} {'ms/q':>7}"
+    )
+    for row in run_benchmark(
+        corpus, queries, k=args.k, truncations=tuple(args.truncate)
+    ):
+        print(
+            f"{row['method']:<8} {row['dims']:>5} {row['oversampling']:>5.1f} "
+            f"{row['bytes_per_vector']:>6} {row['compression']:>5.1f}x "
+            f"{row['recall']:>9.3f} {row['ms_per_query']:>7.2f}"
+        )
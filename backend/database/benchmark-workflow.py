@@ -0,0 +1,191 @@
+# Load benchmark of POST /chat/workflow against recorded provider responses
+#
+# Record once against the live providers, then replay as often as needed:
+#
+#   python database/benchmark-workflow.py --mode record --photos a.jpg b.jpg c.jpg
+#   python database/benchmark-workflow.py --photos a.jpg b.jpg c.jpg \
+#       --requests 200 --concurrency 20 --latency-scale 1
+#
+# Replays go through the full app (admission control, routing, caches,
+# accounting) with OpenAI, Serper, Gemini and Azure Search answered from
+# cassettes. Firestore is swapped for an in-memory store so nothing leaves
+# the machine. The workflow result cache is bypassed unless
+# --workflow-cache is given, so every request runs the whole pipeline.
+# Record with cold caches (e.g. SHARED_CACHE=none) so every provider call
+# the pipeline can make ends up on a cassette.
+
+import asyncio
+import base64
+import mimetypes
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from httpx import ASGITransport, AsyncClient  # noqa: E402
+
+from app import app  # noqa: E402
+from routers import chat as chat_router  # noqa: E402
+from services import startup  # noqa: E402
+from utils.cassettes import MODES, cassettes  # noqa: E402
+
+
+class _Snapshot:
+    def __init__(self, data: dict | None):
+        self.exists = data is not None
+        self._data = data
+
+    def to_dict(self) -> dict | None:
+        return None if self._data is None else dict(self._data)
+
+
+class _Document:
+    def __init__(self, store: dict, key: tuple[str, str]):
+        self._store = store
+        self._key = key
+
+    def get(self) -> _Snapshot:
+        return _Snapshot(self._store.get(self._key))
+
+    def set(self, data: dict, merge: bool = False) -> None:
+        base = self._store.get(self._key, {}) if merge else {}
+        self._store[self._key] = {**base, **data}
+
+    def update(self, data: dict) -> None:
+        self._store[self._key] = {**self._store.get(self._key, {}), **data}
+
+
+class _Collection:
+    def __init__(self, store: dict, name: str):
+        self._store = store
+        self._name = name
+
+    def document(self, doc_id: str) -> _Document:
+        return _Document(self._store, (self._name, doc_id))
+
+
+class MemoryFirestore:
+    """Just enough of the Firestore client for the chat endpoints."""
+
+    def __init__(self):
+        self._store: dict = {}
+
+    def collection(self, name: str) -> _Collection:
+        return _Collection(self._store, name)
+
+
+def photo_data_url(path: Path) -> str:
+    content_type = mimetypes.guess_type(path.name)[0] or "image/jpeg"
+    return f"data:{content_type};base64,{base64.b64encode(path.read_bytes()).decode()}"
+
+
+async def run_benchmark(
+    photos: list[str],
+    *,
+    requests: int,
+    concurrency: int,
+    country: str = "us",
+) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: list[float] = []
+    failures: dict[str, int] = {}
+
+    async def one(client: AsyncClient, i: int) -> None:
+        async with semaphore:
+            started = time.perf_counter()
+            response = await client.post(
+                "/chat/workflow",
+                json={
+                    "uid": f"bench-{i % concurrency}",
+                    "chat_id": f"bench-{i}",
+                    "photo_data_urls": photos,
+                    "country": country,
+                },
+                timeout=None,
+            )
+            latencies.append(time.perf_counter() - started)
+        body = response.json() if response.status_code == 200 else {}
+        if not body.get("success"):
+            reason = body.get("error") or f"HTTP {response.status_code}"
+            failures[reason] = failures.get(reason, 0) + 1
+
+    started = time.perf_counter()
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://bench"
+    ) as client:
+        await asyncio.gather(*(one(client, i) for i in range(requests)))
+    wall = time.perf_counter() - started
+
+    seconds = np.array(latencies)
+    return {
+        "requests": requests,
+        "failed": sum(failures.values()),
+        "failures": failures,
+        "wall_seconds": wall,
+        "throughput_rps": requests / wall,
+        "p50_s": float(np.percentile(seconds, 50)),
+        "p95_s": float(np.percentile(seconds, 95)),
+        "max_s": float(seconds.max()),
+        "cassettes": dict(cassettes.stats),
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Benchmark /chat/workflow with recorded provider responses"
+    )
+    parser.add_argument("--photos", type=Path, nargs="+", required=True)
+    parser.add_argument("--mode", choices=MODES, default="replay")
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--country", default="us")
+    parser.add_argument("--cassettes", type=Path, default=None)
+    parser.add_argument(
+        "--latency-scale",
+        type=float,
+        default=None,
+        help="Multiplier on recorded provider latency (0 replays instantly)",
+    )
+    parser.add_argument("--extra-latency-ms", type=float, default=None)
+    parser.add_argument("--workflow-cache", action="store_true")
+    parser.add_argument(
+        "--live-firestore",
+        action="store_true",
+        help="Persist chats to the configured Firestore instead of memory",
+    )
+    args = parser.parse_args()
+
+    cassettes.mode = args.mode
+    if args.cassettes:
+        cassettes.directory = args.cassettes
+    if args.latency_scale is not None:
+        cassettes.latency_scale = args.latency_scale
+    if args.extra_latency_ms is not None:
+        cassettes.extra_latency_ms = args.extra_latency_ms
+    if not args.live_firestore:
+        startup.register_provider("firestore", MemoryFirestore)
+    if not args.workflow_cache:
+        chat_router.cached_workflow = lambda key, compute, cacheable: (
+            compute(),
+            True,
+        )
+
+    report = asyncio.run(
+        run_benchmark(
+            [photo_data_url(path) for path in args.photos],
+            requests=1 if args.mode == "record" else args.requests,
+            concurrency=args.concurrency,
+            country=args.country,
+        )
+    )
+    for name, value in report.items():
+        print(
+            f"{name:>15}: {value:.3f}"
+            if isinstance(value, float)
+            else f"{name:>15}: {value}"
+        )
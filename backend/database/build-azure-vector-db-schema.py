@@ -7,16 +7,22 @@ from functools import lru_cache
 from pathlib import Path
 from typing import Any
 
+import numpy as np
 from azure.core.credentials import AzureKeyCredential
 from azure.search.documents.indexes import SearchIndexClient
 from azure.search.documents.indexes.models import (
+    BinaryQuantizationCompression,
     HnswAlgorithmConfiguration,
+    RescoringOptions,
+    ScalarQuantizationCompression,
+    ScalarQuantizationParameters,
     SearchableField,
     SearchField,
     SearchFieldDataType,
     SearchIndex,
     SimpleField,
     VectorSearch,
+    VectorSearchCompressionRescoreStorageMethod,
     VectorSearchProfile,
 )
 from dotenv import load_dotenv
@@ -29,7 +35,13 @@ if ENV_PATH.exists():
 
 
 INDEX_NAME = "glowly-memory"
-EMBEDDING_DIMENSIONS = 768
+EMBEDDING_DIMENSIONS = int(os.environ.get("AZURE_SEARCH_EMBEDDING_DIMENSIONS", "768"))
+SUPPORTED_DIMENSIONS = (768, 1536, 3072)
+COMPRESSION_METHODS = ("none", "scalar", "binary")
+DEFAULT_OVERSAMPLING = 4.0
+# HNSW graph degree, build-time and query-time candidate lists.
+# Measure alternatives with benchmark-hnsw.py before changing them.
+DEFAULT_HNSW = {"m": 4, "ef_construction": 400, "ef_search": 500}
 
 
 @lru_cache(maxsize=1)
@@ -50,15 +62,65 @@ def get_index_client() -> SearchIndexClient:
     return SearchIndexClient(endpoint=endpoint, credential=AzureKeyCredential(api_key))
 
 
-def create_index_schema() -> SearchIndex:
+def create_compression(
+    method: str,
+    *,
+    truncate_to: int | None = None,
+    oversampling: float = DEFAULT_OVERSAMPLING,
+):
+    """Quantize stored vectors; originals are kept so top-k x oversampling is rescored."""
+    if method == "none":
+        return None
+
+    rescoring = RescoringOptions(
+        enable_rescoring=True,
+        default_oversampling=oversampling,
+        rescore_storage_method=VectorSearchCompressionRescoreStorageMethod.PRESERVE_ORIGINALS,
+    )
+    if method == "scalar":
+        return ScalarQuantizationCompression(
+            compression_name="scalar-int8",
+            parameters=ScalarQuantizationParameters(quantized_data_type="int8"),
+            rescoring_options=rescoring,
+            truncation_dimension=truncate_to,
+        )
+    if method == "binary":
+        return BinaryQuantizationCompression(
+            compression_name="binary",
+            rescoring_options=rescoring,
+            truncation_dimension=truncate_to,
+        )
+    raise ValueError(f"Unknown compression method: {method}")
+
+
+def create_index_schema(
+    dimensions: int = EMBEDDING_DIMENSIONS,
+    name: str = INDEX_NAME,
+    compression: str = "none",
+    truncate_to: int | None = None,
+    oversampling: float = DEFAULT_OVERSAMPLING,
+    m: int = DEFAULT_HNSW["m"],
+    ef_construction: int = DEFAULT_HNSW["ef_construction"],
+    ef_search: int = DEFAULT_HNSW["ef_search"],
+) -> SearchIndex:
+    if dimensions not in SUPPORTED_DIMENSIONS:
+        raise ValueError(f"dimensions must be one of {SUPPORTED_DIMENSIONS}")
+    if truncate_to is not None and compression == "none":
+        raise ValueError("truncate_to needs --compression scalar or binary")
+    if truncate_to is not None and not 0 < truncate_to < dimensions:
+        raise ValueError("truncate_to must be smaller than the stored dimensions")
+
+    compression_config = create_compression(
+        compression, truncate_to=truncate_to, oversampling=oversampling
+    )
     vector_search = VectorSearch(
         algorithms=[
             HnswAlgorithmConfiguration(
                 name="hnsw-config",
                 parameters={
-                    "m": 4,
-                    "efConstruction": 400,
-                    "efSearch": 500,
+                    "m": m,
+                    "efConstruction": ef_construction,
+                    "efSearch": ef_search,
                     "metric": "cosine",
                 },
             ),
@@ -67,8 +129,12 @@ def create_index_schema() -> SearchIndex:
             VectorSearchProfile(
                 name="vector-profile",
                 algorithm_configuration_name="hnsw-config",
+                compression_name=(
+                    compression_config.compression_name if compression_config else None
+                ),
             ),
         ],
+        compressions=[compression_config] if compression_config else None,
     )
 
     fields = [
@@ -90,6 +156,12 @@ def create_index_schema() -> SearchIndex:
             filterable=True,
             sortable=True,
         ),
+        SimpleField(
+            name="importance",
+            type=SearchFieldDataType.Double,
+            filterable=True,
+            sortable=True,
+        ),
         SearchableField(
             name="content",
             type=SearchFieldDataType.String,
@@ -99,24 +171,47 @@ def create_index_schema() -> SearchIndex:
             name="embedding",
             type=SearchFieldDataType.Collection(SearchFieldDataType.Single),
             searchable=True,
-            vector_search_dimensions=EMBEDDING_DIMENSIONS,
+            vector_search_dimensions=dimensions,
             vector_search_profile_name="vector-profile",
         ),
     ]
 
     return SearchIndex(
-        name=INDEX_NAME,
+        name=name,
         fields=fields,
         vector_search=vector_search,
     )
 
 
-def build_index(recreate: bool = False) -> SearchIndex:
+def add_missing_fields(client: SearchIndexClient, **schema_options: Any) -> SearchIndex:
+    """Add fields the schema gained since the index was built; existing data stays."""
+    index = client.get_index(INDEX_NAME)
+    existing = {field.name for field in index.fields}
+    missing = [
+        field
+        for field in create_index_schema(**schema_options).fields
+        if field.name not in existing
+    ]
+    if not missing:
+        print(f"Index '{INDEX_NAME}' already has every field")
+        return index
+    index.fields.extend(missing)
+    print(f"Adding fields: {', '.join(field.name for field in missing)}")
+    return client.create_or_update_index(index)
+
+
+def build_index(
+    recreate: bool = False,
+    add_fields: bool = False,
+    **schema_options: Any,
+) -> SearchIndex:
     client = get_index_client()
 
     existing_indexes = [idx.name for idx in client.list_indexes()]
 
     if INDEX_NAME in existing_indexes:
+        if add_fields and not recreate:
+            return add_missing_fields(client, **schema_options)
         if recreate:
             print(f"Deleting existing index: {INDEX_NAME}")
             client.delete_index(INDEX_NAME)
@@ -124,7 +219,7 @@ def build_index(recreate: bool = False) -> SearchIndex:
             print(f"Index '{INDEX_NAME}' already exists. Use recreate=True to rebuild.")
             return client.get_index(INDEX_NAME)
 
-    index_schema = create_index_schema()
+    index_schema = create_index_schema(**schema_options)
     print(f"Creating index: {INDEX_NAME}")
     result = client.create_index(index_schema)
     print(f"Index '{result.name}' created successfully!")
@@ -135,15 +230,17 @@ def build_index(recreate: bool = False) -> SearchIndex:
 def create_memory_document(
     uid: str,
     content: str,
-    embedding: list[float],
+    embedding: Any,
     timestamp: datetime | None = None,
+    importance: float = 0.5,
 ) -> dict[str, Any]:
     return {
         "id": str(uuid.uuid4()),
         "uid": uid,
         "timestamp": (timestamp or datetime.now(timezone.utc)).isoformat(),
         "content": content,
-        "embedding": embedding,
+        "importance": importance,
+        "embedding": np.asarray(embedding, dtype=np.float32).tolist(),
     }
 
 
@@ -158,9 +255,56 @@ if __name__ == "__main__":
         action="store_true",
         help="Delete and recreate the index if it exists",
     )
+    parser.add_argument(
+        "--add-fields",
+        action="store_true",
+        help="Add new schema fields (e.g. importance) to the existing index in place",
+    )
+    parser.add_argument(
+        "--dimensions",
+        type=int,
+        choices=SUPPORTED_DIMENSIONS,
+        default=EMBEDDING_DIMENSIONS,
+        help="Stored embedding size; must match AZURE_SEARCH_EMBEDDING_DIMENSIONS",
+    )
+    parser.add_argument(
+        "--compression",
+        choices=COMPRESSION_METHODS,
+        default="none",
+        help="Quantize stored vectors (int8 scalar or 1-bit binary)",
+    )
+    parser.add_argument(
+        "--truncate-to",
+        type=int,
+        default=None,
+        help="Matryoshka truncation dimension for the compressed index",
+    )
+    parser.add_argument(
+        "--oversampling",
+        type=float,
+        default=DEFAULT_OVERSAMPLING,
+        help="Default oversampling factor for full-precision rescoring",
+    )
+    parser.add_argument("--m", type=int, default=DEFAULT_HNSW["m"])
+    parser.add_argument(
+        "--ef-construction", type=int, default=DEFAULT_HNSW["ef_construction"]
+    )
+    parser.add_argument("--ef-search", type=int, default=DEFAULT_HNSW["ef_search"])
     args = parser.parse_args()
+    if args.truncate_to is not None and args.compression == "none":
+        parser.error("--truncate-to needs --compression scalar or binary")
 
-    index = build_index(recreate=args.recreate)
+    index = build_index(
+        recreate=args.recreate,
+        add_fields=args.add_fields,
+        dimensions=args.dimensions,
+        compression=args.compression,
+        truncate_to=args.truncate_to,
+        oversampling=args.oversampling,
+        m=args.m,
+        ef_construction=args.ef_construction,
+        ef_search=args.ef_search,
+    )
     print("\nIndex configuration:")
     print(f"  Name: {index.name}")
     print(f"  Fields: {len(index.fields)}")
@@ -1,26 +1,14 @@
-import os
 from functools import lru_cache
-from pathlib import Path
 
-
-import firebase_admin
-from dotenv import load_dotenv
-from firebase_admin import credentials, firestore
-
-load_dotenv()
-
-PROJECT_ROOT = Path(__file__).resolve().parents[2]
-ENV_PATH = PROJECT_ROOT / ".env"
-
-if ENV_PATH.exists():
-    load_dotenv(ENV_PATH)
-elif not os.environ.get("FIREBASE_SERVICE_ACCOUNT_KEY"):
-    raise RuntimeError("No .env file found and FIREBASE_SERVICE_ACCOUNT_KEY is not set")
+from utils.env import get_env
 
 
 @lru_cache(maxsize=1)
 def init_firebase():
-    key_path = os.environ.get("FIREBASE_SERVICE_ACCOUNT_KEY")
+    import firebase_admin
+    from firebase_admin import credentials, firestore
+
+    key_path = get_env("FIREBASE_SERVICE_ACCOUNT_KEY")
     if not key_path:
         raise RuntimeError(
             "Set FIREBASE_SERVICE_ACCOUNT_KEY to your service account json path"
@@ -28,7 +16,7 @@ def init_firebase():
 
     cred = credentials.Certificate(key_path)
     options: dict[str, str] = {}
-    bucket_name = os.environ.get("FIREBASE_STORAGE_BUCKET")
+    bucket_name = get_env("FIREBASE_STORAGE_BUCKET")
     if bucket_name:
         options["storageBucket"] = bucket_name
 
@@ -0,0 +1,381 @@
+# Re-embed the memory index into a new index and switch an alias over to it
+#
+# Run this after changing GEMINI_EMBEDDING_MODEL or the embedding dimensions.
+# Every memory is paged out, re-embedded in parallel batches and written to
+# the new index. Progress is checkpointed after each page, so a crashed run
+# picks up where it left off with the same command.
+#
+# Query and stored vectors must come from the same model, so the cutover
+# happens in this order:
+#
+#   1. Copy while the app keeps serving the old index with the old model:
+#        python database/reembed-memory-index.py --target glowly-memory-v2
+#   2. Deploy the app with the new GEMINI_EMBEDDING_MODEL /
+#      AZURE_SEARCH_EMBEDDING_DIMENSIONS and AZURE_SEARCH_INDEX set to the new
+#      index itself (not the alias). From here on it writes new-model vectors.
+#   3. Copy what reached the old index before the deploy and repoint the alias:
+#        python database/reembed-memory-index.py --target glowly-memory-v2 --switch
+#      The app can then go back to reading the alias.
+#
+# Switching the alias before step 2 would have the running app search the new
+# index with old-model query vectors and write old-model vectors into it.
+#
+# An alias cannot share a name with an index, so the first migration away
+# from the original ``glowly-memory`` index needs a new ``--alias`` name (and
+# ``--source glowly-memory``); point AZURE_SEARCH_INDEX at that alias.
+# Indexes built before the importance field existed need
+# ``build-azure-vector-db-schema.py --add-fields`` before they can be a source.
+# Memories deleted from the old index during the migration are not mirrored.
+
+import importlib.util
+import json
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Iterator
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from azure.core.credentials import AzureKeyCredential  # noqa: E402
+from azure.core.exceptions import ResourceNotFoundError  # noqa: E402
+from azure.search.documents import SearchClient  # noqa: E402
+from azure.search.documents.indexes.models import SearchAlias  # noqa: E402
+
+from llm.gemini import EMBEDDING_MODEL, get_gemini_embeddings  # noqa: E402
+from services.admission import Overloaded, admission_context  # noqa: E402
+from utils.ranking import estimate_importance  # noqa: E402
+from utils.vectors import to_json_vector  # noqa: E402
+
+_schema_spec = importlib.util.spec_from_file_location(
+    "build_azure_vector_db_schema",
+    Path(__file__).with_name("build-azure-vector-db-schema.py"),
+)
+schema = importlib.util.module_from_spec(_schema_spec)
+_schema_spec.loader.exec_module(schema)
+
+DEFAULT_ALIAS = os.environ.get("AZURE_SEARCH_INDEX", schema.INDEX_NAME)
+DEFAULT_BATCH_SIZE = 100
+DEFAULT_PAGE_SIZE = 1000
+DEFAULT_WORKERS = 4
+MAX_ATTEMPTS = 5
+SELECT = ["id", "uid", "timestamp", "content", "importance"]
+
+
+@dataclass
+class Checkpoint:
+    """Resume position: everything up to ``timestamp`` except ``seen_ids``."""
+
+    source: str
+    target: str
+    model: str
+    dimensions: int
+    timestamp: str | None = None
+    # Ids already copied at exactly ``timestamp``; a batch upload shares one
+    # timestamp, so the next page has to skip these rather than use ``gt``.
+    seen_ids: list[str] = field(default_factory=list)
+    copied: int = 0
+    skipped: int = 0
+    switched: bool = False
+
+    @classmethod
+    def load(cls, path: Path) -> "Checkpoint | None":
+        try:
+            return cls(**json.loads(path.read_text()))
+        except FileNotFoundError:
+            return None
+
+    def save(self, path: Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_name = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        with os.fdopen(fd, "w") as handle:
+            json.dump(asdict(self), handle)
+        os.replace(tmp_name, path)
+
+
+def get_search_client(index_name: str) -> SearchClient:
+    endpoint, api_key = schema.get_azure_search_config()
+    return SearchClient(
+        endpoint=endpoint,
+        index_name=index_name,
+        credential=AzureKeyCredential(api_key),
+    )
+
+
+def resolve_index(index_client, name: str) -> str:
+    """The concrete index behind ``name``, which may be an alias or an index."""
+    try:
+        return index_client.get_alias(name).indexes[0]
+    except ResourceNotFoundError:
+        return name
+
+
+def ensure_target_index(index_client, name: str, **schema_options: Any) -> None:
+    if name in index_client.list_index_names():
+        print(f"Resuming into existing index: {name}")
+        return
+    index_client.create_index(schema.create_index_schema(name=name, **schema_options))
+    print(f"Created index: {name}")
+
+
+def _format_timestamp(value: Any) -> str:
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    return str(value).replace("+00:00", "Z")
+
+
+def _page_filter(checkpoint: Checkpoint) -> str | None:
+    if checkpoint.timestamp is None:
+        return None
+    clauses = [f"timestamp ge {checkpoint.timestamp}"]
+    if checkpoint.seen_ids:
+        clauses.append(f"not search.in(id, '{','.join(checkpoint.seen_ids)}', ',')")
+    return " and ".join(clauses)
+
+
+def iter_pages(
+    source: SearchClient, checkpoint: Checkpoint, page_size: int
+) -> Iterator[list[dict[str, Any]]]:
+    """Oldest-first pages after the checkpoint; each query restarts at the cursor."""
+    while True:
+        page = [
+            {key: doc.get(key) for key in SELECT}
+            for doc in source.search(
+                search_text="*",
+                filter=_page_filter(checkpoint),
+                select=SELECT,
+                order_by=["timestamp asc"],
+                top=page_size,
+            )
+        ]
+        if not page:
+            return
+        yield page
+
+
+def _with_retries(call: Callable[[], Any], what: str) -> Any:
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        try:
+            return call()
+        except Overloaded as exc:
+            # Shed by the admission limiter; wait as long as it asks.
+            print(f"  {what}: {exc}")
+            time.sleep(exc.retry_after)
+        except Exception as exc:
+            if attempt == MAX_ATTEMPTS:
+                raise
+            delay = 2**attempt
+            print(f"  {what} failed ({exc}); retrying in {delay}s")
+            time.sleep(delay)
+    raise RuntimeError(f"{what} kept being shed by admission control")
+
+
+def reembed_batch(
+    target: SearchClient,
+    docs: list[dict[str, Any]],
+    *,
+    model: str,
+    dimensions: int,
+) -> None:
+    def embed():
+        with admission_context("reembed", "background"):
+            return get_gemini_embeddings(
+                [doc["content"] for doc in docs],
+                task_type="RETRIEVAL_DOCUMENT",
+                output_dimensionality=dimensions,
+                model=model,
+            )
+
+    embeddings = _with_retries(embed, "embed")
+    payload = [
+        {
+            **doc,
+            "timestamp": _format_timestamp(doc["timestamp"]),
+            "importance": doc["importance"]
+            if doc["importance"] is not None
+            else estimate_importance(doc["content"]),
+            "embedding": to_json_vector(embedding),
+        }
+        for doc, embedding in zip(docs, embeddings, strict=True)
+    ]
+    # Documents keep their ids, so replaying a batch after a crash is idempotent.
+    _with_retries(lambda: target.merge_or_upload_documents(documents=payload), "upload")
+
+
+def copy_pages(
+    source: SearchClient,
+    target: SearchClient,
+    checkpoint: Checkpoint,
+    checkpoint_path: Path,
+    pool: ThreadPoolExecutor,
+    *,
+    batch_size: int,
+    page_size: int,
+) -> int:
+    copied = 0
+    for page in iter_pages(source, checkpoint, page_size):
+        docs = [doc for doc in page if (doc.get("content") or "").strip()]
+        batches = [docs[i : i + batch_size] for i in range(0, len(docs), batch_size)]
+        futures = [
+            pool.submit(
+                reembed_batch,
+                target,
+                batch,
+                model=checkpoint.model,
+                dimensions=checkpoint.dimensions,
+            )
+            for batch in batches
+        ]
+        for future in futures:
+            future.result()
+
+        last = _format_timestamp(page[-1]["timestamp"])
+        at_last = [d["id"] for d in page if _format_timestamp(d["timestamp"]) == last]
+        if last == checkpoint.timestamp:
+            at_last = checkpoint.seen_ids + at_last
+        checkpoint.timestamp, checkpoint.seen_ids = last, at_last
+        checkpoint.copied += len(docs)
+        checkpoint.skipped += len(page) - len(docs)
+        checkpoint.save(checkpoint_path)
+        copied += len(docs)
+        print(f"  copied {checkpoint.copied} (through {last})")
+    return copied
+
+
+def migrate(
+    *,
+    target_name: str,
+    alias: str,
+    source_name: str | None,
+    model: str,
+    checkpoint_path: Path,
+    batch_size: int,
+    page_size: int,
+    workers: int,
+    switch: bool,
+    **schema_options: Any,
+) -> Checkpoint:
+    index_client = schema.get_index_client()
+    dimensions = schema_options["dimensions"]
+    checkpoint = Checkpoint.load(checkpoint_path)
+    if checkpoint is None:
+        source_name = source_name or resolve_index(index_client, alias)
+        if source_name == target_name:
+            raise SystemExit(f"'{alias}' already points at '{target_name}'")
+        checkpoint = Checkpoint(source_name, target_name, model, dimensions)
+        checkpoint.save(checkpoint_path)
+    elif (checkpoint.target, checkpoint.model, checkpoint.dimensions) != (
+        target_name,
+        model,
+        dimensions,
+    ):
+        raise SystemExit(
+            f"{checkpoint_path} belongs to a migration into '{checkpoint.target}' "
+            f"with {checkpoint.model}/{checkpoint.dimensions}; "
+            "pass a different --checkpoint"
+        )
+
+    print(f"Re-embedding '{checkpoint.source}' -> '{checkpoint.target}' with {model}")
+    ensure_target_index(index_client, target_name, **schema_options)
+    source = get_search_client(checkpoint.source)
+    target = get_search_client(target_name)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        options = {"batch_size": batch_size, "page_size": page_size}
+        copy_pages(source, target, checkpoint, checkpoint_path, pool, **options)
+        if not switch or checkpoint.switched:
+            return checkpoint
+
+        # The app now writes to the new index; catch up on what reached the old
+        # one before it was redeployed, then swap the alias.
+        copy_pages(source, target, checkpoint, checkpoint_path, pool, **options)
+        index_client.create_or_update_alias(
+            SearchAlias(name=alias, indexes=[target_name])
+        )
+        checkpoint.switched = True
+        checkpoint.save(checkpoint_path)
+        print(f"Alias '{alias}' now points at '{target_name}'")
+    return checkpoint
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Re-embed Glowly memories into a new index behind an alias"
+    )
+    parser.add_argument("--target", required=True, help="Name of the new index")
+    parser.add_argument(
+        "--alias",
+        default=DEFAULT_ALIAS,
+        help="Alias the app reads; its current index is the copy source",
+    )
+    parser.add_argument(
+        "--source",
+        default=None,
+        help="Index to copy from (default: the index behind --alias)",
+    )
+    parser.add_argument(
+        "--model",
+        default=EMBEDDING_MODEL,
+        help="Gemini embedding model for the new index",
+    )
+    parser.add_argument(
+        "--dimensions",
+        type=int,
+        choices=schema.SUPPORTED_DIMENSIONS,
+        default=schema.EMBEDDING_DIMENSIONS,
+    )
+    parser.add_argument(
+        "--compression", choices=schema.COMPRESSION_METHODS, default="none"
+    )
+    parser.add_argument("--truncate-to", type=int, default=None)
+    parser.add_argument(
+        "--oversampling", type=float, default=schema.DEFAULT_OVERSAMPLING
+    )
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--page-size", type=int, default=DEFAULT_PAGE_SIZE)
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+    parser.add_argument(
+        "--checkpoint",
+        type=Path,
+        default=None,
+        help="Progress file (default: <tmp>/glowly-reembed-<target>.json)",
+    )
+    parser.add_argument(
+        "--switch",
+        action="store_true",
+        help="Final catch-up and alias swap; only after the app runs on the new index",
+    )
+    args = parser.parse_args()
+
+    checkpoint = migrate(
+        target_name=args.target,
+        alias=args.alias,
+        source_name=args.source,
+        model=args.model,
+        checkpoint_path=args.checkpoint
+        or Path(tempfile.gettempdir()) / f"glowly-reembed-{args.target}.json",
+        batch_size=args.batch_size,
+        page_size=args.page_size,
+        workers=args.workers,
+        switch=args.switch,
+        dimensions=args.dimensions,
+        compression=args.compression,
+        truncate_to=args.truncate_to,
+        oversampling=args.oversampling,
+    )
+    print(
+        f"\nDone: {checkpoint.copied} copied, {checkpoint.skipped} skipped, "
+        f"alias switched: {checkpoint.switched}"
+    )
+    if not checkpoint.switched:
+        print(
+            f"Next: deploy the app with GEMINI_EMBEDDING_MODEL={args.model}, "
+            f"AZURE_SEARCH_EMBEDDING_DIMENSIONS={args.dimensions} and "
+            f"AZURE_SEARCH_INDEX={args.target}, then rerun with --switch."
+        )
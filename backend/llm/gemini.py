@@ -1,66 +1,129 @@
-import os
+import hashlib
 from functools import lru_cache
-from pathlib import Path
+from typing import TYPE_CHECKING
 
-from dotenv import load_dotenv
-from google import genai
-from google.genai import types
+import numpy as np
 
-PROJECT_ROOT = Path(__file__).resolve().parents[2]
-ENV_PATH = PROJECT_ROOT / ".env"
+from services.admission import Overloaded, admit
+from utils.cache import TieredCache
+from utils.cassettes import cassettes
+from utils.env import get_env
+from utils.vectors import VECTOR_DTYPE, as_vector_matrix, normalize_rows
 
-if ENV_PATH.exists():
-    load_dotenv(ENV_PATH)
+if TYPE_CHECKING:
+    from google import genai
 
-GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY")
-EMBEDDING_MODEL = "gemini-embedding-001"
+EMBEDDING_MODEL = get_env("GEMINI_EMBEDDING_MODEL", "gemini-embedding-001")
 DEFAULT_DIMENSIONS = 768  # Available options: 768, 1536, or 3072
 
+# Keys include the model, so switching models never serves old vectors.
+embedding_cache = TieredCache(
+    "embeddings",
+    ttl_seconds=30 * 24 * 3600,
+    local_entries=4096,
+    encode=lambda vector: np.asarray(vector, dtype=VECTOR_DTYPE).tobytes(),
+    decode=lambda raw: np.frombuffer(raw, dtype=VECTOR_DTYPE),
+)
+
+
+def _embedding_key(text: str, model: str, task_type: str, dimensions: int) -> str:
+    key = f"{model}:{task_type}:{dimensions}:{text}"
+    return hashlib.sha256(key.encode()).hexdigest()
+
 
 @lru_cache(maxsize=1)
-def _get_client() -> genai.Client:
-    if not GEMINI_API_KEY:
+def _get_client() -> "genai.Client":
+    from google import genai
+
+    api_key = get_env("GEMINI_API_KEY")
+    if not api_key:
         raise RuntimeError("Set the GEMINI_API_KEY environment variable")
-    return genai.Client(api_key=GEMINI_API_KEY)
+    return genai.Client(api_key=api_key)
 
 
-def get_gemini_embedding(
-    text: str,
+def get_gemini_embeddings(
+    texts: list[str],
     task_type: str = "RETRIEVAL_DOCUMENT",
     output_dimensionality: int = DEFAULT_DIMENSIONS,
-) -> list[float]:
-    text = text.strip()
-    if not text:
+    *,
+    model: str = EMBEDDING_MODEL,
+) -> np.ndarray:
+    """Embed ``texts`` and return a (len(texts), dims) float32 matrix.
+
+    Cached vectors (shared across workers) are reused; the remaining texts
+    go to Gemini in one request.
+    """
+    texts = [text.strip() for text in texts]
+    if not texts or not all(texts):
         raise ValueError("Text must be a non-empty string")
 
-    client = _get_client()
+    keys = [_embedding_key(t, model, task_type, output_dimensionality) for t in texts]
+    rows = [embedding_cache.get(key) for key in keys]
+    missing = list(dict.fromkeys(t for t, row in zip(texts, rows) if row is None))
+    if missing:
+        fetched = dict(
+            zip(missing, _embed_texts(missing, task_type, output_dimensionality, model))
+        )
+        for i, (text, key) in enumerate(zip(texts, keys)):
+            if rows[i] is None:
+                rows[i] = fetched[text]
+                embedding_cache.set(key, rows[i])
+    return as_vector_matrix(np.stack(rows))
+
+
+def _embed_texts(
+    texts: list[str],
+    task_type: str,
+    output_dimensionality: int,
+    model: str = EMBEDDING_MODEL,
+) -> np.ndarray:
+    client = _get_client() if cassettes.live else None
+
+    def embed() -> list[list[float]]:
+        from google.genai import types
 
-    try:
         response = client.models.embed_content(
-            model=EMBEDDING_MODEL,
-            contents=text,
+            model=model,
+            contents=texts,
             config=types.EmbedContentConfig(
                 task_type=task_type,
                 output_dimensionality=output_dimensionality,
             ),
         )
+        return [embedding.values for embedding in response.embeddings or []]
+
+    request = {
+        "model": model,
+        "contents": texts,
+        "task_type": task_type,
+        "dimensions": output_dimensionality,
+    }
+    try:
+        with admit("gemini"):
+            values = cassettes.call("gemini", request, embed)
+    except Overloaded:
+        raise
     except Exception as exc:
         raise RuntimeError("Gemini embedding request failed") from exc
 
-    if not response.embeddings:
+    if len(values) != len(texts):
         raise RuntimeError("Gemini API did not return an embedding vector")
 
-    embedding = response.embeddings[0].values
+    matrix = as_vector_matrix(values)
 
     # Normalize for dimensions other than 3072
     if output_dimensionality != 3072:
-        import numpy as np
+        matrix = normalize_rows(matrix)
+
+    return matrix
 
-        embedding = np.array(embedding)
-        embedding = embedding / np.linalg.norm(embedding)
-        return embedding.tolist()
 
-    return list(embedding)
+def get_gemini_embedding(
+    text: str,
+    task_type: str = "RETRIEVAL_DOCUMENT",
+    output_dimensionality: int = DEFAULT_DIMENSIONS,
+) -> np.ndarray:
+    return get_gemini_embeddings([text], task_type, output_dimensionality)[0]
 
 
 if __name__ == "__main__":
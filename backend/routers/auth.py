@@ -1,12 +1,12 @@
 from fastapi import APIRouter, HTTPException
 from firebase_admin import auth
 
-from database.firebase import init_firebase
 from schema.auth import User, GetUser
+from services.startup import LazyProvider
 
 auth_router = APIRouter(prefix="/auth", tags=["auth"])
 
-db = init_firebase()
+db = LazyProvider("firestore")
 
 
 @auth_router.post("/register")
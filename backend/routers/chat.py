@@ -1,11 +1,23 @@
 """Chat endpoints for message storage and AI chat turns."""
 
+import asyncio
+import json
 import logging
 from datetime import datetime, timezone
 
-from fastapi import APIRouter, Depends
+from fastapi import (
+    APIRouter,
+    BackgroundTasks,
+    Depends,
+    File,
+    HTTPException,
+    Request,
+    UploadFile,
+    WebSocket,
+    WebSocketDisconnect,
+)
+from fastapi.responses import StreamingResponse
 
-from database.firebase import init_firebase
 from schema.chat import (
     StoreMessageRequest,
     StoreMessageResponse,
@@ -13,19 +25,52 @@ from schema.chat import (
     GetMessagesResponse,
     ChatTurnRequest,
     ChatTurnResponse,
+    ChatTurnDeltaResponse,
+    ProductSummary,
+    ToolCallSummary,
     WorkflowRequest,
     WorkflowResponse,
     ConversationTurnSchema,
+    PhotoUploadResponse,
+    UploadedPhoto,
+    WorkflowJobResponse,
+    WorkflowJobStatus,
 )
 from schema.memory import MemorySearchRequest, MemorySearchResponse
 from schema.conversation import ConversationRequest, ConversationResponse
 from agents.memory import search_agent
+from services.accounting import usage_scope
+from services.admission import Overloaded, admission_context, check_capacity
+from services.chat_sessions import (
+    IDLE_FLUSH_SECONDS,
+    MAX_PENDING_MESSAGES,
+    ChatSession,
+)
+from services.consolidation import consolidation_scheduler
+from services.photo_store import (
+    ALLOWED_CONTENT_TYPES,
+    CHUNK_BYTES,
+    PhotoNotFound,
+    PhotoTooLarge,
+    StoredPhoto,
+    load_photos,
+    photo_digest,
+    save_photo_stream,
+)
+from services.jobs import workflow_jobs
 from services.search import store_memory
+from services.semantic_cache import classify_cacheable, semantic_cache
+from services.workflow_cache import cached_workflow, workflow_cache_key
+from services.startup import LazyProvider
+from utils.serialization import JSONDecodeError, dumps_str, loads
 
 logger = logging.getLogger(__name__)
 
+# Products returned with a delta-mode turn when metadata is requested.
+MAX_TURN_PRODUCTS = 10
+
 chat_router = APIRouter(prefix="/chat", tags=["chat"])
-db = init_firebase()
+db = LazyProvider("firestore")
 
 
 @chat_router.post("/store-message")
@@ -76,11 +121,15 @@ async def get_messages(
 async def memory_search(payload: MemorySearchRequest) -> MemorySearchResponse:
     from agents.memory import search_agent
 
-    result = search_agent(
-        payload.question,
-        uid=payload.uid,
-        timestamp=payload.timestamp,
-    )
+    check_capacity("interactive", ("gemini", "openrouter"))
+    with admission_context(payload.uid, "interactive"):
+        result = await asyncio.to_thread(
+            search_agent,
+            payload.question,
+            uid=payload.uid,
+            timestamp=payload.timestamp,
+            **({} if payload.fan_out is None else {"fan_out": payload.fan_out}),
+        )
     return MemorySearchResponse(result=result)
 
 
@@ -90,86 +139,380 @@ async def conversation_endpoint(
 ) -> ConversationResponse:
     from agents.memory import search_agent
 
-    result = search_agent(
-        payload.question,
-        uid=payload.uid,
-        timestamp=payload.timestamp,
-    )
+    check_capacity("interactive", ("gemini", "openrouter"))
+    with admission_context(payload.uid, "interactive"):
+        result = await asyncio.to_thread(
+            search_agent,
+            payload.question,
+            uid=payload.uid,
+            timestamp=payload.timestamp,
+        )
     return ConversationResponse(result=result)
 
 
+async def _upload_chunks(upload: UploadFile):
+    while chunk := await upload.read(CHUNK_BYTES):
+        yield chunk
+
+
+def _check_content_type(content_type: str | None) -> str:
+    content_type = (content_type or "").split(";")[0].strip().lower()
+    if content_type not in ALLOWED_CONTENT_TYPES:
+        raise HTTPException(
+            status_code=415, detail=f"Unsupported image type: {content_type}"
+        )
+    return content_type
+
+
+def _resolve_photos(
+    photo_data_urls: list[str],
+    photo_hashes: list[str],
+) -> list["str | StoredPhoto"]:
+    try:
+        return [*photo_data_urls, *load_photos(photo_hashes)]
+    except PhotoNotFound as exc:
+        raise HTTPException(
+            status_code=404, detail=f"Photo {exc.args[0]} not uploaded"
+        ) from exc
+
+
+@chat_router.post("/photos")
+async def upload_photos(
+    files: list[UploadFile] = File(...),
+) -> PhotoUploadResponse:
+    """
+    Multipart photo upload. Returns content hashes to pass as photo_hashes
+    in /chat/turn and /chat/workflow instead of base64 data URLs.
+    """
+    photos = []
+    for upload in files:
+        content_type = _check_content_type(upload.content_type)
+        try:
+            photo = await save_photo_stream(_upload_chunks(upload), content_type)
+        except PhotoTooLarge as exc:
+            raise HTTPException(status_code=413, detail=str(exc)) from exc
+        photos.append(UploadedPhoto(hash=photo.sha256, content_type=content_type))
+    return PhotoUploadResponse(photos=photos)
+
+
+@chat_router.put("/photos")
+async def upload_photo_binary(request: Request) -> PhotoUploadResponse:
+    """Single-photo upload with the raw image bytes as the request body."""
+    content_type = _check_content_type(request.headers.get("content-type"))
+    try:
+        photo = await save_photo_stream(request.stream(), content_type)
+    except PhotoTooLarge as exc:
+        raise HTTPException(status_code=413, detail=str(exc)) from exc
+    return PhotoUploadResponse(
+        photos=[UploadedPhoto(hash=photo.sha256, content_type=content_type)]
+    )
+
+
 @chat_router.post("/turn")
-async def chat_turn(payload: ChatTurnRequest) -> ChatTurnResponse:
+async def chat_turn(
+    payload: ChatTurnRequest,
+    background: BackgroundTasks,
+) -> ChatTurnResponse | ChatTurnDeltaResponse:
     """
     Handle a single chat turn: receive user message, get AI response.
     Automatically persists both messages to Firebase.
+
+    With ``response_mode="delta"`` only the new assistant message comes back.
+    ``history_version`` is the number of messages stored for the chat after
+    this turn: a client that held N messages should now hold N + 2, and any
+    other value means another tab or device wrote to the chat, so it should
+    reload the history from /chat/get-messages.
     """
-    from agents.cosmetist import run_chat_turn
+    check_capacity("interactive")
+    photos = _resolve_photos(payload.photo_data_urls, payload.photo_hashes)
+    with (
+        admission_context(payload.uid, "interactive"),
+        usage_scope(chat_id=payload.chat_id or payload.uid),
+    ):
+        return await asyncio.to_thread(_execute_chat_turn, payload, photos, background)
+
+
+def _remember_turn(uid: str, chat_id: str, content: str, timestamp: datetime) -> None:
+    """Store a finished turn in the memory index; runs after the response is sent."""
+    try:
+        with admission_context(uid, "background"), usage_scope(chat_id=chat_id):
+            store_memory(uid=uid, content=content, timestamp=timestamp)
+        consolidation_scheduler.mark_dirty(uid)
+    except Exception as exc:
+        logger.warning("Failed to store memory entry: %s", exc)
+
+
+def _execute_chat_turn(
+    payload: ChatTurnRequest,
+    photos: list["str | StoredPhoto"],
+    background: BackgroundTasks,
+) -> ChatTurnResponse | ChatTurnDeltaResponse:
+    from agents.cosmetist import CHAT_PROMPT_VERSION, run_chat_turn
+
+    delta = payload.response_mode == "delta"
+    tool_calls: list[tuple[str, dict, str]] | None = (
+        [] if delta and payload.include_metadata else None
+    )
 
     # Build history with the new user message
     history = [{"role": t.role, "content": t.content} for t in payload.history]
     history.append({"role": "user", "content": payload.message})
 
-    memory = search_agent(
-        payload.message,
-        uid=payload.uid,
-        timestamp=None,
-    )
-
-    # Get AI response
-    reply = run_chat_turn(
-        photo_data_urls=payload.photo_data_urls,
-        history=history,
-        country=payload.country,
-        memory=memory,
+    # Only an opening question is standalone; later ones lean on the history.
+    cacheable = (
+        not payload.history and not photos and classify_cacheable(payload.message)[0]
     )
+    lookup = None
+    if cacheable:
+        try:
+            lookup = semantic_cache.lookup(payload.message, CHAT_PROMPT_VERSION)
+        except Exception as exc:
+            logger.warning("Semantic cache lookup failed: %s", exc)
 
-    try:
-        store_memory(
+    if lookup and lookup.reply:
+        reply = lookup.reply
+    else:
+        memory = search_agent(
+            payload.message,
             uid=payload.uid,
-            content=f"User: {payload.message}\nAssistant: {reply}",
-            timestamp=datetime.now(timezone.utc),
+            timestamp=None,
         )
-    except Exception as exc:
-        logger.warning("Failed to store memory entry: %s", exc)
+
+        # Get AI response
+        reply = run_chat_turn(
+            photo_data_urls=photos,
+            history=history,
+            country=payload.country,
+            memory=memory,
+            **(
+                {"on_tool": lambda *call: tool_calls.append(call)}
+                if tool_calls is not None
+                else {}
+            ),
+        )
+
+        # Answers shaped by the user's memory are personal; keep them out.
+        if cacheable and not (memory and memory.get("found")):
+            try:
+                semantic_cache.store(
+                    payload.message,
+                    reply,
+                    CHAT_PROMPT_VERSION,
+                    embedding=lookup.embedding if lookup else None,
+                )
+            except Exception as exc:
+                logger.warning("Semantic cache store failed: %s", exc)
+
+    background.add_task(
+        _remember_turn,
+        payload.uid,
+        payload.chat_id or payload.uid,
+        f"User: {payload.message}\nAssistant: {reply}",
+        datetime.now(timezone.utc),
+    )
 
     # Add assistant response to history
     history.append({"role": "assistant", "content": reply})
 
-    # Persist messages to Firebase
-    chat_id = payload.chat_id or payload.uid
-    if chat_id:
-        _persist_messages(
-            chat_id=chat_id,
-            uid=payload.uid,
-            messages=[
-                {"role": "user", "content": payload.message},
-                {"role": "assistant", "content": reply},
-            ],
-        )
+    # Persist messages to Firebase; the stored count is the history version.
+    history_version = _persist_messages(
+        chat_id=payload.chat_id or payload.uid,
+        uid=payload.uid,
+        messages=[
+            {"role": "user", "content": payload.message},
+            {"role": "assistant", "content": reply},
+        ],
+    )
 
+    if delta:
+        return ChatTurnDeltaResponse(
+            message=ConversationTurnSchema(role="assistant", content=reply),
+            history_version=history_version,
+            **(_tool_metadata(tool_calls) if tool_calls is not None else {}),
+        )
     return ChatTurnResponse(
         reply=reply,
         history=[
             ConversationTurnSchema(role=t["role"], content=t["content"])
             for t in history
         ],
+        history_version=history_version,
     )
 
 
-@chat_router.post("/workflow")
-async def run_workflow(payload: WorkflowRequest) -> WorkflowResponse:
+def _tool_metadata(calls: list[tuple[str, dict, str]]) -> dict:
+    """Tool call summaries and the products they returned, deduplicated by link."""
+    tools: list[ToolCallSummary] = []
+    products: dict[str, ProductSummary] = {}
+    for name, args, result in calls:
+        try:
+            items = loads(result)
+        except JSONDecodeError:
+            items = None  # "Tool error: ..." and other plain-text results
+        items = items if isinstance(items, list) else []
+        tools.append(
+            ToolCallSummary(name=name, query=args.get("q"), results=len(items))
+        )
+        for item in items:
+            if not isinstance(item, dict) or not item.get("title"):
+                continue
+            link = item.get("link")
+            if not link or link in products or len(products) >= MAX_TURN_PRODUCTS:
+                continue
+            price = item.get("price")
+            rating = item.get("rating")
+            products[link] = ProductSummary(
+                title=item["title"],
+                link=link,
+                source=item.get("source"),
+                price=None if price is None else str(price),
+                rating=rating if isinstance(rating, (int, float)) else None,
+                imageUrl=item.get("imageUrl"),
+            )
+    return {"tools": tools, "products": list(products.values())}
+
+
+@chat_router.websocket("/ws")
+async def chat_session(
+    websocket: WebSocket,
+    uid: str,
+    chat_id: str | None = None,
+    country: str = "us",
+):
     """
-    Run the full initial skincare analysis workflow.
-    Returns verification, analysis, ratings, and shopping recommendations.
+    Long-lived chat. History, photos and memory context stay on the server,
+    so each message carries only its text (and photos when they change):
+
+        -> {"message": "...", "photo_hashes": [...]}
+        <- {"type": "delta", "text": "..."}  (repeated)
+        <- {"type": "reply", "reply": "...", "turns": n}
+
+    Messages are persisted in batches when the socket idles or closes.
     """
-    from agents.cosmetist import run_initial_workflow
+    await websocket.accept()
+    session = ChatSession(uid, chat_id, country)
+    try:
+        await asyncio.to_thread(session.load)
+    except Exception as exc:
+        logger.warning("Could not load chat %s: %s", session.chat_id, exc)
+    await websocket.send_json({"type": "ready", "history": len(session.history)})
 
     try:
-        result = run_initial_workflow(
-            photo_data_urls=payload.photo_data_urls,
-            country=payload.country,
+        while True:
+            try:
+                event = await asyncio.wait_for(
+                    websocket.receive_json(),
+                    timeout=IDLE_FLUSH_SECONDS if session.pending else None,
+                )
+            except asyncio.TimeoutError:
+                await _flush_session(session)
+                continue
+            await _handle_session_event(websocket, session, event)
+            if session.pending >= MAX_PENDING_MESSAGES:
+                await _flush_session(session)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        await _flush_session(session)
+
+
+async def _handle_session_event(
+    websocket: WebSocket, session: ChatSession, event: dict
+) -> None:
+    if "photo_data_urls" in event or "photo_hashes" in event:
+        try:
+            # Decoding and hashing photos is CPU work; keep it off the loop.
+            photos = await asyncio.to_thread(
+                _resolve_photos,
+                event.get("photo_data_urls") or [],
+                event.get("photo_hashes") or [],
+            )
+            await asyncio.to_thread(session.set_photos, photos)
+        except HTTPException as exc:
+            await websocket.send_json({"type": "error", "detail": exc.detail})
+            return
+
+    message = (event.get("message") or "").strip()
+    if not message:
+        await websocket.send_json({"type": "photos", "count": len(session.photos)})
+        return
+
+    loop = asyncio.get_running_loop()
+    deltas: asyncio.Queue[str | None] = asyncio.Queue()
+
+    def run_turn() -> str:
+        try:
+            return session.reply(
+                message, lambda text: loop.call_soon_threadsafe(deltas.put_nowait, text)
+            )
+        finally:
+            loop.call_soon_threadsafe(deltas.put_nowait, None)
+
+    turn: asyncio.Future | None = None
+    try:
+        check_capacity("interactive")
+        with (
+            admission_context(session.uid, "interactive"),
+            usage_scope(chat_id=session.chat_id),
+        ):
+            turn = asyncio.ensure_future(asyncio.to_thread(run_turn))
+        while (text := await deltas.get()) is not None:
+            await websocket.send_json({"type": "delta", "text": text})
+        reply = await turn
+    except Overloaded as exc:
+        await websocket.send_json(
+            {"type": "error", "detail": str(exc), "retry_after": exc.retry_after}
+        )
+        return
+    except Exception as exc:
+        logger.warning("Chat session turn failed: %s", exc)
+        await websocket.send_json({"type": "error", "detail": str(exc)})
+        return
+    finally:
+        # The worker thread cannot be cancelled. If the client left mid-reply,
+        # let it queue its messages so the session's final flush includes them.
+        if turn is not None and not turn.done():
+            try:
+                await asyncio.shield(turn)
+            except Exception:
+                pass
+    await websocket.send_json(
+        {"type": "reply", "reply": reply, "turns": session.stats["turns"]}
+    )
+
+
+async def _flush_session(session: ChatSession) -> None:
+    # Submitted before the first await and shielded, so a cancelled
+    # connection (client gone, server shutting down) still persists its queue.
+    flush = asyncio.get_running_loop().run_in_executor(None, session.flush)
+    try:
+        await asyncio.shield(flush)
+    except Exception as exc:
+        logger.warning("Failed to persist chat %s: %s", session.chat_id, exc)
+
+
+def _execute_workflow(
+    payload: WorkflowRequest,
+    photos: list["str | StoredPhoto"],
+    on_stage=None,
+) -> WorkflowResponse:
+    from agents.cosmetist import WORKFLOW_STAGES, run_initial_workflow
+
+    try:
+        result, computed = cached_workflow(
+            _workflow_key(photos, payload.country),
+            lambda: run_initial_workflow(
+                photo_data_urls=photos,
+                country=payload.country,
+                on_stage=on_stage,
+            ),
+            # Only completed runs; a failed verification should be retried.
+            cacheable=lambda result: result.get("shopping") is not None,
         )
+        if not computed and on_stage:
+            for stage in WORKFLOW_STAGES:
+                if result.get(stage) is not None:
+                    on_stage(stage, result[stage])
 
         # Check if verification failed
         verification = result.get("verification", "")
@@ -177,8 +520,6 @@ async def run_workflow(payload: WorkflowRequest) -> WorkflowResponse:
         error = None
 
         try:
-            import json
-
             v_json = json.loads(verification)
             if not v_json.get("success"):
                 success = False
@@ -207,6 +548,8 @@ async def run_workflow(payload: WorkflowRequest) -> WorkflowResponse:
             ],
             error=error,
         )
+    except Overloaded:
+        raise
     except Exception as e:
         return WorkflowResponse(
             success=False,
@@ -215,8 +558,82 @@ async def run_workflow(payload: WorkflowRequest) -> WorkflowResponse:
         )
 
 
-def _persist_messages(chat_id: str, uid: str, messages: list[dict]) -> None:
-    """Helper to persist messages to Firebase."""
+def _workflow_key(photos: list["str | StoredPhoto"], country: str) -> str:
+    from agents.cosmetist import WORKFLOW_PROMPT_VERSION
+
+    return workflow_cache_key(
+        [photo_digest(photo) for photo in photos], country, WORKFLOW_PROMPT_VERSION
+    )
+
+
+@chat_router.post("/workflow")
+async def run_workflow(payload: WorkflowRequest) -> WorkflowResponse:
+    """
+    Run the full initial skincare analysis workflow.
+    Returns verification, analysis, ratings, and shopping recommendations.
+    """
+    check_capacity("workflow", ("openai",))
+    photos = _resolve_photos(payload.photo_data_urls, payload.photo_hashes)
+    with (
+        admission_context(payload.uid, "workflow"),
+        usage_scope(chat_id=payload.chat_id or payload.uid),
+    ):
+        return await asyncio.to_thread(_execute_workflow, payload, photos)
+
+
+@chat_router.post("/workflow/jobs")
+async def submit_workflow_job(payload: WorkflowRequest) -> WorkflowJobResponse:
+    """
+    Queue the workflow and return immediately with a job id. Submitting the
+    same photos for the same user and chat while a job for them is running
+    attaches to that job.
+    """
+    photos = _resolve_photos(payload.photo_data_urls, payload.photo_hashes)
+    if not photos:
+        raise HTTPException(status_code=422, detail="At least one photo is required")
+
+    check_capacity("workflow", ("openai",))
+    with (
+        admission_context(payload.uid, "workflow"),
+        usage_scope(chat_id=payload.chat_id or payload.uid),
+    ):
+        job, attached = workflow_jobs.submit(
+            # The job persists to the submitter's chat, so never share it.
+            f"{payload.uid}:{payload.chat_id or payload.uid}:"
+            + _workflow_key(photos, payload.country),
+            payload.uid,
+            lambda progress: _execute_workflow(payload, photos, progress).model_dump(),
+        )
+    return WorkflowJobResponse(job_id=job.id, status=job.status, attached=attached)
+
+
+def _owned_job(job_id: str, uid: str) -> dict:
+    """The job's snapshot; 404 when it is missing or belongs to another user."""
+    snapshot = workflow_jobs.get(job_id)
+    if snapshot is None or snapshot.get("uid") != uid:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return snapshot
+
+
+@chat_router.get("/workflow/jobs/{job_id}")
+async def get_workflow_job(job_id: str, uid: str) -> WorkflowJobStatus:
+    return WorkflowJobStatus(**_owned_job(job_id, uid))
+
+
+@chat_router.get("/workflow/jobs/{job_id}/events")
+async def stream_workflow_job(job_id: str, uid: str) -> StreamingResponse:
+    """Server-sent events: one ``stage`` event per finished stage, then the outcome."""
+    _owned_job(job_id, uid)
+
+    async def event_stream():
+        async for event in workflow_jobs.events(job_id):
+            yield f"event: {event['event']}\ndata: {dumps_str(event['data'])}\n\n"
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+
+def _persist_messages(chat_id: str, uid: str, messages: list[dict]) -> int:
+    """Helper to persist messages to Firebase; returns the stored message count."""
     doc_ref = db.collection("chats").document(chat_id)
     snapshot = doc_ref.get()
 
@@ -237,9 +654,11 @@ def _persist_messages(chat_id: str, uid: str, messages: list[dict]) -> None:
         for m in messages
     ]
 
+    stored_messages = existing_messages + new_messages
     doc_ref.update(
         {
             "uid": uid,
-            "messages": existing_messages + new_messages,
+            "messages": stored_messages,
         }
     )
+    return len(stored_messages)
@@ -0,0 +1,54 @@
+from fastapi import APIRouter
+
+from agents.routing import routing_stats
+from services.accounting import usage_ledger
+from services.admission import LIMITERS
+from services.semantic_cache import semantic_cache
+from services.startup import readiness
+from utils.cache import CACHES
+from utils.serialization import FastJSONResponse
+
+health_router = APIRouter(
+    prefix="/health", tags=["health"], default_response_class=FastJSONResponse
+)
+
+
+@health_router.get("/live")
+async def live():
+    return {"status": "ok"}
+
+
+@health_router.get("/ready")
+async def ready():
+    report = readiness()
+    return FastJSONResponse(report, status_code=200 if report["ready"] else 503)
+
+
+@health_router.get("/admission")
+async def admission():
+    """Queue depth, in-flight calls and shed counts per provider."""
+    return {name: limiter.snapshot() for name, limiter in LIMITERS.items()}
+
+
+@health_router.get("/routing")
+async def routing():
+    """Per-task model usage, escalations, latency and cost."""
+    return routing_stats.snapshot()
+
+
+@health_router.get("/usage")
+async def usage():
+    """Today's tokens, tool calls, latency and cost per task in this process."""
+    return usage_ledger.snapshot()
+
+
+@health_router.get("/semantic-cache")
+async def semantic_cache_stats():
+    """Hit rate and per-hit lookup latency of the chat semantic cache."""
+    return semantic_cache.snapshot()
+
+
+@health_router.get("/caches")
+async def caches():
+    """Local and shared-tier hit counts per cache namespace."""
+    return {name: cache.stats for name, cache in CACHES.items()}
@@ -9,8 +9,11 @@ from utils.search import upload_documents as upload_documents_util
 from llm.gemini import get_gemini_embedding
 from fastapi import HTTPException
 from services.search import search_memories
+from utils.serialization import FastJSONResponse
 
-search_router = APIRouter(prefix="/search", tags=["search"])
+search_router = APIRouter(
+    prefix="/search", tags=["search"], default_response_class=FastJSONResponse
+)
 
 
 @search_router.post("/search-vector-db")
@@ -0,0 +1,46 @@
+"""Per-user token, tool-call and cost accounting."""
+
+import asyncio
+import hmac
+from datetime import date
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+
+from schema.usage import SetBudgetRequest, UsageBudget, UsageReport
+from services.accounting import usage_ledger
+from utils.env import get_env
+
+# Shared secret for budget changes; without it they are disabled.
+USAGE_ADMIN_TOKEN = get_env("USAGE_ADMIN_TOKEN")
+
+usage_router = APIRouter(prefix="/usage", tags=["usage"])
+
+
+def require_admin(x_admin_token: str | None = Header(None)) -> None:
+    if not USAGE_ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Budget changes are disabled")
+    if not x_admin_token or not hmac.compare_digest(
+        x_admin_token.encode(), USAGE_ADMIN_TOKEN.encode()
+    ):
+        raise HTTPException(status_code=401, detail="Invalid admin token")
+
+
+@usage_router.get("/{uid}")
+async def get_usage(uid: str, day: date | None = Query(None)) -> UsageReport:
+    """Today's (or ``day``'s) usage for ``uid``, per chat and per agent task."""
+    report = await asyncio.to_thread(
+        usage_ledger.usage, uid, day.isoformat() if day else None
+    )
+    return UsageReport(**report)
+
+
+@usage_router.put("/{uid}/budget", dependencies=[Depends(require_admin)])
+async def set_budget(uid: str, payload: SetBudgetRequest) -> UsageBudget:
+    """Override ``uid``'s daily budget; needs the ``X-Admin-Token`` header."""
+    await asyncio.to_thread(usage_ledger.set_budget, uid, payload.daily_usd)
+    spent = await asyncio.to_thread(usage_ledger.spent, uid)
+    return UsageBudget(
+        daily_usd=payload.daily_usd,
+        spent_usd=spent,
+        state=usage_ledger.budget_state(uid),
+    )
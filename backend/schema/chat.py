@@ -1,3 +1,5 @@
+from typing import Literal
+
 from pydantic import BaseModel, Field
 from datetime import datetime
 
@@ -38,21 +40,72 @@ class ChatTurnRequest(BaseModel):
     uid: str
     chat_id: str | None = None
     photo_data_urls: list[str] = Field(default_factory=list)
+    photo_hashes: list[str] = Field(
+        default_factory=list,
+        description="sha256 hashes returned by /chat/photos",
+    )
     history: list[ConversationTurnSchema] = Field(default_factory=list)
     message: str
     country: str = "us"
+    response_mode: Literal["full", "delta"] = Field(
+        "full",
+        description="'delta' returns only the new assistant message, not the history",
+    )
+    include_metadata: bool = Field(
+        False, description="In delta mode, also return tool calls and products"
+    )
 
 
 class ChatTurnResponse(BaseModel):
     reply: str
     history: list[ConversationTurnSchema]
+    history_version: int = Field(
+        0,
+        description=(
+            "Messages stored for the chat after this turn; compare with the "
+            "client's count plus 2 to detect writes from elsewhere"
+        ),
+    )
+
+
+class ToolCallSummary(BaseModel):
+    name: str
+    query: str | None = None
+    results: int = 0
+
+
+class ProductSummary(BaseModel):
+    title: str
+    link: str
+    source: str | None = None
+    price: str | None = None
+    rating: float | None = None
+    imageUrl: str | None = None
+
+
+class ChatTurnDeltaResponse(BaseModel):
+    message: ConversationTurnSchema
+    history_version: int = Field(
+        ...,
+        description=(
+            "Messages stored for the chat after this turn. A client that held N "
+            "messages is in sync when this is N + 2; otherwise it should reload "
+            "the history from /chat/get-messages"
+        ),
+    )
+    tools: list[ToolCallSummary] | None = None
+    products: list[ProductSummary] | None = None
 
 
 # Initial Workflow (full scan analysis)
 class WorkflowRequest(BaseModel):
     uid: str
     chat_id: str | None = None
-    photo_data_urls: list[str]
+    photo_data_urls: list[str] = Field(default_factory=list)
+    photo_hashes: list[str] = Field(
+        default_factory=list,
+        description="sha256 hashes returned by /chat/photos",
+    )
     country: str = "us"
 
 
@@ -64,3 +117,30 @@ class WorkflowResponse(BaseModel):
     shopping: str | None = None
     history: list[ConversationTurnSchema]
     error: str | None = None
+
+
+# Workflow jobs (async mode with progress)
+class WorkflowJobResponse(BaseModel):
+    job_id: str
+    status: str
+    attached: bool = Field(
+        False, description="True when an in-flight job for the same photos was reused"
+    )
+
+
+class WorkflowJobStatus(BaseModel):
+    job_id: str
+    status: str
+    stages: dict[str, str | None] = Field(default_factory=dict)
+    result: WorkflowResponse | None = None
+    error: str | None = None
+
+
+# Binary photo upload
+class UploadedPhoto(BaseModel):
+    hash: str
+    content_type: str
+
+
+class PhotoUploadResponse(BaseModel):
+    photos: list[UploadedPhoto]
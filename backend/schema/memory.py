@@ -8,6 +8,8 @@ class MemorySearchRequest(BaseModel):
     uid: str
     question: str
     timestamp: datetime | None = None
+    # Generate several probe queries and retrieve them in one batched pass.
+    fan_out: bool | None = None
 
 
 class MemorySearchResponse(BaseModel):
@@ -0,0 +1,22 @@
+from pydantic import BaseModel, Field
+
+
+class UsageBudget(BaseModel):
+    daily_usd: float = Field(..., ge=0, description="0 removes the limit")
+    spent_usd: float = 0.0
+    state: str | None = Field(
+        None, description="'ok', 'degraded' or 'exhausted'; only reported for today"
+    )
+
+
+class UsageReport(BaseModel):
+    uid: str
+    day: str
+    totals: dict[str, float]
+    chats: dict[str, dict[str, float]]
+    tasks: dict[str, dict[str, float]]
+    budget: UsageBudget
+
+
+class SetBudgetRequest(BaseModel):
+    daily_usd: float = Field(..., ge=0, description="0 removes the limit")
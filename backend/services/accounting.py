@@ -0,0 +1,376 @@
+"""Per-user token, tool-call and latency accounting with daily budgets.
+
+Provider clients report each completion's ``usage`` block (through
+``agents.routing.record_usage``) and every Serper lookup here. Counters are
+kept in memory per uid, chat and agent task; the uid comes from the
+admission context, chat and task from ``usage_scope``. Every
+``USAGE_FLUSH_INTERVAL_SECONDS`` the deltas are written to Firestore as
+increments on one ``usage/{uid}_{day}`` document.
+
+Budgets degrade instead of refusing: past ``USAGE_DEGRADE_AT`` of the daily
+budget, routed tasks stay on their cheapest tier and chat turns use the
+small model; once the budget is spent, chat turns also drop photos and live
+shopping searches. Each flush also re-reads budget overrides and the stored
+spend of users this process has seen, so workers notice each other's spend
+within one interval.
+"""
+
+import asyncio
+import contextvars
+import logging
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, Iterator
+
+from services.admission import current_caller
+from services.startup import LazyProvider
+from utils.env import get_env
+
+logger = logging.getLogger(__name__)
+
+db = LazyProvider("firestore")
+
+FLUSH_INTERVAL_SECONDS = float(get_env("USAGE_FLUSH_INTERVAL_SECONDS", "60"))
+# Default daily spend per uid in USD; 0 disables budgets.
+DAILY_BUDGET_USD = float(get_env("USAGE_DAILY_BUDGET_USD", "0"))
+# Fraction of the budget after which calls are downgraded.
+DEGRADE_AT = float(get_env("USAGE_DEGRADE_AT", "0.8"))
+# Prompt tokens one image adds; OpenAI folds them into prompt_tokens.
+IMAGE_TOKEN_ESTIMATE = int(get_env("USAGE_IMAGE_TOKENS", "765"))
+SERPER_COST_USD = float(get_env("SERPER_COST_USD", "0.001"))
+
+COUNTERS = (
+    "requests",
+    "prompt_tokens",
+    "completion_tokens",
+    "cached_tokens",
+    "image_tokens",
+    "serper_calls",
+    "serper_cache_hits",
+    "seconds",
+    "cost",
+)
+
+
+@dataclass(frozen=True)
+class UsageScope:
+    chat_id: str = "-"
+    task: str = "other"
+
+
+_scope: contextvars.ContextVar[UsageScope] = contextvars.ContextVar(
+    "usage_scope", default=UsageScope()
+)
+
+
+@contextmanager
+def usage_scope(
+    *, chat_id: str | None = None, task: str | None = None
+) -> Iterator[UsageScope]:
+    """Attribute usage inside the block to ``chat_id`` and/or ``task``."""
+    current = _scope.get()
+    scope = UsageScope(chat_id or current.chat_id, task or current.task)
+    token = _scope.set(scope)
+    try:
+        yield scope
+    finally:
+        _scope.reset(token)
+
+
+def count_images(messages: list[dict]) -> int:
+    return sum(
+        1
+        for message in messages
+        if isinstance(message.get("content"), list)
+        for part in message["content"]
+        if part.get("type") == "image_url"
+    )
+
+
+def _today() -> str:
+    return datetime.now(timezone.utc).date().isoformat()
+
+
+def _zero() -> dict[str, float]:
+    return dict.fromkeys(COUNTERS, 0)
+
+
+def _add_into(target: dict[str, float], values: dict[str, float]) -> None:
+    for name, value in values.items():
+        target[name] = target.get(name, 0) + value
+
+
+def _increments(values: Any) -> Any:
+    from google.cloud import firestore
+
+    if isinstance(values, dict):
+        return {key: _increments(value) for key, value in values.items()}
+    return firestore.Increment(values)
+
+
+class UsageLedger:
+    """In-memory usage counters, periodically flushed to Firestore."""
+
+    def __init__(
+        self,
+        daily_budget: float = DAILY_BUDGET_USD,
+        degrade_at: float = DEGRADE_AT,
+        interval: float = FLUSH_INTERVAL_SECONDS,
+    ):
+        self.daily_budget = daily_budget
+        self.degrade_at = degrade_at
+        self.interval = interval
+        self._lock = threading.Lock()
+        # (day, uid, chat_id, task) -> counters; _pending holds unflushed deltas.
+        self._totals: dict[tuple[str, str, str, str], dict[str, float]] = {}
+        self._pending: dict[tuple[str, str, str, str], dict[str, float]] = {}
+        # (day, uid) -> cost recorded by this process / already flushed by it /
+        # stored by other processes before this one first checked the budget.
+        self._spent: dict[tuple[str, str], float] = {}
+        self._flushed_cost: dict[tuple[str, str], float] = {}
+        self._baseline: dict[tuple[str, str], float] = {}
+        self._budgets: dict[str, float] = {}
+        self._task: asyncio.Task | None = None
+
+    def _add(self, values: dict[str, float]) -> None:
+        uid = current_caller().uid
+        scope = _scope.get()
+        day = _today()
+        key = (day, uid, scope.chat_id, scope.task)
+        with self._lock:
+            for table in (self._totals, self._pending):
+                _add_into(table.setdefault(key, _zero()), values)
+            spent_key = (day, uid)
+            self._spent[spent_key] = self._spent.get(spent_key, 0.0) + values.get(
+                "cost", 0.0
+            )
+
+    def record_completion(
+        self,
+        usage: dict[str, Any],
+        *,
+        cost: float,
+        seconds: float = 0.0,
+        images: int = 0,
+    ) -> None:
+        details = usage.get("prompt_tokens_details") or {}
+        self._add(
+            {
+                "requests": 1,
+                "prompt_tokens": usage.get("prompt_tokens", 0) or 0,
+                "completion_tokens": usage.get("completion_tokens", 0) or 0,
+                "cached_tokens": details.get("cached_tokens", 0) or 0,
+                "image_tokens": images * IMAGE_TOKEN_ESTIMATE,
+                "seconds": seconds,
+                "cost": cost,
+            }
+        )
+
+    def record_serper(self, *, seconds: float = 0.0, cached: bool = False) -> None:
+        if cached:
+            self._add({"serper_cache_hits": 1})
+        else:
+            self._add({"serper_calls": 1, "seconds": seconds, "cost": SERPER_COST_USD})
+
+    # Budgets
+
+    def budget_for(self, uid: str) -> float:
+        return self._budgets.get(uid, self.daily_budget)
+
+    def set_budget(self, uid: str, daily_usd: float) -> None:
+        db.collection("usage_budgets").document(uid).set({"daily_usd": daily_usd})
+        self._budgets[uid] = daily_usd
+
+    def load_budgets(self) -> int:
+        """Read per-user budget overrides; returns how many were found."""
+        budgets = {
+            doc.id: float(doc.to_dict().get("daily_usd", self.daily_budget))
+            for doc in db.collection("usage_budgets").stream()
+        }
+        self._budgets = budgets
+        return len(budgets)
+
+    def _stored_cost(self, uid: str, day: str) -> float | None:
+        try:
+            snapshot = db.collection("usage").document(f"{uid}_{day}").get()
+        except Exception as exc:
+            logger.warning("Could not load usage for %s: %s", uid, exc)
+            return None
+        if not snapshot.exists:
+            return 0.0
+        totals = (snapshot.to_dict() or {}).get("totals") or {}
+        return float(totals.get("cost", 0.0))
+
+    def _set_baseline(self, key: tuple[str, str], stored: float) -> None:
+        with self._lock:
+            # What this process flushed so far is already in ``stored``.
+            self._baseline[key] = stored - self._flushed_cost.get(key, 0.0)
+
+    def spent(self, uid: str) -> float:
+        """Today's spend for ``uid`` across processes, as far as this one knows."""
+        key = (_today(), uid)
+        if key not in self._baseline:
+            self._set_baseline(key, self._stored_cost(uid, key[0]) or 0.0)
+        with self._lock:
+            return self._baseline[key] + self._spent.get(key, 0.0)
+
+    def refresh(self) -> None:
+        """Re-read budget overrides and other processes' spend for known users."""
+        try:
+            self.load_budgets()
+        except Exception as exc:
+            logger.warning("Could not load usage budgets: %s", exc)
+        today = _today()
+        with self._lock:
+            keys = [key for key in self._baseline if key[0] == today]
+        for key in keys:
+            stored = self._stored_cost(key[1], today)
+            if stored is not None:
+                self._set_baseline(key, stored)
+
+    def budget_state(self, uid: str | None = None) -> str:
+        uid = uid or current_caller().uid
+        budget = self.budget_for(uid)
+        if budget <= 0 or uid == "anonymous":
+            return "ok"
+        fraction = self.spent(uid) / budget
+        if fraction >= 1:
+            return "exhausted"
+        return "degraded" if fraction >= self.degrade_at else "ok"
+
+    # Reporting
+
+    def usage(self, uid: str, day: str | None = None) -> dict[str, Any]:
+        """Stored counters for ``uid`` on ``day`` plus deltas not yet flushed."""
+        day = day or _today()
+        stored: dict[str, Any] | None = {}
+        try:
+            snapshot = db.collection("usage").document(f"{uid}_{day}").get()
+            if snapshot.exists:
+                stored = snapshot.to_dict() or {}
+        except Exception as exc:
+            logger.warning("Could not load usage for %s: %s", uid, exc)
+            stored = None
+
+        report: dict[str, Any] = {
+            "uid": uid,
+            "day": day,
+            "totals": _zero(),
+            "chats": {},
+            "tasks": {},
+        }
+        for section in ("totals", "chats", "tasks"):
+            values = (stored or {}).get(section) or {}
+            if section == "totals":
+                _add_into(report["totals"], values)
+            else:
+                for name, counters in values.items():
+                    _add_into(report[section].setdefault(name, _zero()), counters)
+
+        with self._lock:
+            # Without storage, fall back to what this process has seen.
+            source = self._totals if stored is None else self._pending
+            local = [
+                (chat_id, task, dict(counters))
+                for (d, u, chat_id, task), counters in source.items()
+                if d == day and u == uid
+            ]
+        for chat_id, task, counters in local:
+            _add_into(report["totals"], counters)
+            _add_into(report["chats"].setdefault(chat_id, _zero()), counters)
+            _add_into(report["tasks"].setdefault(task, _zero()), counters)
+
+        budget = self.budget_for(uid)
+        report["budget"] = {
+            "daily_usd": budget,
+            "spent_usd": report["totals"]["cost"],
+            "state": self.budget_state(uid) if day == _today() else None,
+        }
+        return report
+
+    def snapshot(self) -> dict[str, dict[str, float]]:
+        """Today's totals per task in this process."""
+        today = _today()
+        tasks: dict[str, dict[str, float]] = {}
+        with self._lock:
+            for (day, _, _, task), counters in self._totals.items():
+                if day == today:
+                    _add_into(tasks.setdefault(task, _zero()), counters)
+        return tasks
+
+    # Persistence
+
+    def flush(self) -> int:
+        """Write pending deltas as increments; returns the documents written."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        groups: dict[tuple[str, str], list] = {}
+        for key, counters in pending.items():
+            groups.setdefault(key[:2], []).append((key, counters))
+
+        written = 0
+        for (day, uid), entries in groups.items():
+            document: dict[str, Any] = {"totals": {}, "chats": {}, "tasks": {}}
+            for (_, _, chat_id, task), counters in entries:
+                values = {name: value for name, value in counters.items() if value}
+                _add_into(document["totals"], values)
+                _add_into(document["chats"].setdefault(chat_id, {}), values)
+                _add_into(document["tasks"].setdefault(task, {}), values)
+            try:
+                db.collection("usage").document(f"{uid}_{day}").set(
+                    {"uid": uid, "day": day, **_increments(document)}, merge=True
+                )
+            except Exception as exc:
+                logger.warning("Failed to flush usage for %s: %s", uid, exc)
+                with self._lock:
+                    for key, counters in entries:
+                        _add_into(self._pending.setdefault(key, _zero()), counters)
+                continue
+            with self._lock:
+                self._flushed_cost[(day, uid)] = self._flushed_cost.get(
+                    (day, uid), 0.0
+                ) + document["totals"].get("cost", 0.0)
+            written += 1
+        self._prune()
+        return written
+
+    def _prune(self) -> None:
+        today = _today()
+        with self._lock:
+            for table in (
+                self._totals,
+                self._spent,
+                self._flushed_cost,
+                self._baseline,
+            ):
+                for key in [k for k in table if k[0] != today]:
+                    del table[key]
+
+    async def _loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            await asyncio.to_thread(self.flush)
+            await asyncio.to_thread(self.refresh)
+
+    async def start(self) -> None:
+        try:
+            await asyncio.to_thread(self.load_budgets)
+        except Exception as exc:
+            logger.warning("Could not load usage budgets: %s", exc)
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await asyncio.to_thread(self.flush)
+
+
+usage_ledger = UsageLedger()
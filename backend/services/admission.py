@@ -0,0 +1,256 @@
+"""Admission control for outbound provider calls.
+
+Every OpenAI, OpenRouter, Gemini and Serper request passes through a
+per-provider limiter that combines:
+
+- a token bucket sized to the provider quota plus a concurrency cap,
+- start-time fair queuing across uids, so one uid's burst waits behind
+  everyone else's first request,
+- strict priority classes: interactive turns, then workflows, then
+  background memory writes,
+- load shedding: if the estimated queue wait exceeds the class's latency
+  SLO the call fails fast with ``Overloaded`` (served as 503 + Retry-After).
+
+The caller identity and class travel in a context variable set with
+``admission_context`` at the request boundary.
+"""
+
+import contextvars
+import heapq
+import itertools
+import math
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Iterator
+
+from utils.env import get_env
+
+PRIORITIES = ("interactive", "workflow", "background")
+# Longest acceptable queue wait per class before requests are shed.
+LATENCY_SLO_SECONDS = {
+    "interactive": float(get_env("ADMISSION_INTERACTIVE_SLO_SECONDS", "5")),
+    "workflow": float(get_env("ADMISSION_WORKFLOW_SLO_SECONDS", "30")),
+    "background": float(get_env("ADMISSION_BACKGROUND_SLO_SECONDS", "120")),
+}
+# (requests per second, max concurrent requests) per provider.
+DEFAULT_LIMITS = {
+    "openai": (5.0, 8),
+    "openrouter": (3.0, 6),
+    "gemini": (20.0, 16),
+    "serper": (5.0, 4),
+}
+# Service time assumed until a provider has completed a few calls.
+INITIAL_SERVICE_SECONDS = 2.0
+
+
+@dataclass(frozen=True)
+class Caller:
+    uid: str = "anonymous"
+    priority: str = "interactive"
+    weight: float = 1.0
+
+
+_caller: contextvars.ContextVar[Caller] = contextvars.ContextVar(
+    "admission_caller", default=Caller()
+)
+
+
+class Overloaded(RuntimeError):
+    """Raised when a provider queue is past its latency SLO."""
+
+    def __init__(self, provider: str, retry_after: float):
+        super().__init__(f"{provider} is overloaded; retry in {retry_after:.0f}s")
+        self.provider = provider
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+@contextmanager
+def admission_context(
+    uid: str | None,
+    priority: str = "interactive",
+    weight: float = 1.0,
+) -> Iterator[Caller]:
+    """Attribute provider calls made inside the block to ``uid`` and ``priority``."""
+    if priority not in PRIORITIES:
+        raise ValueError(f"priority must be one of {PRIORITIES}")
+    caller = Caller(uid or "anonymous", priority, weight)
+    token = _caller.set(caller)
+    try:
+        yield caller
+    finally:
+        _caller.reset(token)
+
+
+def current_caller() -> Caller:
+    return _caller.get()
+
+
+class TokenBucket:
+    """Classic token bucket; not thread-safe on its own."""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def deficit_seconds(self, tokens: float = 1.0) -> float:
+        self._refill()
+        return max(0.0, (tokens - self._tokens) / self.rate)
+
+    def try_take(self) -> float:
+        """Take a token and return 0, or return the seconds until one is free."""
+        wait = self.deficit_seconds()
+        if wait == 0:
+            self._tokens -= 1
+        return wait
+
+
+@dataclass(order=True)
+class _Ticket:
+    rank: int
+    start_tag: float
+    seq: int
+    uid: str = field(compare=False)
+    cancelled: bool = field(default=False, compare=False)
+
+
+class ProviderLimiter:
+    """Rate, concurrency, fairness and shedding for one upstream provider."""
+
+    def __init__(self, name: str, rate: float, concurrency: int):
+        self.name = name
+        self.concurrency = concurrency
+        self.bucket = TokenBucket(rate, burst=max(1.0, rate * 2))
+        self._cond = threading.Condition()
+        self._queue: list[_Ticket] = []
+        self._seq = itertools.count()
+        self._virtual_time = 0.0
+        self._finish_tags: dict[str, float] = {}
+        self._in_flight = 0
+        self._service_seconds = INITIAL_SERVICE_SECONDS
+        self.stats = {"admitted": 0, "shed": 0, "timed_out": 0}
+
+    def _waiting_ahead(self, rank: int) -> int:
+        return sum(1 for t in self._queue if not t.cancelled and t.rank <= rank)
+
+    def estimated_wait(self, priority: str = "interactive") -> float:
+        """Seconds a new request of ``priority`` would likely queue for."""
+        with self._cond:
+            return self._estimate(PRIORITIES.index(priority))
+
+    def check(self, priority: str) -> None:
+        """Raise Overloaded if a new ``priority`` request would miss its SLO."""
+        with self._cond:
+            estimate = self._estimate(PRIORITIES.index(priority))
+            if estimate > LATENCY_SLO_SECONDS[priority]:
+                self.stats["shed"] += 1
+                raise Overloaded(self.name, estimate)
+
+    def _estimate(self, rank: int) -> float:
+        ahead = self._waiting_ahead(rank)
+        busy = max(0, self._in_flight + ahead - self.concurrency + 1)
+        by_concurrency = busy * self._service_seconds / self.concurrency
+        return max(by_concurrency, self.bucket.deficit_seconds(ahead + 1))
+
+    @contextmanager
+    def acquire(self) -> Iterator[None]:
+        caller = current_caller()
+        rank = PRIORITIES.index(caller.priority)
+        slo = LATENCY_SLO_SECONDS[caller.priority]
+
+        with self._cond:
+            estimate = self._estimate(rank)
+            if estimate > slo:
+                self.stats["shed"] += 1
+                raise Overloaded(self.name, estimate)
+
+            start = max(self._virtual_time, self._finish_tags.get(caller.uid, 0.0))
+            self._finish_tags[caller.uid] = start + 1.0 / caller.weight
+            ticket = _Ticket(rank, start, next(self._seq), caller.uid)
+            heapq.heappush(self._queue, ticket)
+
+            deadline = time.monotonic() + slo
+            while True:
+                while self._queue and self._queue[0].cancelled:
+                    heapq.heappop(self._queue)
+                remaining = deadline - time.monotonic()
+                if self._queue[0] is ticket and self._in_flight < self.concurrency:
+                    wait = self.bucket.try_take()
+                    if wait == 0:
+                        heapq.heappop(self._queue)
+                        self._virtual_time = max(self._virtual_time, ticket.start_tag)
+                        self._in_flight += 1
+                        self.stats["admitted"] += 1
+                        self._prune_tags()
+                        # The next ticket is now at the head and may proceed.
+                        self._cond.notify_all()
+                        break
+                else:
+                    wait = remaining
+                if remaining <= 0:
+                    ticket.cancelled = True
+                    self.stats["timed_out"] += 1
+                    self._cond.notify_all()
+                    raise Overloaded(self.name, self._estimate(rank) or 1)
+                self._cond.wait(min(wait, remaining))
+
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            elapsed = time.monotonic() - started
+            with self._cond:
+                self._in_flight -= 1
+                self._service_seconds = 0.8 * self._service_seconds + 0.2 * elapsed
+                self._cond.notify_all()
+
+    def _prune_tags(self) -> None:
+        if len(self._finish_tags) > 1024:
+            self._finish_tags = {
+                uid: tag
+                for uid, tag in self._finish_tags.items()
+                if tag > self._virtual_time
+            }
+
+    def snapshot(self) -> dict:
+        with self._cond:
+            return {
+                "in_flight": self._in_flight,
+                "queued": self._waiting_ahead(len(PRIORITIES)),
+                "service_seconds": round(self._service_seconds, 3),
+                **self.stats,
+            }
+
+
+def _build_limiters() -> dict[str, ProviderLimiter]:
+    limiters = {}
+    for name, (rate, concurrency) in DEFAULT_LIMITS.items():
+        prefix = f"{name.upper()}_"
+        limiters[name] = ProviderLimiter(
+            name,
+            rate=float(get_env(prefix + "REQUESTS_PER_SECOND", str(rate))),
+            concurrency=int(get_env(prefix + "MAX_CONCURRENCY", str(concurrency))),
+        )
+    return limiters
+
+
+LIMITERS = _build_limiters()
+
+
+def admit(provider: str):
+    """Context manager wrapping one outbound call to ``provider``."""
+    return LIMITERS[provider].acquire()
+
+
+def check_capacity(priority: str, providers: tuple[str, ...] = tuple(LIMITERS)):
+    """Raise Overloaded up front if any provider is already past the SLO."""
+    for name in providers:
+        LIMITERS[name].check(priority)
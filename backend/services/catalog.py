@@ -0,0 +1,376 @@
+"""Local product catalog built from Serper shopping results.
+
+Products are deduplicated by ``productId`` and ``link``. Price, rating,
+rating count, country and last-seen time are kept as NumPy columns. Title
+and source tokens go into an inverted index, so lookups are a few postings
+merges and vectorized filters instead of a Serper call.
+
+Ingesting only marks the catalog dirty; it is written every
+``PRODUCT_CATALOG_SAVE_SECONDS`` (and on shutdown) as one ``catalog.npz``
+replaced atomically, after merging rows other workers saved. The inverted
+index is rebuilt from the products on load.
+"""
+
+import asyncio
+import logging
+import math
+import os
+import re
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+
+from utils.env import get_env
+from utils.serialization import dumps, loads
+from utils.ranking import tokenize
+
+logger = logging.getLogger(__name__)
+
+CATALOG_DIR = Path(
+    get_env(
+        "PRODUCT_CATALOG_DIR",
+        str(Path(tempfile.gettempdir()) / "glowly-catalog"),
+    )
+)
+# Listings older than this are ignored so prices and stock stay current.
+CATALOG_MAX_AGE_SECONDS = float(
+    get_env("PRODUCT_CATALOG_MAX_AGE_SECONDS", str(14 * 24 * 3600))
+)
+CATALOG_FILE = "catalog.npz"
+SAVE_INTERVAL_SECONDS = float(get_env("PRODUCT_CATALOG_SAVE_SECONDS", "30"))
+# Fraction of query tokens a product must match to be returned.
+MIN_MATCH_FRACTION = 0.6
+PRODUCT_FIELDS = (
+    "title",
+    "source",
+    "link",
+    "price",
+    "imageUrl",
+    "rating",
+    "ratingCount",
+    "productId",
+)
+_PRICE = re.compile(r"\d+(?:[.,]\d+)*")
+
+
+def parse_price(price: Any) -> float:
+    """Numeric price from strings like "$1,299.00"; NaN when there is none."""
+    if isinstance(price, (int, float)):
+        return float(price)
+    match = _PRICE.search(str(price or ""))
+    if not match:
+        return math.nan
+    text = match.group(0)
+    # "12,99" is a decimal comma; "1,299" and "1,299.00" are thousands.
+    if "," in text and "." not in text and len(text.rsplit(",", 1)[1]) == 2:
+        text = text.replace(",", ".")
+    return float(text.replace(",", ""))
+
+
+def _number(value: Any, default: float = math.nan) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def _product_tokens(product: dict[str, Any]) -> set[str]:
+    return set(tokenize(f"{product.get('title', '')} {product.get('source', '')}"))
+
+
+class ProductCatalog:
+    """Append/update store with an inverted index and columnar filters."""
+
+    def __init__(
+        self,
+        directory: Path = CATALOG_DIR,
+        interval: float = SAVE_INTERVAL_SECONDS,
+    ):
+        self.directory = Path(directory)
+        self.interval = interval
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._dirty = False
+        self._disk_mtime: int | None = None
+        # Serializes writers so an older snapshot never replaces a newer one.
+        self._flush_lock = threading.Lock()
+        self._task: asyncio.Task | None = None
+        self._products: list[dict[str, Any]] = []
+        self._by_id: dict[str, int] = {}
+        self._by_link: dict[str, int] = {}
+        self._postings: dict[str, set[int]] = {}
+        self._price = np.empty(0, dtype=np.float32)
+        self._rating = np.empty(0, dtype=np.float32)
+        self._rating_count = np.empty(0, dtype=np.int32)
+        self._seen_at = np.empty(0, dtype=np.float64)
+        self._country = np.empty(0, dtype="U8")
+
+    def __len__(self) -> int:
+        self._ensure_loaded()
+        return len(self._products)
+
+    def _ensure_loaded(self) -> None:
+        with self._lock:
+            if self._loaded:
+                return
+            self._loaded = True
+            saved = self._read()
+            if saved is not None:
+                self._merge(*saved)
+
+    def _read(self) -> tuple[list[dict[str, Any]], dict[str, np.ndarray]] | None:
+        path = self.directory / CATALOG_FILE
+        try:
+            mtime = path.stat().st_mtime_ns
+            with np.load(path) as data:
+                products = loads(data["products"].tobytes())
+                columns = {name: data[name] for name in data.files}
+        except (FileNotFoundError, ValueError, KeyError) as exc:
+            if not isinstance(exc, FileNotFoundError):
+                logger.warning("Ignoring unreadable product catalog: %s", exc)
+            return None
+        self._disk_mtime = mtime
+        if len(columns["price"]) != len(products):
+            logger.warning("Product catalog columns out of sync; ignoring it")
+            return None
+        return products, columns
+
+    def _merge(
+        self, products: list[dict[str, Any]], columns: dict[str, np.ndarray]
+    ) -> None:
+        """Take saved rows that are new here or were seen more recently."""
+        for row, product in enumerate(products):
+            if not product.get("title") or not product.get("link"):
+                continue
+            local = self._by_id.get(product.get("productId") or "")
+            if local is None:
+                local = self._by_link.get(product["link"])
+            if local is not None and self._seen_at[local] >= columns["seen_at"][row]:
+                continue
+            self._put(
+                product,
+                price=columns["price"][row],
+                rating=columns["rating"][row],
+                rating_count=columns["rating_count"][row],
+                seen_at=columns["seen_at"][row],
+                country=columns["country"][row],
+            )
+
+    def ingest(self, results: list[dict[str, Any]], country: str = "us") -> int:
+        """Add or refresh Serper shopping results; returns how many were new."""
+        self._ensure_loaded()
+        now = time.time()
+        added = 0
+        with self._lock:
+            for result in results:
+                product = {k: result[k] for k in PRODUCT_FIELDS if k in result}
+                if not product.get("title") or not product.get("link"):
+                    continue
+                added += self._put(
+                    product,
+                    price=parse_price(product.get("price")),
+                    rating=_number(product.get("rating")),
+                    rating_count=int(_number(product.get("ratingCount"), 0)),
+                    seen_at=now,
+                    country=country.lower(),
+                )
+            self._dirty = True
+        return added
+
+    def _put(
+        self,
+        product: dict[str, Any],
+        *,
+        price: float,
+        rating: float,
+        rating_count: int,
+        seen_at: float,
+        country: str,
+    ) -> bool:
+        """Insert or replace the row for ``product``; returns whether it is new."""
+        row = self._by_id.get(product.get("productId") or "")
+        if row is None:
+            row = self._by_link.get(product["link"])
+        added = row is None
+        if added:
+            row = len(self._products)
+            self._products.append(product)
+            self._grow()
+        else:
+            previous = self._products[row]
+            # Serper omits productId on some listings; keep the known one.
+            if not product.get("productId") and previous.get("productId"):
+                product["productId"] = previous["productId"]
+            for token in _product_tokens(previous):
+                self._postings.get(token, set()).discard(row)
+            self._products[row] = product
+
+        if product.get("productId"):
+            self._by_id[product["productId"]] = row
+        self._by_link[product["link"]] = row
+        for token in _product_tokens(product):
+            self._postings.setdefault(token, set()).add(row)
+        self._price[row] = price
+        self._rating[row] = rating
+        self._rating_count[row] = rating_count
+        self._seen_at[row] = seen_at
+        self._country[row] = country
+        return added
+
+    def _grow(self) -> None:
+        """Make room for one more row, doubling column capacity when full."""
+        count = len(self._products)
+        if count <= len(self._price):
+            return
+        capacity = max(64, 2 * len(self._price))
+
+        def resized(column: np.ndarray, fill) -> np.ndarray:
+            grown = np.full(capacity, fill, dtype=column.dtype)
+            grown[: len(column)] = column
+            return grown
+
+        self._price = resized(self._price, np.nan)
+        self._rating = resized(self._rating, np.nan)
+        self._rating_count = resized(self._rating_count, 0)
+        self._seen_at = resized(self._seen_at, 0.0)
+        self._country = resized(self._country, "")
+
+    def flush(self) -> bool:
+        """Write the catalog if it changed; returns whether a file was written.
+
+        Rows other workers saved since this one last read the file are merged
+        in first, so workers share listings instead of overwriting each other.
+        """
+        self._ensure_loaded()
+        with self._flush_lock:
+            self._merge_from_disk()
+            return self._flush()
+
+    def _merge_from_disk(self) -> None:
+        try:
+            mtime = (self.directory / CATALOG_FILE).stat().st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime == self._disk_mtime:
+            return
+        saved = self._read()
+        if saved is None:
+            return
+        with self._lock:
+            self._merge(*saved)
+            # The file lacks rows only this worker has; write them back.
+            if len(self._products) > len(saved[0]):
+                self._dirty = True
+
+    def _flush(self) -> bool:
+        with self._lock:
+            if not self._dirty:
+                return False
+            count = len(self._products)
+            arrays = {
+                "products": np.frombuffer(dumps(self._products), dtype=np.uint8),
+                "price": self._price[:count].copy(),
+                "rating": self._rating[:count].copy(),
+                "rating_count": self._rating_count[:count].copy(),
+                "seen_at": self._seen_at[:count].copy(),
+                "country": self._country[:count].copy(),
+            }
+            self._dirty = False
+
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            fd, tmp_name = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as handle:
+                    np.savez(handle, **arrays)
+                # A rename keeps the mtime; read it before another worker can
+                # replace the file again.
+                mtime = os.stat(tmp_name).st_mtime_ns
+                os.replace(tmp_name, self.directory / CATALOG_FILE)
+                self._disk_mtime = mtime
+            except BaseException:
+                Path(tmp_name).unlink(missing_ok=True)
+                raise
+        except Exception:
+            with self._lock:
+                self._dirty = True
+            raise
+        return True
+
+    async def _loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await asyncio.to_thread(self.flush)
+            except Exception as exc:
+                logger.warning("Failed to save product catalog: %s", exc)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        try:
+            await asyncio.to_thread(self.flush)
+        except Exception as exc:
+            logger.warning("Failed to save product catalog: %s", exc)
+
+    def search(
+        self,
+        query: str,
+        *,
+        country: str = "us",
+        limit: int = 10,
+        max_price: float | None = None,
+        min_rating: float | None = None,
+    ) -> list[dict[str, Any]]:
+        """Products matching most query tokens, best match and rating first."""
+        self._ensure_loaded()
+        tokens = sorted(set(tokenize(query)))
+        if not tokens:
+            return []
+
+        with self._lock:
+            count = len(self._products)
+            postings = [
+                np.fromiter(self._postings[t], dtype=np.int64)
+                for t in tokens
+                if self._postings.get(t)
+            ]
+            if not postings:
+                return []
+            matches = np.bincount(np.concatenate(postings), minlength=count)
+            coverage = matches / len(tokens)
+
+            price, rating = self._price[:count], self._rating[:count]
+            keep = coverage >= MIN_MATCH_FRACTION
+            keep &= self._country[:count] == country.lower()
+            keep &= self._seen_at[:count] >= time.time() - CATALOG_MAX_AGE_SECONDS
+            if max_price is not None:
+                keep &= price <= max_price
+            if min_rating is not None:
+                keep &= rating >= min_rating
+
+            rows = np.flatnonzero(keep)
+            rating = np.nan_to_num(rating[rows], nan=0.0) / 5
+            popularity = np.log1p(self._rating_count[rows]) / 10
+            scores = coverage[rows] + 0.1 * rating + 0.05 * popularity
+            order = rows[np.argsort(-scores, kind="stable")][:limit]
+            return [
+                {**self._products[row], "position": position}
+                for position, row in enumerate(order, start=1)
+            ]
+
+
+product_catalog = ProductCatalog()
@@ -0,0 +1,179 @@
+"""Server-held state for WebSocket chat sessions.
+
+A session loads the chat's history once, keeps the normalized photos and the
+memory-agent context for the life of the connection, and queues new messages
+and memory snippets. Those are written in one Firestore update and one
+embedding batch when the socket goes idle, the queue fills up or the
+connection closes, instead of a read-modify-write per turn.
+"""
+
+import logging
+import threading
+from datetime import datetime, timezone
+from typing import Callable
+
+from agents.memory import search_agent
+from services.admission import admission_context
+from services.consolidation import consolidation_scheduler
+from services.photo_store import StoredPhoto
+from services.search import store_memories
+from services.semantic_cache import classify_cacheable, semantic_cache
+from services.startup import LazyProvider
+from utils.env import get_env
+
+logger = logging.getLogger(__name__)
+
+db = LazyProvider("firestore")
+
+# Flush queued messages after this long without a new message.
+IDLE_FLUSH_SECONDS = float(get_env("CHAT_SESSION_IDLE_FLUSH_SECONDS", "5"))
+# ...or as soon as this many messages are waiting.
+MAX_PENDING_MESSAGES = int(get_env("CHAT_SESSION_MAX_PENDING", "20"))
+# Re-run the memory agent every N turns so long sessions pick up new context.
+MEMORY_REFRESH_TURNS = int(get_env("CHAT_SESSION_MEMORY_REFRESH_TURNS", "5"))
+
+
+def _array_union(values: list[dict]):
+    from google.cloud import firestore
+
+    return firestore.ArrayUnion(values)
+
+
+class ChatSession:
+    """One open chat: cached context plus the writes not yet persisted."""
+
+    def __init__(self, uid: str, chat_id: str | None = None, country: str = "us"):
+        self.uid = uid
+        self.chat_id = chat_id or uid
+        self.country = country
+        self.history: list[dict] = []
+        self.photos: list["str | StoredPhoto"] = []
+        self.memory: dict | None = None
+        self._memory_turns = 0
+        self._pending_messages: list[dict] = []
+        self._pending_memories: list[str] = []
+        self._lock = threading.Lock()
+        self.stats = {"turns": 0, "cache_hits": 0, "memory_lookups": 0, "flushes": 0}
+
+    def load(self) -> None:
+        snapshot = db.collection("chats").document(self.chat_id).get()
+        messages = (
+            (snapshot.to_dict() or {}).get("messages", []) if snapshot.exists else []
+        )
+        self.history = [
+            {"role": m["role"], "content": m["content"]}
+            for m in messages
+            if m.get("role") in ("user", "assistant")
+        ]
+
+    def set_photos(self, photos: list["str | StoredPhoto"]) -> None:
+        self.photos = list(photos)
+        for photo in self.photos:
+            if isinstance(photo, StoredPhoto):
+                photo.data_url  # Encode once; every later turn reuses it.
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending_messages)
+
+    def _memory_for(self, message: str) -> dict | None:
+        if self.memory is None or self._memory_turns >= MEMORY_REFRESH_TURNS:
+            self.memory = search_agent(message, uid=self.uid, timestamp=None)
+            self._memory_turns = 0
+            self.stats["memory_lookups"] += 1
+        self._memory_turns += 1
+        return self.memory
+
+    def reply(
+        self,
+        message: str,
+        on_delta: Callable[[str], None] | None = None,
+    ) -> str:
+        """Answer one message from the cached context and queue its writes."""
+        from agents.cosmetist import CHAT_PROMPT_VERSION, run_chat_turn
+
+        history = [*self.history, {"role": "user", "content": message}]
+        # Only an opening question is standalone; later ones lean on the history.
+        cacheable = (
+            not self.history and not self.photos and classify_cacheable(message)[0]
+        )
+        lookup = None
+        if cacheable:
+            try:
+                lookup = semantic_cache.lookup(message, CHAT_PROMPT_VERSION)
+            except Exception as exc:
+                logger.warning("Semantic cache lookup failed: %s", exc)
+
+        if lookup and lookup.reply:
+            reply = lookup.reply
+            self.stats["cache_hits"] += 1
+            if on_delta:
+                on_delta(reply)
+        else:
+            memory = self._memory_for(message)
+            reply = run_chat_turn(
+                photo_data_urls=self.photos,
+                history=history,
+                country=self.country,
+                memory=memory,
+                on_delta=on_delta,
+            )
+            # Answers shaped by the user's memory are personal; keep them out.
+            if cacheable and not (memory and memory.get("found")):
+                try:
+                    semantic_cache.store(
+                        message,
+                        reply,
+                        CHAT_PROMPT_VERSION,
+                        embedding=lookup.embedding if lookup else None,
+                    )
+                except Exception as exc:
+                    logger.warning("Semantic cache store failed: %s", exc)
+
+        now = datetime.now(timezone.utc).isoformat()
+        self.history = [*history, {"role": "assistant", "content": reply}]
+        with self._lock:
+            self._pending_messages += [
+                {
+                    "role": role,
+                    "content": content,
+                    "timestamp": now,
+                    "content_type": "text",
+                }
+                for role, content in (("user", message), ("assistant", reply))
+            ]
+            self._pending_memories.append(f"User: {message}\nAssistant: {reply}")
+        self.stats["turns"] += 1
+        return reply
+
+    def flush(self) -> int:
+        """Persist queued messages and memories; returns how many messages."""
+        with self._lock:
+            messages, self._pending_messages = self._pending_messages, []
+            memories, self._pending_memories = self._pending_memories, []
+        if not messages and not memories:
+            return 0
+
+        if messages:
+            try:
+                # ArrayUnion appends without reading the document first.
+                db.collection("chats").document(self.chat_id).set(
+                    {"uid": self.uid, "messages": _array_union(messages)},
+                    merge=True,
+                )
+            except Exception:
+                with self._lock:
+                    self._pending_messages = messages + self._pending_messages
+                    self._pending_memories = memories + self._pending_memories
+                raise
+
+        if memories:
+            try:
+                with admission_context(self.uid, "background"):
+                    store_memories(self.uid, memories)
+                consolidation_scheduler.mark_dirty(self.uid)
+            except Exception as exc:
+                logger.warning("Failed to store session memories: %s", exc)
+
+        self.stats["flushes"] += 1
+        return len(messages)
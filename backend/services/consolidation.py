@@ -0,0 +1,294 @@
+"""Background deduplication and consolidation of per-user memory vectors."""
+
+import asyncio
+import contextvars
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Any
+
+import numpy as np
+
+from services.admission import admission_context
+from services.search import store_memories
+from services.startup import LazyProvider
+from utils.ranking import DEFAULT_IMPORTANCE
+from utils.env import get_env
+from utils.search import delete_documents, fetch_user_memories, search_vector_db
+from utils.vectors import as_vector_matrix, normalize_rows
+
+logger = logging.getLogger(__name__)
+
+db = LazyProvider("firestore")
+
+CHECKPOINT_COLLECTION = "memory_consolidation"
+SIMILARITY_THRESHOLD = 0.92
+BLOCK_SIZE = 512
+# Older memories compared with each new one in an incremental pass.
+NEIGHBOURS = 10
+# Azure Search makes a stored memory searchable after a short delay; the
+# checkpoint stays this far behind the pass so late arrivals are refetched.
+INDEX_LAG = timedelta(seconds=float(get_env("MEMORY_INDEX_LAG_SECONDS", "120")))
+CONSOLIDATION_INTERVAL_SECONDS = 300
+
+_neighbour_pool = ThreadPoolExecutor(
+    max_workers=8, thread_name_prefix="memory-consolidation"
+)
+
+SUMMARY_PROMPT = (
+    "These notes were saved from separate chats with the same skincare user and "
+    "say nearly the same thing. Merge them into one short factual memory written "
+    "in the third person. Keep product names, dates, skin concerns and routine "
+    "steps; drop greetings and repetition. Return only the merged memory."
+)
+
+
+def _parse_timestamp(value: Any) -> datetime:
+    if isinstance(value, datetime):
+        parsed = value
+    else:
+        parsed = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed
+
+
+def find_duplicate_clusters(
+    embeddings,
+    new_mask: np.ndarray,
+    *,
+    threshold: float = SIMILARITY_THRESHOLD,
+    block_size: int = BLOCK_SIZE,
+) -> list[list[int]]:
+    """Group rows whose cosine similarity exceeds ``threshold``.
+
+    Only rows flagged in ``new_mask`` are compared against the whole matrix,
+    one block of rows per matrix product, so an incremental pass costs
+    O(new x total) instead of O(total^2). Returns clusters of two or more
+    row indices that contain at least one new row.
+    """
+    matrix = normalize_rows(embeddings)
+    parent = np.arange(matrix.shape[0])
+
+    def find(i: int) -> int:
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    new_rows = np.flatnonzero(new_mask)
+    for start in range(0, new_rows.size, block_size):
+        rows = new_rows[start : start + block_size]
+        similarities = matrix[rows] @ matrix.T
+        similarities[np.arange(rows.size), rows] = -1.0
+        for row_offset, column in zip(*np.nonzero(similarities >= threshold)):
+            a, b = find(int(rows[row_offset])), find(int(column))
+            if a != b:
+                parent[max(a, b)] = min(a, b)
+
+    clusters: dict[int, list[int]] = {}
+    for i in range(matrix.shape[0]):
+        clusters.setdefault(find(i), []).append(i)
+    return [members for members in clusters.values() if len(members) > 1]
+
+
+def summarize_cluster(contents: list[str]) -> str:
+    from agents.memory import generate_response
+
+    notes = "\n\n".join(f"- {content}" for content in contents)
+    return generate_response(notes, system_instruction=SUMMARY_PROMPT).strip()
+
+
+def _load_checkpoint(uid: str) -> datetime | None:
+    snapshot = db.collection(CHECKPOINT_COLLECTION).document(uid).get()
+    if not snapshot.exists:
+        return None
+    last_run = (snapshot.to_dict() or {}).get("last_run")
+    return _parse_timestamp(last_run) if last_run else None
+
+
+def _save_checkpoint(uid: str, last_run: datetime) -> None:
+    db.collection(CHECKPOINT_COLLECTION).document(uid).set(
+        {"uid": uid, "last_run": last_run.isoformat()}
+    )
+
+
+def _with_neighbours(
+    uid: str, new_documents: list[dict[str, Any]], *, top_k: int = NEIGHBOURS
+) -> list[dict[str, Any]]:
+    """``new_documents`` followed by the older memories nearest to any of them."""
+    documents = {doc["id"]: doc for doc in new_documents}
+    # The nearest neighbours of a memory include the memory itself.
+    horizon = datetime.now(timezone.utc)
+    # Searches run concurrently, each in a copy of the caller's context so
+    # provider admission still sees the background priority.
+    futures = [
+        _neighbour_pool.submit(
+            contextvars.copy_context().run,
+            search_vector_db,
+            doc["embedding"],
+            uid,
+            horizon,
+            top_k=top_k + 1,
+            include_embeddings=True,
+        )
+        for doc in new_documents
+    ]
+    for future in futures:
+        for neighbour in future.result():
+            if neighbour.get("embedding"):
+                documents.setdefault(neighbour["id"], neighbour)
+    return list(documents.values())
+
+
+def consolidate_user_memories(
+    uid: str,
+    *,
+    threshold: float = SIMILARITY_THRESHOLD,
+    full: bool = False,
+) -> dict[str, int]:
+    """Merge near-duplicate memories added since the last pass for ``uid``.
+
+    Only memories stamped after the checkpoint are fetched; each is compared
+    with its ``NEIGHBOURS`` nearest memories instead of the whole partition.
+    The checkpoint moves to the newest memory processed but no later than
+    ``INDEX_LAG`` before the pass started, so a memory stored just before a
+    pass but not yet searchable is fetched by the next one. A memory whose
+    timestamp is older than that when it is stored (a backfill, or a
+    summary written by this pass) is never fetched incrementally; run with
+    ``full=True`` to cover those.
+    """
+
+    started = datetime.now(timezone.utc)
+    since = None if full else _load_checkpoint(uid)
+    new_documents = [
+        doc
+        for doc in fetch_user_memories(uid, include_embeddings=True, since=since)
+        if doc.get("embedding")
+    ]
+    stats = {"scanned": len(new_documents), "clusters": 0, "merged": 0, "deleted": 0}
+    if not new_documents:
+        return stats
+    checkpoint = min(
+        max(_parse_timestamp(doc["timestamp"]) for doc in new_documents),
+        started - INDEX_LAG,
+    )
+
+    if since is None:
+        documents = new_documents
+    else:
+        documents = _with_neighbours(uid, new_documents)
+        stats["scanned"] = len(documents)
+    if len(documents) < 2:
+        _save_checkpoint(uid, checkpoint)
+        return stats
+
+    new_ids = {doc["id"] for doc in new_documents}
+    timestamps = [_parse_timestamp(doc["timestamp"]) for doc in documents]
+    new_mask = np.array([doc["id"] in new_ids for doc in documents])
+    embeddings = as_vector_matrix([doc["embedding"] for doc in documents])
+    clusters = find_duplicate_clusters(embeddings, new_mask, threshold=threshold)
+
+    summaries: list[str] = []
+    summary_timestamps: list[datetime] = []
+    summary_importances: list[float] = []
+    superseded: list[str] = []
+    for members in clusters:
+        members.sort(key=lambda i: timestamps[i])
+        contents = [documents[i]["content"] for i in members]
+        try:
+            summary = summarize_cluster(contents)
+        except Exception as exc:
+            logger.warning("Memory summary failed for %s: %s", uid, exc)
+            summary = ""
+
+        if summary:
+            summaries.append(summary)
+            summary_timestamps.append(timestamps[members[-1]])
+            summary_importances.append(
+                max(
+                    documents[i].get("importance") or DEFAULT_IMPORTANCE
+                    for i in members
+                )
+            )
+            superseded.extend(documents[i]["id"] for i in members)
+        else:
+            # Without a summary keep the newest note and drop the older copies.
+            superseded.extend(documents[i]["id"] for i in members[:-1])
+
+    # Write the merged facts before deleting so a crash never loses a memory.
+    for summary, timestamp, importance in zip(
+        summaries, summary_timestamps, summary_importances, strict=True
+    ):
+        store_memories(uid, [summary], timestamp=timestamp, importances=[importance])
+    stats["clusters"] = len(clusters)
+    stats["merged"] = len(summaries)
+    stats["deleted"] = delete_documents(superseded)
+
+    _save_checkpoint(uid, checkpoint)
+    return stats
+
+
+class ConsolidationScheduler:
+    """Collects users with new memories and consolidates them off the request path."""
+
+    def __init__(self, interval: float = CONSOLIDATION_INTERVAL_SECONDS):
+        self.interval = interval
+        self._pending: set[str] = set()
+        self._lock = threading.Lock()
+        self._task: asyncio.Task | None = None
+
+    def mark_dirty(self, uid: str) -> None:
+        with self._lock:
+            self._pending.add(uid)
+
+    def _drain(self) -> list[str]:
+        with self._lock:
+            pending, self._pending = list(self._pending), set()
+        return pending
+
+    async def run_once(self) -> dict[str, dict[str, int]]:
+        results = {}
+        for uid in self._drain():
+            try:
+                with admission_context(uid, "background"):
+                    results[uid] = await asyncio.to_thread(
+                        consolidate_user_memories, uid
+                    )
+            except Exception as exc:
+                logger.warning("Memory consolidation failed for %s: %s", uid, exc)
+        return results
+
+    async def _loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.run_once()
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+consolidation_scheduler = ConsolidationScheduler()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Consolidate a user's memories")
+    parser.add_argument("uid")
+    parser.add_argument("--full", action="store_true", help="Ignore the checkpoint")
+    parser.add_argument("--threshold", type=float, default=SIMILARITY_THRESHOLD)
+    args = parser.parse_args()
+
+    print(consolidate_user_memories(args.uid, threshold=args.threshold, full=args.full))
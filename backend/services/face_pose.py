@@ -0,0 +1,160 @@
+"""Local face-view verification with the bundled MediaPipe BlazeFace model."""
+
+import logging
+from functools import lru_cache
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+
+from utils.env import PROJECT_ROOT, get_env
+from utils.images import letterbox, load_rgb
+from utils.workers import get_cpu_pool
+
+logger = logging.getLogger(__name__)
+
+MODEL_PATH = Path(
+    get_env(
+        "FACE_DETECTION_MODEL",
+        str(
+            PROJECT_ROOT
+            / "public/mediapipe/face_detection/face_detection_short_range.tflite"
+        ),
+    )
+)
+INPUT_SIZE = 128
+MIN_SCORE = 0.5
+# Nose offset from the eye midpoint as a fraction of face width. Frontal
+# captures sit near 0; a three-quarter turn is typically beyond 0.12.
+FRONT_YAW_LIMIT = 0.08
+REQUIRED_POSES = ("front", "left", "right")
+POSE_LABELS = {
+    "front": "front face",
+    "left": "left side face",
+    "right": "right side face",
+}
+MAX_IMAGE_SIDE = 640
+
+
+class FaceVerificationUnavailable(RuntimeError):
+    """Raised when the local model or its runtime is not installed."""
+
+
+def _generate_anchors() -> np.ndarray:
+    """SSD anchors for BlazeFace short range: strides 8,16,16,16 -> 896 anchors."""
+    anchors = []
+    for stride, per_cell in ((8, 2), (16, 6)):
+        cells = INPUT_SIZE // stride
+        for y in range(cells):
+            for x in range(cells):
+                anchors.extend([((x + 0.5) / cells, (y + 0.5) / cells)] * per_cell)
+    return np.asarray(anchors, dtype=np.float32)
+
+
+ANCHORS = _generate_anchors()
+
+
+@lru_cache(maxsize=1)
+def _get_interpreter():
+    try:
+        from ai_edge_litert.interpreter import Interpreter
+    except ImportError as exc:
+        raise FaceVerificationUnavailable("ai-edge-litert is not installed") from exc
+    if not MODEL_PATH.exists():
+        raise FaceVerificationUnavailable(f"Face model not found at {MODEL_PATH}")
+    interpreter = Interpreter(model_path=str(MODEL_PATH), num_threads=1)
+    interpreter.allocate_tensors()
+    return interpreter
+
+
+def _run_model(batch: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Return (regressors, classificators) shaped (N, 896, 16) and (N, 896, 1).
+
+    The model's output reshape folds the batch axis into the anchor axis, so
+    frames are invoked one at a time on the same interpreter.
+    """
+    interpreter = _get_interpreter()
+    input_index = interpreter.get_input_details()[0]["index"]
+    outputs = {o["name"]: o["index"] for o in interpreter.get_output_details()}
+
+    regressors, classificators = [], []
+    for frame in batch:
+        interpreter.set_tensor(input_index, frame[np.newaxis])
+        interpreter.invoke()
+        regressors.append(interpreter.get_tensor(outputs["regressors"])[0])
+        classificators.append(interpreter.get_tensor(outputs["classificators"])[0])
+    return np.stack(regressors), np.stack(classificators)
+
+
+def _classify_yaw(keypoints: np.ndarray, face_width: float) -> tuple[str, float]:
+    # Keypoints: right eye, left eye, nose tip, mouth, right ear, left ear.
+    eye_mid_x = (keypoints[0, 0] + keypoints[1, 0]) / 2
+    yaw = float((keypoints[2, 0] - eye_mid_x) / max(face_width, 1e-6))
+    if abs(yaw) < FRONT_YAW_LIMIT:
+        return "front", yaw
+    # Same convention as the capture guide: the nose points toward image-left
+    # for the "left" view.
+    return ("left" if yaw < 0 else "right"), yaw
+
+
+def detect_poses(images: list[bytes]) -> list[dict[str, Any]]:
+    """Detect the main face in each image and classify its yaw in one batch."""
+
+    frames = []
+    transforms = []
+    for data in images:
+        rgb = load_rgb(data, max_side=MAX_IMAGE_SIDE)
+        canvas, scale, pad_x, pad_y = letterbox(rgb, INPUT_SIZE)
+        frames.append(canvas)
+        transforms.append((scale, pad_x, pad_y, rgb.shape[1], rgb.shape[0]))
+
+    batch = np.stack(frames).astype(np.float32) / 127.5 - 1.0
+    regressors, classificators = _run_model(batch)
+    logits = np.clip(classificators[..., 0].astype(np.float64), -100, 100)
+    scores = 1.0 / (1.0 + np.exp(-logits))
+
+    results = []
+    for i, (scale, pad_x, pad_y, width, height) in enumerate(transforms):
+        best = int(np.argmax(scores[i]))
+        score = float(scores[i, best])
+        if score < MIN_SCORE:
+            results.append({"pose": None, "score": score, "yaw": None, "box": None})
+            continue
+
+        raw = regressors[i, best] / INPUT_SIZE
+        anchor = ANCHORS[best]
+        center = raw[0:2] + anchor
+        size = raw[2:4]
+        keypoints = raw[4:16].reshape(6, 2) + anchor
+        pose, yaw = _classify_yaw(keypoints, float(size[0]))
+
+        # Map the normalized letterboxed box back to source pixels.
+        x0, y0 = (center - size / 2) * INPUT_SIZE
+        x1, y1 = (center + size / 2) * INPUT_SIZE
+        box = [
+            int(np.clip((x0 - pad_x) / scale, 0, width)),
+            int(np.clip((y0 - pad_y) / scale, 0, height)),
+            int(np.clip((x1 - pad_x) / scale, 0, width)),
+            int(np.clip((y1 - pad_y) / scale, 0, height)),
+        ]
+        results.append({"pose": pose, "score": score, "yaw": yaw, "box": box})
+    return results
+
+
+def detect_poses_in_pool(images: list[bytes]) -> list[dict[str, Any]]:
+    """Run ``detect_poses`` in the CPU worker pool, off the event loop's GIL."""
+    return get_cpu_pool().submit(detect_poses, images).result()
+
+
+def summarize_views(detections: list[dict[str, Any]]) -> dict[str, Any]:
+    found = [d["pose"] for d in detections if d["pose"]]
+    missing = [POSE_LABELS[pose] for pose in REQUIRED_POSES if pose not in found]
+    if len(found) < len(detections):
+        unclear = len(detections) - len(found)
+        message = (
+            f"No clear face found in {unclear} photo(s). Retake them in good light."
+        )
+        return {"success": False, "message": message}
+    if missing:
+        return {"success": False, "message": f"Missing: {', '.join(missing)}."}
+    return {"success": True, "message": "All face views look good."}
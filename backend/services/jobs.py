@@ -0,0 +1,197 @@
+"""Background jobs with per-stage progress, persistence and deduplication."""
+
+import asyncio
+import contextvars
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Callable
+
+from services.startup import LazyProvider
+from utils.env import get_env
+
+logger = logging.getLogger(__name__)
+
+db = LazyProvider("firestore")
+
+JOB_COLLECTION = "workflow_jobs"
+JOB_WORKERS = int(get_env("WORKFLOW_JOB_WORKERS", "4"))
+JOB_TTL_SECONDS = 60 * 60
+TERMINAL_STATUSES = ("succeeded", "failed")
+
+Progress = Callable[[str, Any], None]
+
+
+@dataclass
+class Job:
+    id: str
+    key: str
+    uid: str
+    status: str = "queued"
+    stages: dict[str, Any] = field(default_factory=dict)
+    result: dict[str, Any] | None = None
+    error: str | None = None
+    created_at: float = field(default_factory=time.time)
+    updated_at: float = field(default_factory=time.time)
+    _subscribers: list[tuple[asyncio.AbstractEventLoop, asyncio.Queue]] = field(
+        default_factory=list, repr=False
+    )
+
+    @property
+    def done(self) -> bool:
+        return self.status in TERMINAL_STATUSES
+
+    def snapshot(self) -> dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "uid": self.uid,
+            "status": self.status,
+            "stages": dict(self.stages),
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+        }
+
+
+class JobManager:
+    """Runs jobs on a bounded thread pool and fans progress out to subscribers.
+
+    Jobs are keyed by a caller-provided dedupe key; submitting a key whose
+    job is still queued or running attaches to that job instead of starting
+    a second run.
+    """
+
+    def __init__(self, workers: int = JOB_WORKERS, collection: str = JOB_COLLECTION):
+        self._pool = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="workflow-job"
+        )
+        self._collection = collection
+        self._jobs: dict[str, Job] = {}
+        self._active_by_key: dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def submit(
+        self,
+        key: str,
+        uid: str,
+        fn: Callable[[Progress], dict[str, Any]],
+    ) -> tuple[Job, bool]:
+        """Start ``fn(progress)`` for ``key`` unless it is already in flight.
+
+        Returns the job and whether the caller attached to an existing one.
+        """
+        with self._lock:
+            self._prune()
+            active_id = self._active_by_key.get(key)
+            if active_id and not self._jobs[active_id].done:
+                return self._jobs[active_id], True
+
+            job = Job(id=uuid.uuid4().hex, key=key, uid=uid)
+            self._jobs[job.id] = job
+            self._active_by_key[key] = job.id
+
+        self._persist(job)
+        # Carry the submitter's context (e.g. admission uid and priority).
+        self._pool.submit(contextvars.copy_context().run, self._run, job, fn)
+        return job, False
+
+    def get(self, job_id: str) -> dict[str, Any] | None:
+        job = self._jobs.get(job_id)
+        if job is not None:
+            return job.snapshot()
+        # Another worker process (or a restart) may have run it.
+        try:
+            snapshot = db.collection(self._collection).document(job_id).get()
+        except Exception as exc:
+            logger.warning("Could not load job %s: %s", job_id, exc)
+            return None
+        return snapshot.to_dict() if snapshot.exists else None
+
+    async def events(self, job_id: str) -> AsyncIterator[dict[str, Any]]:
+        """Yield stage events for a job, starting with what already happened."""
+
+        job = self._jobs.get(job_id)
+        if job is None:
+            snapshot = self.get(job_id)
+            if snapshot:
+                yield {"event": "snapshot", "data": snapshot}
+            return
+
+        queue: asyncio.Queue = asyncio.Queue()
+        subscriber = (asyncio.get_running_loop(), queue)
+        with self._lock:
+            replay = [
+                {"event": "stage", "data": {"stage": stage, "result": value}}
+                for stage, value in job.stages.items()
+            ]
+            if job.done:
+                replay.append({"event": job.status, "data": job.snapshot()})
+            else:
+                job._subscribers.append(subscriber)
+
+        try:
+            for event in replay:
+                yield event
+            if job.done:
+                return
+            while True:
+                event = await queue.get()
+                yield event
+                if event["event"] in TERMINAL_STATUSES:
+                    return
+        finally:
+            with self._lock:
+                if subscriber in job._subscribers:
+                    job._subscribers.remove(subscriber)
+
+    def _publish(self, job: Job, event: dict[str, Any]) -> None:
+        with self._lock:
+            subscribers = list(job._subscribers)
+        for loop, queue in subscribers:
+            loop.call_soon_threadsafe(queue.put_nowait, event)
+
+    def _run(self, job: Job, fn: Callable[[Progress], dict[str, Any]]) -> None:
+        def progress(stage: str, value: Any) -> None:
+            with self._lock:
+                job.stages[stage] = value
+                job.updated_at = time.time()
+            self._persist(job)
+            self._publish(
+                job, {"event": "stage", "data": {"stage": stage, "result": value}}
+            )
+
+        job.status = "running"
+        self._persist(job)
+        try:
+            result = fn(progress)
+        except Exception as exc:
+            logger.exception("Job %s failed", job.id)
+            with self._lock:
+                job.status, job.error = "failed", str(exc)
+        else:
+            with self._lock:
+                job.status, job.result = "succeeded", result
+        job.updated_at = time.time()
+        self._persist(job)
+        self._publish(job, {"event": job.status, "data": job.snapshot()})
+
+    def _persist(self, job: Job) -> None:
+        try:
+            db.collection(self._collection).document(job.id).set(job.snapshot())
+        except Exception as exc:
+            logger.warning("Could not persist job %s: %s", job.id, exc)
+
+    def _prune(self) -> None:
+        cutoff = time.time() - JOB_TTL_SECONDS
+        for job_id, job in list(self._jobs.items()):
+            if job.done and job.updated_at < cutoff:
+                del self._jobs[job_id]
+                if self._active_by_key.get(job.key) == job_id:
+                    del self._active_by_key[job.key]
+
+
+workflow_jobs = JobManager()
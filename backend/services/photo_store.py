@@ -0,0 +1,199 @@
+"""Content-addressed storage for uploaded scan photos.
+
+Face photos are biometric data, so they are kept only for
+``PHOTO_RETENTION_SECONDS`` after their last upload; a background sweep
+deletes older files.
+"""
+
+import asyncio
+import base64
+import hashlib
+import logging
+import os
+import re
+import tempfile
+import time
+from dataclasses import dataclass
+from functools import cached_property
+from pathlib import Path
+from typing import AsyncIterator
+
+from utils.env import get_env
+from utils.images import decode_data_url
+
+logger = logging.getLogger(__name__)
+
+PHOTO_STORE_DIR = Path(
+    get_env(
+        "PHOTO_STORE_DIR",
+        str(Path(tempfile.gettempdir()) / "glowly-photos"),
+    )
+)
+MAX_PHOTO_BYTES = int(get_env("MAX_PHOTO_BYTES", str(15 * 1024 * 1024)))
+# Uploads stay in memory up to this size before spilling to a temp file.
+SPOOL_BYTES = 1024 * 1024
+CHUNK_BYTES = 64 * 1024
+# Formats both the OpenAI image input and PIL can decode; HEIC is neither.
+ALLOWED_CONTENT_TYPES = ("image/jpeg", "image/png", "image/webp")
+PHOTO_RETENTION_SECONDS = float(get_env("PHOTO_RETENTION_SECONDS", str(24 * 3600)))
+SWEEP_INTERVAL_SECONDS = 600
+_HASH_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+
+
+class PhotoNotFound(KeyError):
+    """Raised when a referenced photo hash is not in the store."""
+
+
+class PhotoTooLarge(ValueError):
+    """Raised when an upload exceeds MAX_PHOTO_BYTES."""
+
+
+@dataclass(frozen=True)
+class StoredPhoto:
+    """A photo referenced by content hash; bytes and data URL load on demand."""
+
+    sha256: str
+    content_type: str
+
+    @property
+    def path(self) -> Path:
+        return _photo_path(self.sha256)
+
+    @cached_property
+    def data(self) -> bytes:
+        return self.path.read_bytes()
+
+    @cached_property
+    def data_url(self) -> str:
+        """Only built when an upstream provider needs inline base64."""
+        encoded = base64.b64encode(self.data).decode("ascii")
+        return f"data:{self.content_type};base64,{encoded}"
+
+
+def _photo_path(sha256: str) -> Path:
+    if not _HASH_PATTERN.match(sha256):
+        raise PhotoNotFound(sha256)
+    return PHOTO_STORE_DIR / sha256[:2] / sha256
+
+
+def _content_type_path(sha256: str) -> Path:
+    return _photo_path(sha256).with_suffix(".type")
+
+
+async def save_photo_stream(
+    chunks: AsyncIterator[bytes],
+    content_type: str,
+) -> StoredPhoto:
+    """Hash and spool an upload chunk by chunk, then move it into the store."""
+
+    digest = hashlib.sha256()
+    size = 0
+    with tempfile.SpooledTemporaryFile(max_size=SPOOL_BYTES) as spool:
+        async for chunk in chunks:
+            size += len(chunk)
+            if size > MAX_PHOTO_BYTES:
+                raise PhotoTooLarge(f"Photo exceeds {MAX_PHOTO_BYTES} bytes")
+            digest.update(chunk)
+            spool.write(chunk)
+
+        photo = StoredPhoto(sha256=digest.hexdigest(), content_type=content_type)
+        if photo.path.exists():
+            # A re-upload restarts the retention clock.
+            os.utime(photo.path)
+            return photo
+
+        photo.path.parent.mkdir(parents=True, exist_ok=True)
+        spool.seek(0)
+        # Write to a sibling temp file and rename so readers never see a
+        # partially written photo.
+        fd, tmp_name = tempfile.mkstemp(dir=photo.path.parent)
+        with os.fdopen(fd, "wb") as handle:
+            while block := spool.read(CHUNK_BYTES):
+                handle.write(block)
+        os.replace(tmp_name, photo.path)
+        _content_type_path(photo.sha256).write_text(content_type)
+        return photo
+
+
+def load_photo(sha256: str) -> StoredPhoto:
+    path = _photo_path(sha256)
+    if not path.exists():
+        raise PhotoNotFound(sha256)
+    type_path = _content_type_path(sha256)
+    content_type = type_path.read_text() if type_path.exists() else "image/jpeg"
+    return StoredPhoto(sha256=sha256, content_type=content_type)
+
+
+def load_photos(hashes: list[str]) -> list[StoredPhoto]:
+    return [load_photo(sha256) for sha256 in hashes]
+
+
+def photo_bytes(photo: "StoredPhoto | str") -> bytes:
+    """Raw image bytes from either a stored photo or a legacy data URL."""
+    return photo.data if isinstance(photo, StoredPhoto) else decode_data_url(photo)
+
+
+def photo_digest(photo: "StoredPhoto | str") -> str:
+    """sha256 of the decoded image, identical for uploads and data URLs."""
+    if isinstance(photo, StoredPhoto):
+        return photo.sha256
+    return hashlib.sha256(decode_data_url(photo)).hexdigest()
+
+
+def photo_url(photo: "StoredPhoto | str") -> str:
+    """The inline data URL an upstream multimodal API expects."""
+    return photo.data_url if isinstance(photo, StoredPhoto) else photo
+
+
+def sweep_photos(max_age: float = PHOTO_RETENTION_SECONDS) -> int:
+    """Delete photos last uploaded more than ``max_age`` seconds ago.
+
+    Returns how many photos were removed. Content-type sidecars and temp
+    files left by interrupted uploads age out the same way.
+    """
+    cutoff = time.time() - max_age
+    removed = 0
+    for path in PHOTO_STORE_DIR.glob("??/*"):
+        try:
+            if path.stat().st_mtime >= cutoff:
+                continue
+            path.unlink()
+        except FileNotFoundError:
+            continue
+        removed += _HASH_PATTERN.match(path.name) is not None
+    return removed
+
+
+class PhotoSweeper:
+    """Runs ``sweep_photos`` periodically off the request path."""
+
+    def __init__(self, interval: float = SWEEP_INTERVAL_SECONDS):
+        self.interval = interval
+        self._task: asyncio.Task | None = None
+
+    async def _loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                removed = await asyncio.to_thread(sweep_photos)
+            except OSError as exc:
+                logger.warning("Photo retention sweep failed: %s", exc)
+                continue
+            if removed:
+                logger.info("Deleted %d expired photos", removed)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+photo_sweeper = PhotoSweeper()
@@ -0,0 +1,170 @@
+"""Shopping recommendations cached per quantized skin profile and country."""
+
+import asyncio
+import json
+import logging
+import re
+import threading
+import time
+from collections import Counter
+from typing import Any
+
+from services.admission import admission_context
+from services.skin_metrics import RATING_KEYS
+from utils.cache import TieredCache
+from utils.env import get_env
+
+logger = logging.getLogger(__name__)
+
+RECOMMENDATION_TTL_SECONDS = float(
+    get_env("RECOMMENDATION_TTL_SECONDS", str(7 * 24 * 3600))
+)
+# Popular buckets older than this are recomputed in the background so users
+# keep hitting fresh prices and links.
+REFRESH_AFTER_SECONDS = float(get_env("RECOMMENDATION_REFRESH_SECONDS", "86400"))
+REFRESH_INTERVAL_SECONDS = 600
+POPULAR_BUCKETS = int(get_env("RECOMMENDATION_POPULAR_BUCKETS", "20"))
+
+_JSON_BLOCK = re.compile(r"```(?:json)?\s*(\{.*?\})\s*```", re.DOTALL)
+
+recommendation_cache = TieredCache(
+    "recommendations",
+    ttl_seconds=RECOMMENDATION_TTL_SECONDS,
+    local_ttl=60,
+)
+
+
+def parse_json_object(text: str) -> dict[str, Any] | None:
+    """First JSON object in an LLM reply, fenced or bare; None if there is none."""
+    match = _JSON_BLOCK.search(text)
+    candidate = match.group(1) if match else text
+    try:
+        value = json.loads(candidate)
+    except (json.JSONDecodeError, TypeError):
+        start, end = text.find("{"), text.rfind("}")
+        if start < 0 or end <= start:
+            return None
+        try:
+            value = json.loads(text[start : end + 1])
+        except json.JSONDecodeError:
+            return None
+    return value if isinstance(value, dict) else None
+
+
+def parse_ratings(ratings: "str | dict | None") -> dict[str, int] | None:
+    """Ratings from the workflow's ratings stage, rounded and clamped to 1-5."""
+    if isinstance(ratings, str):
+        ratings = parse_json_object(ratings)
+    if not isinstance(ratings, dict):
+        return None
+    try:
+        return {
+            key: min(5, max(1, int(round(float(ratings[key]))))) for key in RATING_KEYS
+        }
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def parse_products(reply: str | None) -> list[dict[str, Any]]:
+    """Product cards from a shopping reply; empty when the reply has none."""
+    payload = parse_json_object(reply or "")
+    products = payload.get("products") if payload else None
+    return products if isinstance(products, list) else []
+
+
+def profile_bucket(ratings: dict[str, int], country: str) -> str:
+    return f"{country.lower()}:" + "-".join(str(ratings[key]) for key in RATING_KEYS)
+
+
+def _bucket_profile(bucket: str) -> tuple[dict[str, int], str]:
+    country, scores = bucket.split(":", 1)
+    return dict(zip(RATING_KEYS, map(int, scores.split("-")))), country
+
+
+class RecommendationCache:
+    """Serves shopping replies per profile bucket and tracks which are popular."""
+
+    def __init__(self, store: TieredCache = recommendation_cache):
+        self.store = store
+        self._hits: Counter[str] = Counter()
+        self._lock = threading.Lock()
+
+    def get(self, ratings: dict[str, int], country: str) -> str | None:
+        bucket = profile_bucket(ratings, country)
+        with self._lock:
+            self._hits[bucket] += 1
+        entry = self.store.get(bucket)
+        return entry["shopping"] if entry else None
+
+    def put(self, ratings: dict[str, int], country: str, shopping: str) -> bool:
+        """Store a shopping reply if it contains product cards."""
+        if not parse_products(shopping):
+            return False
+        self.store.set(
+            profile_bucket(ratings, country),
+            {"shopping": shopping, "refreshed_at": time.time()},
+        )
+        return True
+
+    def stale_popular_buckets(self, limit: int = POPULAR_BUCKETS) -> list[str]:
+        with self._lock:
+            popular = [bucket for bucket, _ in self._hits.most_common(limit)]
+        cutoff = time.time() - REFRESH_AFTER_SECONDS
+        stale = []
+        for bucket in popular:
+            entry = self.store.get(bucket)
+            if entry is None or entry.get("refreshed_at", 0) < cutoff:
+                stale.append(bucket)
+        return stale
+
+    def refresh(self, bucket: str) -> bool:
+        from agents.cosmetist import recommend_products
+
+        ratings, country = _bucket_profile(bucket)
+        return self.put(ratings, country, recommend_products(ratings, country))
+
+    async def run_once(self) -> dict[str, bool]:
+        results = {}
+        for bucket in self.stale_popular_buckets():
+            try:
+                with admission_context("recommendations", "background"):
+                    results[bucket] = await asyncio.to_thread(self.refresh, bucket)
+            except Exception as exc:
+                logger.warning("Recommendation refresh failed for %s: %s", bucket, exc)
+                results[bucket] = False
+        return results
+
+
+class RecommendationRefresher:
+    """Periodically recomputes popular buckets before they go stale."""
+
+    def __init__(
+        self,
+        cache: RecommendationCache,
+        interval: float = REFRESH_INTERVAL_SECONDS,
+    ):
+        self.cache = cache
+        self.interval = interval
+        self._task: asyncio.Task | None = None
+
+    async def _loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.cache.run_once()
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+recommendations = RecommendationCache()
+recommendation_refresher = RecommendationRefresher(recommendations)
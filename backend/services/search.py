@@ -1,8 +1,54 @@
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
 from typing import List
 
-from llm.gemini import get_gemini_embedding
-from utils.search import search_vector_db, upload_documents
+from llm.gemini import DEFAULT_DIMENSIONS, get_gemini_embedding, get_gemini_embeddings
+from utils.env import get_env
+from utils.ranking import (
+    MemoryScoring,
+    estimate_importance,
+    reciprocal_rank_fusion,
+    rerank_by_term_overlap,
+    score_memories,
+)
+from utils.search import (
+    search_text_db,
+    search_vector_db,
+    upload_document_batch,
+    upload_documents,
+)
+
+# Must match the index built by database/build-azure-vector-db-schema.py.
+EMBEDDING_DIMENSIONS = int(
+    get_env("AZURE_SEARCH_EMBEDDING_DIMENSIONS", str(DEFAULT_DIMENSIONS))
+)
+
+SEARCH_MODES = ("vector", "hybrid")
+# Each leg over-fetches so fusion, reranking and memory scoring have room
+# to reorder.
+HYBRID_CANDIDATE_FACTOR = 3
+DEFAULT_SCORING = MemoryScoring(
+    half_life_days=float(get_env("MEMORY_HALF_LIFE_DAYS", "30")),
+    recency_weight=float(get_env("MEMORY_RECENCY_WEIGHT", "0.5")),
+    importance_weight=float(get_env("MEMORY_IMPORTANCE_WEIGHT", "0.5")),
+)
+
+_search_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="memory-search")
+
+
+def _vector_search(
+    query: str,
+    uid: str,
+    timestamp: datetime,
+    top_k: int,
+) -> List[dict]:
+    embedding = get_gemini_embedding(
+        query,
+        task_type="RETRIEVAL_QUERY",
+        output_dimensionality=EMBEDDING_DIMENSIONS,
+    )
+    return search_vector_db(embedding, uid, timestamp, top_k=top_k)
 
 
 def search_memories(
@@ -11,20 +57,162 @@ def search_memories(
     timestamp: datetime,
     *,
     top_k: int = 20,
+    mode: str = "vector",
+    scoring: MemoryScoring | None = DEFAULT_SCORING,
 ) -> List[dict]:
-    """Search user memories by query using the shared vector DB."""
+    """Search user memories by query using the shared vector DB.
 
-    embedding = get_gemini_embedding(query, task_type="RETRIEVAL_QUERY")
-    return search_vector_db(embedding, uid, timestamp, top_k=top_k)
+    With ``scoring`` the oversampled candidates are re-ranked by relevance,
+    recency relative to ``timestamp`` and importance; ``None`` ranks by
+    relevance alone.
+    """
+
+    if mode not in SEARCH_MODES:
+        raise ValueError(f"mode must be one of {SEARCH_MODES}")
+    candidates = top_k * HYBRID_CANDIDATE_FACTOR if scoring else top_k
+    if mode == "hybrid":
+        # The legs already over-fetch; keep all fused candidates for scoring.
+        results = hybrid_search_memories(
+            query, uid, timestamp, top_k=top_k, keep=candidates
+        )
+    else:
+        results = _vector_search(query, uid, timestamp, candidates)
+    if scoring is None:
+        return results
+    return score_memories(results, scoring, now=timestamp, top_k=top_k)
+
+
+def hybrid_search_memories(
+    query: str,
+    uid: str,
+    timestamp: datetime,
+    *,
+    top_k: int = 20,
+    keep: int | None = None,
+) -> List[dict]:
+    """Run lexical and vector search concurrently, fuse with RRF, rerank locally.
+
+    Each leg fetches ``top_k * HYBRID_CANDIDATE_FACTOR`` candidates; the
+    reranked list is cut to ``keep`` results, ``top_k`` by default.
+    """
+
+    candidates = top_k * HYBRID_CANDIDATE_FACTOR
+    # The lexical leg needs no embedding, so it runs while Gemini embeds.
+    # Each leg runs in a copy of the caller's context so provider admission
+    # still sees the request's uid and priority.
+    vector_future = _search_pool.submit(
+        contextvars.copy_context().run,
+        _vector_search,
+        query,
+        uid,
+        timestamp,
+        candidates,
+    )
+    text_future = _search_pool.submit(
+        contextvars.copy_context().run,
+        search_text_db,
+        query,
+        uid,
+        timestamp,
+        top_k=candidates,
+    )
+
+    fused = reciprocal_rank_fusion([vector_future.result(), text_future.result()])
+    return rerank_by_term_overlap(query, fused, top_k=keep or top_k)
+
+
+def multi_query_search(
+    queries: list[str],
+    uid: str,
+    timestamp: datetime,
+    *,
+    top_k: int = 20,
+    scoring: MemoryScoring | None = DEFAULT_SCORING,
+) -> List[dict]:
+    """Search several probe queries at once and merge them into one ranking.
+
+    All queries are embedded in a single Gemini request; the vector and
+    lexical searches for every query then run concurrently and the result
+    lists are fused with RRF, which also deduplicates by id.
+    """
+
+    queries = list(dict.fromkeys(q.strip() for q in queries if q and q.strip()))
+    if not queries:
+        return []
+    candidates = top_k * HYBRID_CANDIDATE_FACTOR
+    embeddings = get_gemini_embeddings(
+        queries,
+        task_type="RETRIEVAL_QUERY",
+        output_dimensionality=EMBEDDING_DIMENSIONS,
+    )
+    futures = [
+        _search_pool.submit(
+            contextvars.copy_context().run,
+            search_vector_db,
+            embedding,
+            uid,
+            timestamp,
+            top_k=candidates,
+        )
+        for embedding in embeddings
+    ] + [
+        _search_pool.submit(
+            contextvars.copy_context().run,
+            search_text_db,
+            query,
+            uid,
+            timestamp,
+            top_k=candidates,
+        )
+        for query in queries
+    ]
+
+    fused = reciprocal_rank_fusion([future.result() for future in futures])
+    if scoring is None:
+        return fused[:top_k]
+    return score_memories(fused, scoring, now=timestamp, top_k=top_k)
 
 
 def store_memory(
     uid: str,
     content: str,
     timestamp: datetime | None = None,
+    importance: float | None = None,
+) -> None:
+    """Persist a conversation snippet to the vector DB for later retrieval.
+
+    ``importance`` defaults to ``estimate_importance(content)``.
+    """
+
+    effective_timestamp = timestamp or datetime.now(timezone.utc)
+    embedding = get_gemini_embedding(
+        content,
+        task_type="RETRIEVAL_DOCUMENT",
+        output_dimensionality=EMBEDDING_DIMENSIONS,
+    )
+    if importance is None:
+        importance = estimate_importance(content)
+    upload_documents(uid, content, embedding, effective_timestamp, importance)
+
+
+def store_memories(
+    uid: str,
+    contents: list[str],
+    timestamp: datetime | None = None,
+    importances: list[float] | None = None,
 ) -> None:
-    """Persist a conversation snippet to the vector DB for later retrieval."""
+    """Persist several snippets with one embedding request and one upload."""
 
+    if not contents:
+        return
     effective_timestamp = timestamp or datetime.now(timezone.utc)
-    embedding = get_gemini_embedding(content, task_type="RETRIEVAL_DOCUMENT")
-    upload_documents(uid, content, embedding, effective_timestamp)
+    embeddings = get_gemini_embeddings(
+        contents,
+        task_type="RETRIEVAL_DOCUMENT",
+        output_dimensionality=EMBEDDING_DIMENSIONS,
+    )
+    if importances is None:
+        importances = [estimate_importance(content) for content in contents]
+    upload_document_batch(
+        uid, contents, embeddings, effective_timestamp, importances=importances
+    )
@@ -0,0 +1,354 @@
+"""Semantic cache of chat replies to generic, non-personal skincare questions.
+
+Only standalone questions that open a chat, asked without photos and
+answered without any memory context, are stored. A lookup embeds the question and takes the
+nearest stored question by cosine similarity. It returns the cached reply
+only when the similarity clears a strict threshold and the entry is fresh,
+was produced by the same prompt version and was embedded by the same model.
+
+New entries are kept in memory and written every
+``SEMANTIC_CACHE_SAVE_SECONDS`` (and on shutdown) as one ``cache.npz``
+replaced atomically. Before writing, a worker merges in entries other
+workers saved since it last read the file.
+"""
+
+import asyncio
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+
+from llm.gemini import DEFAULT_DIMENSIONS, EMBEDDING_MODEL, get_gemini_embeddings
+from utils.env import get_env
+from utils.serialization import dumps, loads
+from utils.vectors import VECTOR_DTYPE
+
+logger = logging.getLogger(__name__)
+
+SEMANTIC_CACHE_DIR = Path(
+    get_env(
+        "SEMANTIC_CACHE_DIR",
+        str(Path(tempfile.gettempdir()) / "glowly-semantic-cache"),
+    )
+)
+# Paraphrases of the same question score ~0.95+; related-but-different
+# questions ("vitamin C in the morning" vs "at night") land around 0.90.
+SIMILARITY_THRESHOLD = float(get_env("SEMANTIC_CACHE_THRESHOLD", "0.95"))
+SEMANTIC_CACHE_TTL_SECONDS = float(
+    get_env("SEMANTIC_CACHE_TTL_SECONDS", str(7 * 24 * 3600))
+)
+SEMANTIC_CACHE_MAX_ENTRIES = int(get_env("SEMANTIC_CACHE_MAX_ENTRIES", "5000"))
+SAVE_INTERVAL_SECONDS = float(get_env("SEMANTIC_CACHE_SAVE_SECONDS", "30"))
+CACHE_FILE = "cache.npz"
+LATENCY_WINDOW = 1000
+
+_WORDS = re.compile(r"[a-z0-9']+")
+_QUESTION_START = frozenset(
+    "what how why when which should can could is are does do will".split()
+)
+# First-person words mean the answer depends on the user.
+_PERSONAL = frozenset(
+    "i i'm i've me my mine myself we our us photo photos scan picture".split()
+)
+# Shopping and time-sensitive requests need live data.
+_VOLATILE = frozenset(
+    "buy price prices cheap cheapest deal deals link links shop store stores "
+    "near today now latest currently sale".split()
+)
+# Openers that refer back to earlier turns.
+_FOLLOW_UP = frozenset("it that this they those these also and but so".split())
+
+
+def classify_cacheable(message: str) -> tuple[bool, str]:
+    """Decide whether a message is a standalone generic question.
+
+    Returns ``(cacheable, reason)``; the reason is for stats and logs.
+    """
+    words = _WORDS.findall(message.lower())
+    if not 3 <= len(words) <= 40:
+        return False, "length"
+    if not (message.strip().endswith("?") or words[0] in _QUESTION_START):
+        return False, "not_question"
+    if words[0] in _FOLLOW_UP or "about" in words[:2]:
+        return False, "follow_up"
+    if _PERSONAL.intersection(words):
+        return False, "personal"
+    if _VOLATILE.intersection(words):
+        return False, "volatile"
+    return True, "generic"
+
+
+@dataclass
+class CacheLookup:
+    reply: str | None
+    embedding: np.ndarray | None
+    similarity: float
+    seconds: float
+
+
+class SemanticCache:
+    """Brute-force cosine index over normalized question embeddings."""
+
+    def __init__(
+        self,
+        directory: Path = SEMANTIC_CACHE_DIR,
+        *,
+        threshold: float = SIMILARITY_THRESHOLD,
+        ttl_seconds: float = SEMANTIC_CACHE_TTL_SECONDS,
+        max_entries: int = SEMANTIC_CACHE_MAX_ENTRIES,
+        interval: float = SAVE_INTERVAL_SECONDS,
+        model: str = EMBEDDING_MODEL,
+    ):
+        self.directory = Path(directory)
+        self.model = model
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._loaded = False
+        self._dirty = False
+        self._disk_mtime: int | None = None
+        self._task: asyncio.Task | None = None
+        self._entries: list[dict] = []
+        self._matrix = np.empty((0, DEFAULT_DIMENSIONS), dtype=VECTOR_DTYPE)
+        self._hit_seconds: deque[float] = deque(maxlen=LATENCY_WINDOW)
+        self.stats = {"hits": 0, "misses": 0, "stale": 0, "stored": 0}
+
+    def _embed(self, question: str) -> np.ndarray:
+        return get_gemini_embeddings(
+            [question],
+            task_type="SEMANTIC_SIMILARITY",
+            output_dimensionality=DEFAULT_DIMENSIONS,
+            model=self.model,
+        )[0]
+
+    def _ensure_loaded(self) -> None:
+        if self._loaded:
+            return
+        self._loaded = True
+        saved = self._read()
+        if saved is not None:
+            self._merge(*saved)
+
+    def _read(self) -> tuple[list[dict], np.ndarray] | None:
+        path = self.directory / CACHE_FILE
+        try:
+            mtime = path.stat().st_mtime_ns
+            with np.load(path) as data:
+                entries = loads(data["entries"].tobytes())
+                matrix = data["embeddings"].astype(VECTOR_DTYPE)
+        except (FileNotFoundError, ValueError, KeyError) as exc:
+            if not isinstance(exc, FileNotFoundError):
+                logger.warning("Ignoring unreadable semantic cache: %s", exc)
+            return None
+        self._disk_mtime = mtime
+        if len(entries) != len(matrix):
+            logger.warning("Semantic cache embeddings out of sync; ignoring it")
+            return None
+        return entries, matrix
+
+    def _usable(self, entry: dict, version: str | None = None) -> bool:
+        return (
+            (version is None or entry["version"] == version)
+            and entry.get("model") == self.model
+            and entry["created_at"] >= time.time() - self.ttl_seconds
+        )
+
+    def _merge(self, entries: list[dict], matrix: np.ndarray) -> None:
+        """Take saved entries this worker does not hold yet."""
+        if self._entries and matrix.shape[1] != self._matrix.shape[1]:
+            return
+        known = {(e["question"], e["version"], e["created_at"]) for e in self._entries}
+        for entry, embedding in zip(entries, matrix):
+            key = (entry["question"], entry["version"], entry["created_at"])
+            if key not in known and self._usable(entry):
+                known.add(key)
+                self._append(entry, embedding)
+
+    def lookup(self, question: str, version: str) -> CacheLookup:
+        started = time.perf_counter()
+        embedding = self._embed(question)
+        with self._lock:
+            self._ensure_loaded()
+            if not self._entries or self._matrix.shape[1] != embedding.size:
+                self.stats["misses"] += 1
+                return CacheLookup(None, embedding, 0.0, time.perf_counter() - started)
+            scores = self._matrix[: len(self._entries)] @ embedding
+            similarity = float(scores.max())
+            # Mask stale rows first so they cannot shadow a fresh near match.
+            usable = np.fromiter(
+                (self._usable(e, version) for e in self._entries),
+                dtype=bool,
+                count=len(self._entries),
+            )
+            if usable.any():
+                best = int(np.argmax(np.where(usable, scores, -np.inf)))
+                if scores[best] >= self.threshold:
+                    seconds = time.perf_counter() - started
+                    self.stats["hits"] += 1
+                    self._hit_seconds.append(seconds)
+                    return CacheLookup(
+                        self._entries[best]["reply"],
+                        embedding,
+                        float(scores[best]),
+                        seconds,
+                    )
+            self.stats["stale" if similarity >= self.threshold else "misses"] += 1
+        return CacheLookup(None, embedding, similarity, time.perf_counter() - started)
+
+    def store(
+        self,
+        question: str,
+        reply: str,
+        version: str,
+        embedding: np.ndarray | None = None,
+    ) -> None:
+        if embedding is None:
+            embedding = self._embed(question)
+        entry = {
+            "question": question,
+            "reply": reply,
+            "version": version,
+            "model": self.model,
+            "created_at": time.time(),
+        }
+        with self._lock:
+            self._ensure_loaded()
+            if self._matrix.shape[1] != embedding.size:
+                # Dimensions changed; old vectors are useless.
+                self._entries = []
+                self._matrix = np.empty((0, embedding.size), dtype=VECTOR_DTYPE)
+            self._append(entry, embedding, version)
+            self.stats["stored"] += 1
+            self._dirty = True
+
+    def _append(
+        self, entry: dict, embedding: np.ndarray, version: str | None = None
+    ) -> None:
+        if not self._entries and self._matrix.shape[1] != embedding.size:
+            self._matrix = np.empty((0, embedding.size), dtype=VECTOR_DTYPE)
+        if len(self._entries) >= self._matrix.shape[0]:
+            self._compact(version)
+        self._matrix[len(self._entries)] = embedding
+        self._entries.append(entry)
+
+    def _compact(self, version: str | None) -> None:
+        """Drop stale entries and make room, so stores mostly fill spare rows."""
+        keep = [i for i, e in enumerate(self._entries) if self._usable(e, version)][
+            -(self.max_entries - 1) :
+        ]
+        capacity = max(min(max(64, 2 * len(keep)), self.max_entries), len(keep) + 1)
+        matrix = np.zeros((capacity, self._matrix.shape[1]), dtype=VECTOR_DTYPE)
+        matrix[: len(keep)] = self._matrix[keep]
+        self._entries = [self._entries[i] for i in keep]
+        self._matrix = matrix
+
+    def flush(self) -> bool:
+        """Write the cache if it changed; returns whether a file was written.
+
+        Entries other workers saved since this one last read the file are
+        merged in first, so workers share answers instead of overwriting them.
+        """
+        with self._flush_lock:
+            with self._lock:
+                self._ensure_loaded()
+            self._merge_from_disk()
+            return self._flush()
+
+    def _merge_from_disk(self) -> None:
+        try:
+            mtime = (self.directory / CACHE_FILE).stat().st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime == self._disk_mtime:
+            return
+        saved = self._read()
+        if saved is None:
+            return
+        with self._lock:
+            self._merge(*saved)
+            # The file lacks entries only this worker has; write them back.
+            if len(self._entries) > len(saved[0]):
+                self._dirty = True
+
+    def _flush(self) -> bool:
+        with self._lock:
+            if not self._dirty:
+                return False
+            entries = dumps(self._entries)
+            matrix = self._matrix[: len(self._entries)].copy()
+            self._dirty = False
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            fd, tmp_name = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as handle:
+                    np.savez(
+                        handle,
+                        entries=np.frombuffer(entries, dtype=np.uint8),
+                        embeddings=matrix,
+                    )
+                # A rename keeps the mtime; read it before another worker can
+                # replace the file again.
+                mtime = os.stat(tmp_name).st_mtime_ns
+                os.replace(tmp_name, self.directory / CACHE_FILE)
+                self._disk_mtime = mtime
+            except BaseException:
+                Path(tmp_name).unlink(missing_ok=True)
+                raise
+        except Exception:
+            with self._lock:
+                self._dirty = True
+            raise
+        return True
+
+    async def _loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await asyncio.to_thread(self.flush)
+            except Exception as exc:
+                logger.warning("Failed to save semantic cache: %s", exc)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        try:
+            await asyncio.to_thread(self.flush)
+        except Exception as exc:
+            logger.warning("Failed to save semantic cache: %s", exc)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            latencies = np.array(self._hit_seconds)
+            return {
+                **self.stats,
+                "entries": len(self._entries),
+                "hit_p50_ms": float(np.percentile(latencies, 50) * 1000)
+                if latencies.size
+                else None,
+                "hit_p95_ms": float(np.percentile(latencies, 95) * 1000)
+                if latencies.size
+                else None,
+            }
+
+
+semantic_cache = SemanticCache()
@@ -0,0 +1,128 @@
+"""Vectorized pixel heuristics for the five scan ratings.
+
+Scores are on the same 1-5 scale the ratings prompt used, where 5 is the
+healthiest reading. They are heuristics for seeding the analysis, not a
+diagnosis.
+"""
+
+from typing import Any
+
+import numpy as np
+
+from utils.images import load_rgb
+from utils.workers import get_cpu_pool
+
+MAX_IMAGE_SIDE = 384
+BLOCK = 8
+MIN_SKIN_FRACTION = 0.05
+RATING_KEYS = ("hydration", "oilBalance", "tone", "barrierStrength", "sensitivity")
+
+# (healthy, concerning) reference values mapped linearly onto 5 -> 1.
+ROUGHNESS_RANGE = (0.01, 0.06)
+SHINE_RANGE = (0.005, 0.08)
+UNEVENNESS_RANGE = (0.03, 0.20)
+REDNESS_RANGE = (0.12, 0.35)
+
+
+def _score(value: float, bounds: tuple[float, float]) -> float:
+    return float(np.interp(value, bounds, (5.0, 1.0)))
+
+
+def _crop(rgb: np.ndarray, box: list[int] | None) -> np.ndarray:
+    if box:
+        x0, y0, x1, y1 = box
+        if x1 - x0 > BLOCK * 2 and y1 - y0 > BLOCK * 2:
+            return rgb[y0:y1, x0:x1]
+    # No detection: the capture guide centres the face, so keep the middle.
+    height, width = rgb.shape[:2]
+    return rgb[height // 6 : height * 5 // 6, width // 6 : width * 5 // 6]
+
+
+def _skin_mask(image: np.ndarray, luma: np.ndarray) -> np.ndarray:
+    cr = (image[..., 0] - luma) * 0.713 + 0.5
+    cb = (image[..., 2] - luma) * 0.564 + 0.5
+    mask = (cr >= 133 / 255) & (cr <= 173 / 255) & (cb >= 77 / 255) & (cb <= 127 / 255)
+    if mask.mean() < MIN_SKIN_FRACTION:
+        return np.ones_like(mask)
+    return mask
+
+
+def measure_image(data: bytes, box: list[int] | None = None) -> dict[str, Any]:
+    """Raw heuristic measurements for one photo, computed with whole-array ops."""
+
+    image = _crop(load_rgb(data, max_side=MAX_IMAGE_SIDE), box).astype(np.float32)
+    image /= 255.0
+    luma = image @ np.array([0.299, 0.587, 0.114], dtype=np.float32)
+    skin = _skin_mask(image, luma)
+
+    # Texture: mean absolute Laplacian of luminance over skin pixels.
+    laplacian = np.abs(
+        4 * luma[1:-1, 1:-1]
+        - luma[:-2, 1:-1]
+        - luma[2:, 1:-1]
+        - luma[1:-1, :-2]
+        - luma[1:-1, 2:]
+    )
+    roughness = float(laplacian[skin[1:-1, 1:-1]].mean())
+
+    # Shine: bright, desaturated specular pixels relative to the skin area.
+    brightest = image.max(axis=2)
+    saturation = (brightest - image.min(axis=2)) / np.maximum(brightest, 1e-6)
+    highlights = (brightest > 0.92) & (saturation < 0.18)
+    shine = float(highlights.sum() / max(skin.sum() + highlights.sum(), 1))
+
+    # Tone: spread of 8x8 block mean luminance, ignoring mostly non-skin blocks.
+    rows, cols = luma.shape[0] // BLOCK, luma.shape[1] // BLOCK
+    blocks = luma[: rows * BLOCK, : cols * BLOCK].reshape(rows, BLOCK, cols, BLOCK)
+    block_skin = skin[: rows * BLOCK, : cols * BLOCK].reshape(rows, BLOCK, cols, BLOCK)
+    block_means = blocks.mean(axis=(1, 3))[block_skin.mean(axis=(1, 3)) > 0.5]
+    if block_means.size > 1:
+        unevenness = float(block_means.std() / max(block_means.mean(), 1e-6))
+    else:
+        unevenness = 0.0
+
+    # Redness: normalized red-green difference over skin.
+    red, green = image[..., 0][skin], image[..., 1][skin]
+    redness = float(((red - green) / np.maximum(red + green, 1e-6)).mean())
+
+    return {
+        "roughness": roughness,
+        "shine": shine,
+        "unevenness": unevenness,
+        "redness": redness,
+        "skin_pixels": int(skin.sum()),
+    }
+
+
+def ratings_from_measurements(measurements: list[dict[str, Any]]) -> dict[str, int]:
+    """Combine per-photo measurements, weighted by skin area, into 1-5 ratings."""
+
+    weights = np.array([m["skin_pixels"] for m in measurements], dtype=np.float64)
+    weights = weights / weights.sum() if weights.sum() else None
+
+    def combined(key: str) -> float:
+        return float(np.average([m[key] for m in measurements], weights=weights))
+
+    hydration = _score(combined("roughness"), ROUGHNESS_RANGE)
+    sensitivity = _score(combined("redness"), REDNESS_RANGE)
+    scores = {
+        "hydration": hydration,
+        "oilBalance": _score(combined("shine"), SHINE_RANGE),
+        "tone": _score(combined("unevenness"), UNEVENNESS_RANGE),
+        "barrierStrength": (hydration + sensitivity) / 2,
+        "sensitivity": sensitivity,
+    }
+    return {key: int(round(scores[key])) for key in RATING_KEYS}
+
+
+def compute_ratings(
+    images: list[bytes],
+    boxes: list[list[int] | None] | None = None,
+) -> dict[str, int]:
+    """Measure every photo in the CPU pool and return the ratings dict."""
+
+    if not images:
+        raise ValueError("At least one photo is required")
+    boxes = boxes or [None] * len(images)
+    measurements = list(get_cpu_pool().map(measure_image, images, boxes))
+    return ratings_from_measurements(measurements)
@@ -0,0 +1,181 @@
+"""Lazy provider registry, concurrent warm-up and readiness reporting."""
+
+import asyncio
+import importlib
+import logging
+import re
+import subprocess
+import sys
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable
+
+logger = logging.getLogger(__name__)
+
+# Recorded on first import (app.py imports this module first) so readiness can
+# report how long the rest of the import graph took before the lifespan ran.
+PROCESS_STARTED = time.perf_counter()
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+
+
+@dataclass
+class Provider:
+    """A client that is built on first use and shared for the whole process."""
+
+    name: str
+    factory: Callable[[], Any] | str
+    required: bool = True
+    instance: Any = None
+    error: str | None = None
+    init_seconds: float | None = None
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def _resolve_factory(self) -> Callable[[], Any]:
+        if callable(self.factory):
+            return self.factory
+        module_name, _, attr = self.factory.partition(":")
+        return getattr(importlib.import_module(module_name), attr)
+
+    def get(self) -> Any:
+        if self.instance is not None:
+            return self.instance
+        with self._lock:
+            if self.instance is None:
+                started = time.perf_counter()
+                try:
+                    self.instance = self._resolve_factory()()
+                    self.error = None
+                except Exception as exc:
+                    self.error = str(exc)
+                    raise
+                finally:
+                    self.init_seconds = time.perf_counter() - started
+        return self.instance
+
+    @property
+    def ready(self) -> bool:
+        return self.instance is not None
+
+
+PROVIDERS: dict[str, Provider] = {}
+
+
+def register_provider(
+    name: str,
+    factory: Callable[[], Any] | str,
+    *,
+    required: bool = True,
+) -> Provider:
+    """Register a client factory; ``"module:attr"`` strings defer the import."""
+
+    provider = Provider(name=name, factory=factory, required=required)
+    PROVIDERS[name] = provider
+    return provider
+
+
+def get_provider(name: str) -> Any:
+    try:
+        provider = PROVIDERS[name]
+    except KeyError as exc:
+        raise RuntimeError(f"Provider '{name}' is not registered") from exc
+    return provider.get()
+
+
+class LazyProvider:
+    """Module-level stand-in that builds the provider on first attribute access."""
+
+    def __init__(self, name: str):
+        self._name = name
+
+    def __getattr__(self, item: str) -> Any:
+        return getattr(get_provider(self._name), item)
+
+    def __repr__(self) -> str:
+        return f"LazyProvider({self._name!r})"
+
+
+STARTUP_STATS: dict[str, float | None] = {
+    "import_seconds": None,
+    "warmup_seconds": None,
+}
+
+
+async def initialize_providers(
+    names: list[str] | None = None,
+    *,
+    timeout: float = 30.0,
+) -> dict[str, Any]:
+    """Warm the given providers concurrently; failures are recorded, not raised."""
+
+    targets = [PROVIDERS[name] for name in (names or list(PROVIDERS))]
+
+    async def _warm(provider: Provider) -> None:
+        try:
+            await asyncio.wait_for(asyncio.to_thread(provider.get), timeout)
+        except Exception as exc:
+            provider.error = provider.error or str(exc) or type(exc).__name__
+            logger.warning("Provider '%s' failed to initialize: %s", provider.name, exc)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(_warm(provider) for provider in targets))
+    STARTUP_STATS["import_seconds"] = started - PROCESS_STARTED
+    STARTUP_STATS["warmup_seconds"] = time.perf_counter() - started
+    return readiness()
+
+
+def readiness() -> dict[str, Any]:
+    providers = {
+        name: {
+            "ready": provider.ready,
+            "required": provider.required,
+            "init_seconds": provider.init_seconds,
+            "error": provider.error,
+        }
+        for name, provider in PROVIDERS.items()
+    }
+    return {
+        "ready": all(p.ready for p in PROVIDERS.values() if p.required),
+        "providers": providers,
+        **STARTUP_STATS,
+    }
+
+
+_IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def import_profile(module: str = "app", limit: int = 15) -> list[tuple[str, float]]:
+    """Return the slowest top-level imports of ``module`` as (name, seconds)."""
+
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=BACKEND_DIR,
+        capture_output=True,
+        text=True,
+        check=False,
+    )
+
+    cumulative: dict[str, float] = {}
+    for line in completed.stderr.splitlines():
+        match = _IMPORTTIME_LINE.match(line)
+        if not match:
+            continue
+        # Keep ``module`` itself and its direct imports; deeper entries are
+        # already included in their parents' cumulative totals.
+        if len(match.group(3)) > 3:
+            continue
+        cumulative[match.group(4)] = int(match.group(2)) / 1_000_000
+
+    ranked = sorted(cumulative.items(), key=lambda item: item[1], reverse=True)
+    return ranked[:limit]
+
+
+register_provider("firestore", "database.firebase:init_firebase")
+register_provider("gemini", "llm.gemini:_get_client")
+register_provider("azure_search", "utils.search:get_search_client")
+
+
+if __name__ == "__main__":
+    for name, seconds in import_profile():
+        print(f"{seconds * 1000:9.1f} ms  {name}")
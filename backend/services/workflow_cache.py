@@ -0,0 +1,61 @@
+"""Cache of full workflow results keyed by photo content and prompt version."""
+
+import hashlib
+import tempfile
+from pathlib import Path
+from typing import Any, Callable
+
+from utils.cache import DiskCache, SingleFlight
+from utils.env import get_env
+
+WORKFLOW_CACHE_DIR = Path(
+    get_env(
+        "WORKFLOW_CACHE_DIR",
+        str(Path(tempfile.gettempdir()) / "glowly-workflow-cache"),
+    )
+)
+WORKFLOW_CACHE_TTL_SECONDS = float(get_env("WORKFLOW_CACHE_TTL_SECONDS", "86400"))
+WORKFLOW_CACHE_MAX_ENTRIES = int(get_env("WORKFLOW_CACHE_MAX_ENTRIES", "2000"))
+
+workflow_cache = DiskCache(
+    WORKFLOW_CACHE_DIR,
+    ttl_seconds=WORKFLOW_CACHE_TTL_SECONDS,
+    max_entries=WORKFLOW_CACHE_MAX_ENTRIES,
+)
+_flights = SingleFlight()
+
+
+def workflow_cache_key(photo_digests: list[str], country: str, version: str) -> str:
+    """Order-independent key over the decoded photos, country and prompt version."""
+    parts = [*sorted(photo_digests), country.lower(), version]
+    return hashlib.sha256("|".join(parts).encode()).hexdigest()
+
+
+def cached_workflow(
+    key: str,
+    compute: Callable[[], dict[str, Any]],
+    *,
+    cacheable: Callable[[dict[str, Any]], bool] = lambda result: True,
+) -> tuple[dict[str, Any], bool]:
+    """Return ``(result, computed_here)``.
+
+    A cached result is served directly; otherwise concurrent callers with the
+    same key share one ``compute()`` and the leader stores the result when
+    ``cacheable(result)`` holds.
+    """
+    cached = workflow_cache.get(key)
+    if cached is not None:
+        return cached, False
+
+    def compute_and_store() -> tuple[dict[str, Any], bool]:
+        # A previous leader may have finished between our miss and now.
+        cached = workflow_cache.get(key)
+        if cached is not None:
+            return cached, False
+        result = compute()
+        if cacheable(result):
+            workflow_cache.set(key, result)
+        return result, True
+
+    (result, computed), leader = _flights.do(key, compute_and_store)
+    return result, leader and computed
@@ -0,0 +1,174 @@
+import pytest
+from httpx import ASGITransport, AsyncClient
+
+from agents import cosmetist, routing
+from app import app
+from routers import usage as usage_router
+from services import accounting
+from services.accounting import UsageLedger, usage_scope
+from services.admission import admission_context
+
+
+class FakeDocument:
+    def __init__(self, store: dict, doc_id: str):
+        self.store = store
+        self.doc_id = doc_id
+
+    def get(self):
+        data = self.store.get(self.doc_id)
+        return type(
+            "Snapshot", (), {"exists": data is not None, "to_dict": lambda s: data}
+        )()
+
+    def set(self, data, merge=False):
+        if self.store.get("fail"):
+            raise RuntimeError("firestore unavailable")
+        self.store.setdefault("writes", []).append((self.doc_id, data))
+
+
+class FakeDb:
+    def __init__(self):
+        self.store: dict = {}
+
+    def collection(self, name):
+        return self
+
+    def document(self, doc_id):
+        return FakeDocument(self.store, doc_id)
+
+
+@pytest.fixture
+def ledger(monkeypatch):
+    ledger = UsageLedger(daily_budget=0.01, degrade_at=0.5)
+    db = FakeDb()
+    for module in (accounting, routing, cosmetist, usage_router):
+        monkeypatch.setattr(module, "usage_ledger", ledger)
+    monkeypatch.setattr(accounting, "db", db)
+    monkeypatch.setattr(accounting, "_increments", lambda values: values)
+    ledger.db = db
+    return ledger
+
+
+def test_usage_is_split_by_uid_chat_and_task_and_flushed(ledger):
+    usage = {
+        "prompt_tokens": 1000,
+        "completion_tokens": 100,
+        "prompt_tokens_details": {"cached_tokens": 400},
+    }
+    with admission_context("u1"), usage_scope(chat_id="c1"):
+        routing.route(
+            "ratings",
+            lambda model: routing.record_usage(model, usage, images=2) or "{}",
+        )
+        ledger.record_serper(seconds=0.2)
+        ledger.record_serper(cached=True)
+    with admission_context("u2"):
+        routing.record_usage("gpt-4o", usage)
+
+    report = ledger.usage("u1")
+    ratings = report["tasks"]["ratings"]
+    assert ratings["cached_tokens"] == 400
+    assert ratings["image_tokens"] == 2 * accounting.IMAGE_TOKEN_ESTIMATE
+    # Cached prompt tokens are billed at half price on the nano model.
+    assert ratings["cost"] == pytest.approx((800 * 0.10 + 100 * 0.40) / 1e6)
+    assert report["tasks"]["other"]["serper_calls"] == 1
+    assert report["chats"]["c1"]["serper_cache_hits"] == 1
+    assert "u1" not in str(ledger.usage("u2")["chats"])
+
+    ledger.db.store["fail"] = True
+    assert ledger.flush() == 0
+    ledger.db.store["fail"] = False
+    assert ledger.flush() == 2
+    doc_id, data = ledger.db.store["writes"][0]
+    assert doc_id.startswith("u1_")
+    assert data["tasks"]["ratings"]["prompt_tokens"] == 1000
+    assert data["totals"]["serper_calls"] == 1
+    assert ledger.flush() == 0
+
+
+def test_budget_degrades_model_then_drops_photos_and_serper(ledger, monkeypatch):
+    calls = []
+
+    def fake_request(messages, model, tools, **kwargs):
+        calls.append((model, [t["function"]["name"] for t in tools], messages))
+        return "ok"
+
+    monkeypatch.setattr(cosmetist, "_make_openai_request", fake_request)
+    photo = "data:image/jpeg;base64,AAAA"
+    history = [{"role": "user", "content": "hi"}]
+
+    with admission_context("u"):
+        cosmetist.run_chat_turn([photo], history)
+        for _ in range(5):
+            ledger.record_serper()  # $0.001 each against a $0.01 budget
+        assert ledger.budget_state() == "degraded"
+        cosmetist.run_chat_turn([photo], history)
+        models = []
+        routing.route("ratings", lambda m: models.append(m) or "bad", lambda r: False)
+        assert models == [routing.model_for("ratings")]  # no escalation
+        for _ in range(5):
+            ledger.record_serper()
+        assert ledger.budget_state() == "exhausted"
+        cosmetist.run_chat_turn([photo], history)
+
+    (full_model, full_tools, full), (small, _, _), (_, tools, exhausted) = calls
+    assert full_model == cosmetist.DEFAULT_MODEL
+    assert "serper" in full_tools and accounting.count_images(full) == 1
+    assert small == routing.MODEL_TIERS["openai"]["small"]
+    assert tools == ["local_catalog"] and accounting.count_images(exhausted) == 0
+
+
+@pytest.mark.asyncio
+async def test_usage_endpoint_merges_stored_and_pending(ledger):
+    ledger.db.store[f"u_{accounting._today()}"] = {
+        "totals": {"requests": 3, "cost": 0.002},
+        "tasks": {"chat": {"requests": 3, "cost": 0.002}},
+    }
+    with admission_context("u"), usage_scope(task="chat", chat_id="c"):
+        ledger.record_completion({"prompt_tokens": 10}, cost=0.004)
+
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://test"
+    ) as client:
+        response = await client.get("/usage/u")
+
+    body = response.json()
+    assert body["totals"]["requests"] == 4
+    assert body["tasks"]["chat"]["cost"] == pytest.approx(0.006)
+    assert body["chats"]["c"]["prompt_tokens"] == 10
+    assert body["budget"]["state"] == "degraded"
+
+
+@pytest.mark.asyncio
+async def test_budget_override_requires_admin_token(ledger, monkeypatch):
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://test"
+    ) as client:
+        disabled = await client.put("/usage/u/budget", json={"daily_usd": 5})
+        monkeypatch.setattr(usage_router, "USAGE_ADMIN_TOKEN", "secret")
+        wrong = await client.put(
+            "/usage/u/budget", json={"daily_usd": 5}, headers={"X-Admin-Token": "no"}
+        )
+        allowed = await client.put(
+            "/usage/u/budget",
+            json={"daily_usd": 5},
+            headers={"X-Admin-Token": "secret"},
+        )
+
+    assert (disabled.status_code, wrong.status_code) == (403, 401)
+    assert allowed.json()["daily_usd"] == 5
+    assert ledger.budget_for("u") == 5
+
+
+def test_refresh_picks_up_spend_from_other_workers(ledger, monkeypatch):
+    monkeypatch.setattr(ledger, "load_budgets", lambda: 0)
+    doc_id = f"u_{accounting._today()}"
+    with admission_context("u"):
+        ledger.record_serper()  # $0.001 here
+        assert ledger.budget_state() == "ok"
+        # Another worker flushed $0.008 for the same user.
+        ledger.db.store[doc_id] = {"totals": {"cost": 0.008}}
+        assert ledger.budget_state() == "ok"
+        ledger.refresh()
+        assert ledger.spent("u") == pytest.approx(0.009)
+        assert ledger.budget_state() == "degraded"
@@ -0,0 +1,90 @@
+import threading
+import time
+
+import pytest
+from httpx import ASGITransport, AsyncClient
+
+from app import app
+from services import admission
+from services.admission import Overloaded, ProviderLimiter, admission_context
+
+
+def _run_queued(limiter, callers):
+    """Hold the only slot, queue ``callers`` in order, then release them."""
+    order, threads = [], []
+    holding, release = threading.Event(), threading.Event()
+
+    def hold():
+        with admission_context("holder"), limiter.acquire():
+            holding.set()
+            release.wait(timeout=5)
+
+    def call(uid, priority):
+        with admission_context(uid, priority), limiter.acquire():
+            order.append(uid)
+
+    threads.append(threading.Thread(target=hold))
+    threads[0].start()
+    holding.wait(timeout=5)
+    for uid, priority in callers:
+        thread = threading.Thread(target=call, args=(uid, priority))
+        thread.start()
+        threads.append(thread)
+        time.sleep(0.02)
+    release.set()
+    for thread in threads:
+        thread.join(timeout=5)
+    return order
+
+
+def test_fair_queue_interleaves_uids_and_honours_priority(monkeypatch):
+    # Fast calls, so nothing in this short queue is shed.
+    monkeypatch.setattr(admission, "INITIAL_SERVICE_SECONDS", 0.01)
+    limiter = ProviderLimiter("test", rate=1000, concurrency=1)
+    order = _run_queued(
+        limiter,
+        [
+            ("flood", "interactive"),
+            ("flood-2", "background"),
+            ("flood", "interactive"),
+            ("flood", "interactive"),
+            ("calm", "interactive"),
+            ("job", "workflow"),
+        ],
+    )
+    # "calm" arrives after three "flood" calls but only waits behind the first.
+    assert order == ["flood", "calm", "flood", "flood", "job", "flood-2"]
+
+
+def test_limiter_sheds_past_latency_slo(monkeypatch):
+    monkeypatch.setitem(admission.LATENCY_SLO_SECONDS, "interactive", 0.5)
+    limiter = ProviderLimiter("test", rate=1, concurrency=4)
+    with limiter.acquire():
+        pass
+    # The burst of two tokens is spent; the next few need >0.5s of refill.
+    with limiter.acquire():
+        pass
+    with pytest.raises(Overloaded) as excinfo:
+        with limiter.acquire():
+            pass
+    assert excinfo.value.retry_after >= 1
+    assert limiter.snapshot()["shed"] == 1
+
+
+@pytest.mark.asyncio
+async def test_overloaded_provider_returns_503_with_retry_after(monkeypatch):
+    def overloaded(priority, providers=()):
+        raise Overloaded("openai", 7.2)
+
+    monkeypatch.setattr("routers.chat.check_capacity", overloaded)
+
+    async with AsyncClient(
+        transport=ASGITransport(app=app),
+        base_url="http://test",
+    ) as client:
+        response = await client.post(
+            "/chat/turn", json={"uid": "u", "message": "hi", "history": []}
+        )
+
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "8"
@@ -0,0 +1,108 @@
+import time
+
+import pytest
+
+from agents import cosmetist
+from utils import cassettes as cassettes_module
+from utils.cassettes import CassetteMiss, CassetteRecorder, request_key
+from utils.serialization import dumps_str
+
+
+def test_key_ignores_ordering_timestamps_and_photo_encoding():
+    first = {
+        "filter": "uid eq 'u' and timestamp le 2024-05-01T10:00:00Z",
+        "vector": [0.1234567891, 0.5],
+        "photo": "data:image/jpeg;base64,AAAA",
+        "unused": None,
+    }
+    second = {
+        "photo": "data:image/jpeg;base64,AAAA",
+        "vector": [0.1234568, 0.5],
+        "filter": "uid eq 'u' and timestamp le 2025-01-09T08:30:12.123456+00:00",
+    }
+    assert request_key("azure_search", first) == request_key("azure_search", second)
+    assert request_key("azure_search", first) != request_key("gemini", first)
+    assert request_key("openai", {"q": "spf"}) != request_key("openai", {"q": "spf 50"})
+
+
+def test_record_then_replay_with_injected_latency(tmp_path):
+    calls = []
+
+    def perform():
+        calls.append(1)
+        return {"values": (1.0, 2.0)}
+
+    recorder = CassetteRecorder(tmp_path, "record", latency_scale=0)
+    assert recorder.call("gemini", {"contents": ["hi"]}, perform) == {
+        "values": [1.0, 2.0]
+    }
+    assert list(tmp_path.glob("gemini/*/*.json.gz"))
+
+    replay = CassetteRecorder(tmp_path, "replay", latency_scale=0, extra_latency_ms=50)
+    started = time.perf_counter()
+    assert replay.call("gemini", {"contents": ["hi"]}, perform) == {
+        "values": [1.0, 2.0]
+    }
+    assert time.perf_counter() - started >= 0.05
+    assert calls == [1]
+    with pytest.raises(CassetteMiss):
+        replay.call("gemini", {"contents": ["bye"]}, perform)
+    assert replay.stats == {"recorded": 0, "replayed": 1, "missed": 1}
+
+
+def test_openai_tool_loop_replays_offline(tmp_path, monkeypatch):
+    chunks = [
+        {"choices": [{"delta": {"content": "Use "}}]},
+        {"choices": [{"delta": {"content": "SPF."}}]},
+        {"choices": [], "usage": {"prompt_tokens": 5, "completion_tokens": 2}},
+    ]
+    body = "".join(f"data: {dumps_str(c)}\n\n" for c in chunks) + "data: [DONE]\n\n"
+
+    class LiveResponse:
+        status_code = 200
+        headers = {"content-type": "text/event-stream"}
+        content = body.encode()
+
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    monkeypatch.setattr(
+        cassettes_module.requests, "post", lambda *args, **kwargs: LiveResponse()
+    )
+    recorder = CassetteRecorder(tmp_path, "record", latency_scale=0)
+    monkeypatch.setattr(cosmetist, "cassettes", recorder)
+    messages = [{"role": "user", "content": "Which sunscreen?"}]
+
+    recorded = cosmetist._make_openai_request(list(messages), on_delta=lambda t: None)
+
+    def offline(*args, **kwargs):
+        raise AssertionError("replay must not reach the network")
+
+    monkeypatch.setattr(cassettes_module.requests, "post", offline)
+    monkeypatch.delenv("OPENAI_API_KEY")
+    recorder.mode = "replay"
+    deltas = []
+    replayed = cosmetist._make_openai_request(list(messages), on_delta=deltas.append)
+
+    assert recorded == replayed == "Use SPF."
+    assert deltas == ["Use ", "SPF."]
+
+
+def test_replay_without_keys_sends_no_credentials(tmp_path, monkeypatch):
+    sent = []
+
+    class Recorder(CassetteRecorder):
+        def post(self, provider, url, *, headers=None, **kwargs):
+            sent.append(headers)
+            raise CassetteMiss(provider)
+
+    monkeypatch.delenv("OPENAI_API_KEY", raising=False)
+    monkeypatch.delenv("SERPER_API_KEY", raising=False)
+    monkeypatch.setattr(cosmetist, "cassettes", Recorder(tmp_path, "replay"))
+
+    with pytest.raises(CassetteMiss):
+        cosmetist._make_openai_request([{"role": "user", "content": "hi"}])
+    with pytest.raises(CassetteMiss):
+        cosmetist._serper_shopping_search("spf 50 sunscreen")
+    assert sent == [
+        {"Content-Type": "application/json"},
+        {"Content-Type": "application/json"},
+    ]
@@ -0,0 +1,88 @@
+import json
+
+from agents import cosmetist
+from services.catalog import ProductCatalog, parse_price
+
+RESULTS = [
+    {
+        "title": "CeraVe Hydrating Facial Cleanser",
+        "source": "Target",
+        "link": "https://example.com/cerave-cleanser",
+        "price": "$15.99",
+        "rating": 4.8,
+        "ratingCount": 12000,
+        "productId": "1",
+        "position": 1,
+    },
+    {
+        "title": "La Roche-Posay Toleriane Hydrating Gentle Cleanser",
+        "source": "Ulta",
+        "link": "https://example.com/lrp-cleanser",
+        "price": "$24.00",
+        "rating": 4.7,
+        "ratingCount": 800,
+        "productId": "2",
+    },
+    {
+        "title": "Neutrogena Hydro Boost Water Gel",
+        "source": "Target",
+        "link": "https://example.com/hydro-boost",
+        "price": "$21.49",
+        "rating": 4.5,
+        "productId": "3",
+    },
+]
+
+
+def test_catalog_dedupes_and_filters_by_columns(tmp_path):
+    catalog = ProductCatalog(tmp_path)
+    assert catalog.ingest(RESULTS) == 3
+    # Re-ingesting refreshes the existing rows instead of duplicating them.
+    repriced = {**RESULTS[0], "price": "$13.99", "productId": None}
+    assert catalog.ingest([repriced, RESULTS[1]]) == 0
+    assert len(catalog) == 3
+    assert catalog.flush() is True
+    assert catalog.flush() is False
+    assert [path.name for path in tmp_path.iterdir()] == ["catalog.npz"]
+
+    titles = [p["title"] for p in catalog.search("hydrating cleanser")]
+    assert titles[0] == "CeraVe Hydrating Facial Cleanser"
+    assert len(titles) == 2
+    cheap = catalog.search("hydrating cleanser", max_price=14)
+    assert [p["price"] for p in cheap] == ["$13.99"]
+    assert catalog.search("target gel", country="uk") == []
+
+    reloaded = ProductCatalog(tmp_path)
+    assert len(reloaded) == 3
+    assert reloaded.search("target gel")[0]["productId"] == "3"
+    # The refresh without a productId kept the known one.
+    assert reloaded.search("cerave")[0]["productId"] == "1"
+
+
+def test_workers_merge_each_others_saved_rows(tmp_path):
+    first, second = ProductCatalog(tmp_path), ProductCatalog(tmp_path)
+    first.ingest(RESULTS[:1])
+    second.ingest(RESULTS[1:])
+    first.flush()
+    second.flush()
+    assert first.flush() is False  # nothing only the first worker has
+
+    assert len(ProductCatalog(tmp_path)) == 3
+    assert first.search("water gel")[0]["productId"] == "3"
+
+
+def test_parse_price_handles_separators():
+    assert parse_price("$1,299.00") == 1299.0
+    assert parse_price("12,99 €") == 12.99
+    assert parse_price("free shipping") != parse_price("free shipping")  # NaN
+
+
+def test_local_catalog_tool_reads_ingested_results(monkeypatch, tmp_path):
+    catalog = ProductCatalog(tmp_path)
+    catalog.ingest(RESULTS)
+    monkeypatch.setattr(cosmetist, "product_catalog", catalog)
+
+    found = json.loads(
+        cosmetist._local_catalog_search({"q": "water gel", "min_rating": 4})
+    )
+    assert [p["productId"] for p in found] == ["3"]
@@ -0,0 +1,134 @@
+import time
+
+from fastapi.testclient import TestClient
+
+from app import app
+from services import chat_sessions
+
+
+class FakeDocument:
+    def __init__(self, store: dict, writes: list):
+        self.store = store
+        self.writes = writes
+
+    def get(self):
+        store = self.store
+        return type(
+            "Snapshot", (), {"exists": bool(store), "to_dict": lambda self: store}
+        )()
+
+    def set(self, data, merge=False):
+        self.writes.append(data)
+
+
+class FakeDb:
+    def __init__(self, messages):
+        self.store = {"uid": "u", "messages": messages}
+        self.writes = []
+
+    def collection(self, name):
+        assert name == "chats"
+        return self
+
+    def document(self, chat_id):
+        return FakeDocument(self.store, self.writes)
+
+
+def test_session_streams_replies_and_batches_persistence(monkeypatch):
+    db = FakeDb([{"role": "user", "content": "hi", "content_type": "text"}])
+    memory_lookups, stored_memories, histories = [], [], []
+
+    def fake_search_agent(question, **kwargs):
+        memory_lookups.append(question)
+        return {"found": True, "answer": "Uses tretinoin at night"}
+
+    def fake_turn(photo_data_urls, history, country="us", memory=None, on_delta=None):
+        histories.append([turn["content"] for turn in history])
+        for part in ("Keep ", "going."):
+            on_delta(part)
+        return "Keep going."
+
+    monkeypatch.setattr(chat_sessions, "db", db)
+    monkeypatch.setattr(chat_sessions, "_array_union", list)
+    monkeypatch.setattr(chat_sessions, "search_agent", fake_search_agent)
+    monkeypatch.setattr(
+        chat_sessions,
+        "store_memories",
+        lambda uid, contents: stored_memories.extend(contents),
+    )
+    monkeypatch.setattr("agents.cosmetist.run_chat_turn", fake_turn)
+
+    with TestClient(app).websocket_connect("/chat/ws?uid=u") as ws:
+        assert ws.receive_json() == {"type": "ready", "history": 1}
+        for message in ("My skin is peeling", "Should I stop?"):
+            ws.send_json({"message": message})
+            assert ws.receive_json() == {"type": "delta", "text": "Keep "}
+            assert ws.receive_json() == {"type": "delta", "text": "going."}
+            assert ws.receive_json()["reply"] == "Keep going."
+        assert db.writes == []
+
+    # The close-time flush runs in a worker thread after the socket is gone.
+    deadline = time.monotonic() + 2
+    while not (db.writes and stored_memories) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    # Memory context fetched once; history grew on the server, not the wire.
+    assert memory_lookups == ["My skin is peeling"]
+    assert histories[1] == ["hi", "My skin is peeling", "Keep going.", "Should I stop?"]
+    # One Firestore write and one memory batch, on close.
+    assert len(db.writes) == 1
+    assert [m["content"] for m in db.writes[0]["messages"]] == [
+        "My skin is peeling",
+        "Keep going.",
+        "Should I stop?",
+        "Keep going.",
+    ]
+    assert len(stored_memories) == 2
+
+
+def test_streamed_completion_reassembles_content_and_tool_calls():
+    import json
+
+    from agents.cosmetist import _read_stream
+
+    chunks = [
+        {"choices": [{"delta": {"content": "Let me "}}]},
+        {"choices": [{"delta": {"content": "check."}}]},
+        {
+            "choices": [
+                {
+                    "delta": {
+                        "tool_calls": [
+                            {"index": 0, "id": "call_1", "function": {"name": "serper"}}
+                        ]
+                    }
+                }
+            ]
+        },
+        {
+            "choices": [
+                {
+                    "delta": {
+                        "tool_calls": [
+                            {"index": 0, "function": {"arguments": '{"q": "spf"}'}}
+                        ]
+                    }
+                }
+            ]
+        },
+        {"choices": [], "usage": {"prompt_tokens": 5, "completion_tokens": 3}},
+    ]
+    lines = [f"data: {json.dumps(chunk)}" for chunk in chunks] + ["data: [DONE]"]
+    response = type("Response", (), {"iter_lines": lambda self, **kw: iter(lines)})()
+    deltas = []
+
+    result = _read_stream(response, deltas.append)
+
+    assert deltas == ["Let me ", "check."]
+    message = result["choices"][0]["message"]
+    assert message["content"] == "Let me check."
+    assert message["tool_calls"][0]["id"] == "call_1"
+    assert message["tool_calls"][0]["function"] == {
+        "name": "serper",
+        "arguments": '{"q": "spf"}',
+    }
+    assert result["usage"]["completion_tokens"] == 3
@@ -0,0 +1,119 @@
+import pytest
+from httpx import ASGITransport, AsyncClient
+
+from app import app
+from routers import chat as chat_router
+from utils.serialization import dumps_str
+
+PRODUCTS = [
+    {"title": "Gentle SPF 50", "link": "https://shop/a", "price": "$18.00"},
+    {"title": "Gentle SPF 50", "link": "https://shop/a", "price": "$18.00"},
+    {"title": "Mineral SPF 30", "link": "https://shop/b", "rating": 4.6},
+]
+
+
+@pytest.fixture(autouse=True)
+def stored(monkeypatch):
+    """Message count per chat id, as _persist_messages would store it."""
+    counts: dict[str, int] = {}
+
+    def fake_persist(chat_id, uid, messages):
+        counts[chat_id] = counts.get(chat_id, 0) + len(messages)
+        return counts[chat_id]
+
+    monkeypatch.setattr(chat_router, "search_agent", lambda *a, **k: {"found": False})
+    monkeypatch.setattr(chat_router, "store_memory", lambda **kwargs: None)
+    monkeypatch.setattr(chat_router, "_persist_messages", fake_persist)
+    monkeypatch.setattr(chat_router, "classify_cacheable", lambda m: (False, "test"))
+
+    def fake_turn(photo_data_urls, history, country="us", memory=None, on_tool=None):
+        if on_tool:
+            on_tool("serper", {"q": "spf"}, dumps_str(PRODUCTS))
+            on_tool("local_catalog", {"q": "spf"}, "Tool error: offline")
+        return "Try a mineral SPF."
+
+    monkeypatch.setattr("agents.cosmetist.run_chat_turn", fake_turn)
+    return counts
+
+
+@pytest.mark.asyncio
+async def test_delta_mode_returns_only_the_new_message(stored):
+    stored["u"] = 2
+    history = [
+        {"role": "user", "content": "My skin is dry"},
+        {"role": "assistant", "content": "Use a richer moisturizer."},
+    ]
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://test"
+    ) as client:
+        full = await client.post(
+            "/chat/turn",
+            json={"uid": "u", "message": "And sunscreen?", "history": history},
+        )
+        delta = await client.post(
+            "/chat/turn",
+            json={
+                "uid": "u",
+                "message": "And sunscreen?",
+                "history": history,
+                "response_mode": "delta",
+            },
+        )
+
+    assert full.json()["history_version"] == 4
+    assert len(full.json()["history"]) == 4
+    # The delta client still held 2 messages; 6 != 2 + 2 tells it to reload.
+    assert delta.json() == {
+        "message": {"role": "assistant", "content": "Try a mineral SPF."},
+        "history_version": 6,
+        "tools": None,
+        "products": None,
+    }
+
+
+@pytest.mark.asyncio
+async def test_delta_metadata_summarizes_tools_and_products():
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://test"
+    ) as client:
+        response = await client.post(
+            "/chat/turn",
+            json={
+                "uid": "u",
+                "message": "Which sunscreen?",
+                "response_mode": "delta",
+                "include_metadata": True,
+            },
+        )
+
+    body = response.json()
+    assert body["history_version"] == 2
+    assert body["tools"] == [
+        {"name": "serper", "query": "spf", "results": 3},
+        {"name": "local_catalog", "query": "spf", "results": 0},
+    ]
+    assert [p["link"] for p in body["products"]] == ["https://shop/a", "https://shop/b"]
+    assert body["products"][1]["rating"] == 4.6
+
+
+@pytest.mark.asyncio
+async def test_turn_memory_is_stored_as_background_work(monkeypatch):
+    from services.admission import current_caller
+
+    stored = []
+
+    def fake_store(uid, content, timestamp):
+        stored.append((uid, current_caller().priority, content))
+
+    monkeypatch.setattr(chat_router, "store_memory", fake_store)
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://test"
+    ) as client:
+        response = await client.post(
+            "/chat/turn", json={"uid": "u", "message": "Which sunscreen?"}
+        )
+
+    assert response.json()["reply"] == "Try a mineral SPF."
+    assert stored == [
+        ("u", "background", "User: Which sunscreen?\nAssistant: Try a mineral SPF.")
+    ]
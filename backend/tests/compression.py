@@ -0,0 +1,76 @@
+from datetime import datetime, timezone
+
+import numpy as np
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from httpx import ASGITransport, AsyncClient
+
+from schema.chat import ConversationTurnSchema
+from utils.compression import CompressionMiddleware, negotiate_encoding
+from utils.serialization import FastJSONResponse, dumps, loads
+
+
+def test_dumps_handles_numpy_datetimes_and_models():
+    payload = {
+        "vector": np.array([0.5, 1.0], dtype=np.float32),
+        "at": datetime(2024, 1, 1, tzinfo=timezone.utc),
+        "turn": ConversationTurnSchema(role="user", content="hi"),
+        1: "non-string key",
+    }
+    assert loads(dumps(payload)) == {
+        "vector": [0.5, 1.0],
+        "at": "2024-01-01T00:00:00+00:00",
+        "turn": {"role": "user", "content": "hi"},
+        "1": "non-string key",
+    }
+
+
+def test_negotiation_honors_q_values():
+    assert negotiate_encoding("") is None
+    assert negotiate_encoding("identity") is None
+    assert negotiate_encoding("gzip, deflate") == "gzip"
+    assert negotiate_encoding("gzip;q=0") is None
+    assert negotiate_encoding("*") in ("br", "gzip")
+
+
+def _app() -> FastAPI:
+    app = FastAPI(default_response_class=FastJSONResponse)
+    app.add_middleware(CompressionMiddleware, minimum_size=500)
+
+    @app.get("/small")
+    async def small():
+        return {"ok": True}
+
+    @app.get("/large")
+    async def large():
+        return {"history": [{"role": "user", "content": "hello " * 20}] * 50}
+
+    @app.get("/events")
+    async def events():
+        async def stream():
+            for _ in range(100):
+                yield "data: tick\n\n"
+
+        return StreamingResponse(stream(), media_type="text/event-stream")
+
+    return app
+
+
+@pytest.mark.asyncio
+async def test_large_bodies_are_compressed_only_when_accepted():
+    async with AsyncClient(
+        transport=ASGITransport(app=_app()), base_url="http://test"
+    ) as client:
+        raw = await client.get("/large", headers={"Accept-Encoding": "identity"})
+        zipped = await client.get("/large", headers={"Accept-Encoding": "gzip"})
+        small = await client.get("/small", headers={"Accept-Encoding": "gzip"})
+        events = await client.get("/events", headers={"Accept-Encoding": "gzip"})
+
+    assert "content-encoding" not in raw.headers
+    assert zipped.headers["content-encoding"] == "gzip"
+    assert zipped.headers["vary"] == "Accept-Encoding"
+    assert int(zipped.headers["content-length"]) < len(raw.content) / 5
+    assert zipped.json() == raw.json()
+    assert "content-encoding" not in small.headers
+    assert "content-encoding" not in events.headers
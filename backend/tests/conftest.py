@@ -1,6 +1,10 @@
+import os
 import sys
 from pathlib import Path
 
+# Keep test runs from reading or writing the host's shared cache file.
+os.environ["SHARED_CACHE"] = "none"
+
 # Add backend directory to Python path
 backend_dir = Path(__file__).resolve().parent.parent
 sys.path.insert(0, str(backend_dir))
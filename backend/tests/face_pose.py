@@ -0,0 +1,34 @@
+import io
+from pathlib import Path
+
+import pytest
+
+from services.face_pose import summarize_views
+
+SAMPLE = Path(__file__).resolve().parents[2] / "ui/face-analysis-ui/images (1).jpeg"
+
+
+def test_summarize_views_reports_missing_pose():
+    detections = [{"pose": "front"}, {"pose": "left"}, {"pose": "left"}]
+    assert summarize_views(detections) == {
+        "success": False,
+        "message": "Missing: right side face.",
+    }
+    detections[2]["pose"] = "right"
+    assert summarize_views(detections)["success"] is True
+
+
+def test_detect_poses_classifies_profile_and_mirror():
+    pytest.importorskip("ai_edge_litert")
+    from PIL import Image, ImageOps
+
+    from services.face_pose import detect_poses
+
+    raw = SAMPLE.read_bytes()
+    buffer = io.BytesIO()
+    ImageOps.mirror(Image.open(io.BytesIO(raw)).convert("RGB")).save(buffer, "JPEG")
+
+    right, left = detect_poses([raw, buffer.getvalue()])
+    assert right["pose"] == "right"
+    assert left["pose"] == "left"
+    assert right["box"][2] > right["box"][0]
@@ -0,0 +1,51 @@
+import pytest
+from httpx import ASGITransport, AsyncClient
+
+from app import app
+from services import startup
+
+
+@pytest.mark.asyncio
+async def test_ready_reports_failed_provider(monkeypatch):
+    monkeypatch.setattr(startup, "PROVIDERS", {})
+
+    def broken_factory():
+        raise RuntimeError("missing credentials")
+
+    startup.register_provider("ok", lambda: object())
+    startup.register_provider("broken", broken_factory)
+
+    report = await startup.initialize_providers()
+    assert report["ready"] is False
+    assert report["providers"]["ok"]["ready"] is True
+    assert report["providers"]["broken"]["error"] == "missing credentials"
+
+    async with AsyncClient(
+        transport=ASGITransport(app=app),
+        base_url="http://test",
+    ) as client:
+        live = await client.get("/health/live")
+        ready = await client.get("/health/ready")
+
+    assert live.status_code == 200
+    assert ready.status_code == 503
+
+
+def test_lazy_provider_builds_once(monkeypatch):
+    monkeypatch.setattr(startup, "PROVIDERS", {})
+    calls = []
+
+    class Client:
+        def collection(self, name):
+            return name
+
+    def factory():
+        calls.append(1)
+        return Client()
+
+    startup.register_provider("db", factory)
+    db = startup.LazyProvider("db")
+    assert calls == []
+    assert db.collection("users") == "users"
+    assert db.collection("chats") == "chats"
+    assert calls == [1]
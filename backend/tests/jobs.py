@@ -0,0 +1,63 @@
+import base64
+import threading
+
+import pytest
+from httpx import ASGITransport, AsyncClient
+
+from app import app
+from routers import chat as chat_router
+
+PHOTO = "data:image/jpeg;base64," + base64.b64encode(b"photo-bytes").decode()
+
+
+@pytest.mark.asyncio
+async def test_workflow_job_streams_stages_and_dedupes(monkeypatch):
+    release = threading.Event()
+
+    def fake_workflow(photo_data_urls, country="us", on_stage=None):
+        on_stage("verification", '{"success": true}')
+        release.wait(timeout=5)
+        on_stage("analysis", "looks healthy")
+        return {
+            "verification": '{"success": true}',
+            "analysis": "looks healthy",
+            "ratings": None,
+            "shopping": None,
+            "history": [],
+        }
+
+    monkeypatch.setattr("agents.cosmetist.run_initial_workflow", fake_workflow)
+    monkeypatch.setattr(chat_router, "_persist_messages", lambda **kwargs: None)
+
+    payload = {"uid": "user-1", "photo_data_urls": [PHOTO]}
+    async with AsyncClient(
+        transport=ASGITransport(app=app),
+        base_url="http://test",
+    ) as client:
+        first = (await client.post("/chat/workflow/jobs", json=payload)).json()
+        second = (await client.post("/chat/workflow/jobs", json=payload)).json()
+        assert second["job_id"] == first["job_id"]
+        assert second["attached"] is True
+        other = (
+            await client.post("/chat/workflow/jobs", json={**payload, "uid": "user-2"})
+        ).json()
+        assert other["job_id"] != first["job_id"]
+        assert other["attached"] is False
+        stolen = await client.get(
+            f"/chat/workflow/jobs/{first['job_id']}", params={"uid": "user-2"}
+        )
+        assert stolen.status_code == 404
+
+        release.set()
+        events = await client.get(
+            f"/chat/workflow/jobs/{first['job_id']}/events", params={"uid": "user-1"}
+        )
+        status = await client.get(
+            f"/chat/workflow/jobs/{first['job_id']}", params={"uid": "user-1"}
+        )
+
+    body = events.text
+    assert body.index("verification") < body.index("analysis")
+    assert "event: succeeded" in body
+    assert status.json()["status"] == "succeeded"
+    assert status.json()["result"]["analysis"] == "looks healthy"
@@ -0,0 +1,80 @@
+import hashlib
+import os
+import time
+
+import pytest
+from httpx import ASGITransport, AsyncClient
+
+from app import app
+from routers import chat as chat_router
+from services import photo_store
+
+JPEG_BYTES = b"\xff\xd8\xff\xe0" + b"fake-jpeg-body" * 100
+
+
+@pytest.mark.asyncio
+async def test_upload_photo_returns_content_hash(monkeypatch, tmp_path):
+    monkeypatch.setattr(photo_store, "PHOTO_STORE_DIR", tmp_path)
+    expected = hashlib.sha256(JPEG_BYTES).hexdigest()
+
+    async with AsyncClient(
+        transport=ASGITransport(app=app),
+        base_url="http://test",
+    ) as client:
+        multipart = await client.post(
+            "/chat/photos",
+            files=[("files", ("front.jpg", JPEG_BYTES, "image/jpeg"))],
+        )
+        binary = await client.put(
+            "/chat/photos",
+            content=JPEG_BYTES,
+            headers={"Content-Type": "image/jpeg"},
+        )
+        rejected = await client.put(
+            "/chat/photos",
+            content=b"text",
+            headers={"Content-Type": "text/plain"},
+        )
+        heic = await client.put(
+            "/chat/photos",
+            content=JPEG_BYTES,
+            headers={"Content-Type": "image/heic"},
+        )
+
+    assert multipart.status_code == 200
+    assert multipart.json()["photos"][0]["hash"] == expected
+    assert binary.json()["photos"][0]["hash"] == expected
+    assert rejected.status_code == 415
+    assert heic.status_code == 415
+
+    photo = photo_store.load_photo(expected)
+    assert photo.data == JPEG_BYTES
+    assert photo.data_url.startswith("data:image/jpeg;base64,")
+
+
+def test_unknown_photo_hash_is_404(monkeypatch, tmp_path):
+    from fastapi import HTTPException
+
+    monkeypatch.setattr(photo_store, "PHOTO_STORE_DIR", tmp_path)
+    with pytest.raises(HTTPException) as exc_info:
+        chat_router._resolve_photos([], ["0" * 64])
+    assert exc_info.value.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_sweep_deletes_photos_past_retention(monkeypatch, tmp_path):
+    monkeypatch.setattr(photo_store, "PHOTO_STORE_DIR", tmp_path)
+
+    async def chunks(data):
+        yield data
+
+    old = await photo_store.save_photo_stream(chunks(JPEG_BYTES), "image/jpeg")
+    fresh = await photo_store.save_photo_stream(chunks(b"fresh"), "image/png")
+    hour_ago = time.time() - 3600
+    for path in old.path.parent.iterdir():
+        if path.name.startswith(old.sha256):
+            os.utime(path, (hour_ago, hour_ago))
+
+    assert photo_store.sweep_photos(max_age=60) == 1
+    assert not old.path.exists()
+    assert photo_store.load_photo(fresh.sha256).data == b"fresh"
@@ -0,0 +1,69 @@
+import base64
+import json
+
+from agents import cosmetist
+from services import recommendations as recs
+from utils.cache import DiskCache
+
+PHOTO = "data:image/jpeg;base64," + base64.b64encode(b"profile-photo").decode()
+SHOPPING = '```json\n{"products": [{"title": "Gel Cleanser", "productId": "1"}]}\n```'
+RATINGS = {
+    "hydration": 3.6,
+    "oilBalance": 2,
+    "tone": 4,
+    "barrierStrength": 3,
+    "sensitivity": 5,
+}
+
+
+def test_ratings_are_bucketed_and_products_required(tmp_path):
+    cache = recs.RecommendationCache(DiskCache(tmp_path, ttl_seconds=60))
+    profile = recs.parse_ratings("```json\n" + json.dumps(RATINGS) + "\n```")
+
+    assert recs.profile_bucket(profile, "US") == "us:4-2-4-3-5"
+    assert cache.put(profile, "us", "No products today.") is False
+    assert cache.put(profile, "us", SHOPPING) is True
+    assert cache.get(profile, "us") == SHOPPING
+    assert cache.get(profile, "uk") is None
+
+
+def test_workflow_serves_shopping_from_profile_bucket(monkeypatch, tmp_path):
+    cache = recs.RecommendationCache(DiskCache(tmp_path, ttl_seconds=60))
+    monkeypatch.setattr(cosmetist, "recommendations", cache)
+    monkeypatch.setattr(cosmetist, "_detect_faces_locally", lambda images: None)
+    prompts = []
+
+    def fake_turn(photos, history, country="us", memory=None, model=None):
+        prompt = history[-1]["content"]
+        prompts.append(prompt)
+        if prompt.startswith("Here are 3 images"):
+            return '{"success": true}'
+        if prompt.startswith("From that analysis"):
+            return json.dumps(RATINGS)
+        if prompt.startswith("Using that assessment"):
+            return SHOPPING
+        return "Looks balanced."
+
+    monkeypatch.setattr(cosmetist, "run_chat_turn", fake_turn)
+
+    first = cosmetist.run_initial_workflow([PHOTO])
+    calls_after_first = len(prompts)
+    second = cosmetist.run_initial_workflow([PHOTO])
+
+    assert first["shopping"] == second["shopping"] == SHOPPING
+    assert len(prompts) - calls_after_first == 3
+    assert second["history"][-1]["content"] == SHOPPING
+
+
+def test_popular_stale_buckets_are_refreshed(monkeypatch, tmp_path):
+    cache = recs.RecommendationCache(DiskCache(tmp_path, ttl_seconds=60))
+    profile = recs.parse_ratings(RATINGS)
+    for _ in range(3):
+        cache.get(profile, "us")
+    monkeypatch.setattr(
+        cosmetist, "recommend_products", lambda ratings, country: SHOPPING
+    )
+
+    assert cache.stale_popular_buckets() == ["us:4-2-4-3-5"]
+    assert cache.refresh("us:4-2-4-3-5") is True
+    assert cache.stale_popular_buckets() == []
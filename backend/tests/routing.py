@@ -0,0 +1,51 @@
+import pytest
+
+from agents import routing
+from agents.routing import record_usage, route
+
+
+@pytest.fixture
+def stats(monkeypatch):
+    fresh = routing.RoutingStats()
+    monkeypatch.setattr(routing, "routing_stats", fresh)
+    return fresh
+
+
+def test_small_tier_is_used_when_output_validates(stats):
+    models = []
+
+    def call(model):
+        models.append(model)
+        record_usage(model, {"prompt_tokens": 1000, "completion_tokens": 100})
+        return '{"hydration": 4}'
+
+    assert route("ratings", call, validate=lambda reply: "hydration" in reply)
+    assert models == [routing.model_for("ratings")]
+    snapshot = stats.snapshot()["ratings"]
+    assert snapshot["escalations"] == 0
+    assert snapshot["prompt_tokens"] == 1000
+    assert snapshot["cost"] == pytest.approx((1000 * 0.10 + 100 * 0.40) / 1e6)
+
+
+def test_invalid_or_failed_output_escalates_once(stats):
+    models = []
+
+    def call(model):
+        models.append(model)
+        if len(models) == 1:
+            return "Sure! Here are your ratings."
+        return '{"hydration": 4}'
+
+    assert route("ratings", call, lambda r: "{" in r) == '{"hydration": 4}'
+    assert models == [routing.model_for("ratings"), routing.model_for("ratings", 1)]
+
+    def flaky(model):
+        if model == routing.model_for("remember"):
+            raise RuntimeError("model unavailable")
+        return '{"remember": true}'
+
+    assert route("remember", flaky) == '{"remember": true}'
+    snapshot = stats.snapshot()
+    assert snapshot["ratings"]["invalid"] == 1
+    assert snapshot["ratings"]["escalations"] == 1
+    assert snapshot["remember"]["errors"] == 1
@@ -84,3 +84,188 @@ async def test_upload_vector_db(monkeypatch):
     assert response.status_code == 200
     body = response.json()
     assert body == {"message": "Documents uploaded"}
+
+
+def test_gemini_embeddings_are_normalized_float32(monkeypatch):
+    import numpy as np
+
+    from llm import gemini
+
+    class DummyModels:
+        def embed_content(self, model, contents, config):
+            assert contents == ["first", "second"]
+            values = [[3.0, 4.0], [0.0, 2.0]]
+            return type(
+                "Response",
+                (),
+                {"embeddings": [type("E", (), {"values": v})() for v in values]},
+            )()
+
+    monkeypatch.setattr(
+        gemini, "_get_client", lambda: type("Client", (), {"models": DummyModels()})()
+    )
+
+    matrix = gemini.get_gemini_embeddings([" first ", "second"])
+    assert matrix.dtype == np.float32
+    assert matrix.flags.c_contiguous
+    np.testing.assert_allclose(matrix, [[0.6, 0.8], [0.0, 1.0]], rtol=1e-6)
+
+
+def test_hybrid_search_promotes_exact_product_match(monkeypatch):
+    from services import search as search_service
+
+    vector_hits = [
+        {"id": "a", "content": "Started a gentle vitamin A serum at night"},
+        {"id": "b", "content": "Used The Ordinary retinol 0.5% in squalane"},
+        {"id": "c", "content": "Switched to a mineral sunscreen"},
+    ]
+    text_hits = [{"id": "b", "content": vector_hits[1]["content"]}]
+
+    fetched = []
+
+    def fake_vector(query, uid, timestamp, top_k):
+        fetched.append(top_k)
+        return vector_hits
+
+    def fake_text(query, uid, timestamp, *, top_k):
+        fetched.append(top_k)
+        return text_hits
+
+    monkeypatch.setattr(search_service, "_vector_search", fake_vector)
+    monkeypatch.setattr(search_service, "search_text_db", fake_text)
+
+    results = search_service.search_memories(
+        "what was the retinol brand I used?",
+        "user-123",
+        datetime(2024, 1, 1, tzinfo=timezone.utc),
+        top_k=2,
+        mode="hybrid",
+    )
+
+    assert [r["id"] for r in results] == ["b", "a"]
+    assert results[0]["rrf_score"] > results[1]["rrf_score"]
+    # Candidates are widened once, not by the factor squared.
+    assert fetched == [2 * search_service.HYBRID_CANDIDATE_FACTOR] * 2
+
+
+def test_fused_results_rank_by_rrf_not_bm25_score():
+    from utils.ranking import MemoryScoring, reciprocal_rank_fusion, score_memories
+
+    now = datetime(2024, 3, 1, tzinfo=timezone.utc)
+    # A BM25 score of 12 would otherwise read as a near-perfect cosine match.
+    text_hits = [{"id": "lexical", "@search.score": 12.0}]
+    vector_hits = [
+        {"id": "both", "@search.score": 1 / (1 + 0.1)},
+        {"id": "lexical", "@search.score": 1 / (1 + 0.4)},
+    ]
+    fused = reciprocal_rank_fusion([text_hits, vector_hits, [{"id": "both"}]])
+    assert all("@search.score" not in doc for doc in fused)
+
+    ranked = score_memories(fused, MemoryScoring(recency_weight=0), now=now, top_k=2)
+    assert [doc["id"] for doc in ranked] == ["both", "lexical"]
+
+
+def test_memory_scoring_prefers_recent_and_important_memories():
+    from utils.ranking import MemoryScoring, estimate_importance, score_memories
+
+    now = datetime(2024, 3, 1, tzinfo=timezone.utc)
+    candidates = [
+        {
+            "id": "old",
+            "content": "Used a foaming cleanser every morning",
+            "timestamp": "2024-01-01T00:00:00Z",
+            "importance": 0.5,
+            "@search.score": 1 / (1 + 0.10),
+        },
+        {
+            "id": "recent",
+            "content": "Switched to a cream cleanser in the morning",
+            "timestamp": "2024-02-28T00:00:00Z",
+            "importance": 0.5,
+            "@search.score": 1 / (1 + 0.15),
+        },
+        {
+            "id": "allergy",
+            "content": "Allergic to fragrance, got a rash",
+            "timestamp": "2023-06-01T00:00:00Z",
+            "importance": estimate_importance("Allergic to fragrance, got a rash"),
+            "@search.score": 1 / (1 + 0.30),
+        },
+    ]
+
+    ranked = score_memories(candidates, MemoryScoring(), now=now, top_k=3)
+    assert [c["id"] for c in ranked][0] == "recent"
+
+    # Per-query weights: without recency, a critical old fact comes first.
+    ranked = score_memories(
+        candidates,
+        MemoryScoring(recency_weight=0.0, importance_weight=1.0),
+        now=now,
+        top_k=2,
+    )
+    assert [c["id"] for c in ranked] == ["allergy", "old"]
+    assert ranked[0]["memory_score"] >= ranked[1]["memory_score"]
+
+    assert (
+        estimate_importance("thanks!") < estimate_importance("started tretinoin") <= 1.0
+    )
+
+
+def test_store_memory_records_importance(monkeypatch):
+    import numpy as np
+
+    from services import search as search_service
+
+    uploads = []
+    monkeypatch.setattr(
+        search_service,
+        "get_gemini_embedding",
+        lambda *args, **kwargs: np.ones(4, dtype=np.float32),
+    )
+    monkeypatch.setattr(
+        search_service,
+        "upload_documents",
+        lambda *args: uploads.append(args),
+    )
+
+    search_service.store_memory("user-123", "I'm allergic to niacinamide")
+    search_service.store_memory("user-123", "hello", importance=0.9)
+
+    assert uploads[0][4] == 0.8
+    assert uploads[1][4] == 0.9
+
+
+def test_multi_query_search_batches_embeddings_and_dedupes(monkeypatch):
+    import numpy as np
+
+    from services import search as search_service
+
+    embed_calls = []
+
+    def fake_embeddings(texts, **kwargs):
+        embed_calls.append(list(texts))
+        return np.eye(len(texts), 4, dtype=np.float32)
+
+    def fake_vector(embedding, uid, timestamp, *, top_k):
+        row = int(np.argmax(embedding))
+        return [{"id": f"v{row}", "content": f"vector {row}"}, {"id": "shared"}]
+
+    def fake_text(query, uid, timestamp, *, top_k):
+        return [{"id": "shared", "content": "mentioned everywhere"}]
+
+    monkeypatch.setattr(search_service, "get_gemini_embeddings", fake_embeddings)
+    monkeypatch.setattr(search_service, "search_vector_db", fake_vector)
+    monkeypatch.setattr(search_service, "search_text_db", fake_text)
+
+    results = search_service.multi_query_search(
+        ["retinol brand", "retinol brand ", "night serum"],
+        "user-123",
+        datetime(2024, 1, 1, tzinfo=timezone.utc),
+        top_k=5,
+        scoring=None,
+    )
+
+    assert embed_calls == [["retinol brand", "night serum"]]
+    ids = [r["id"] for r in results]
+    assert ids[0] == "shared"
+    assert sorted(ids) == ["shared", "v0", "v1"]
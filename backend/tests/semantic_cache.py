@@ -0,0 +1,123 @@
+import numpy as np
+import pytest
+from httpx import ASGITransport, AsyncClient
+
+from app import app
+from routers import chat as chat_router
+from services.semantic_cache import SemanticCache, classify_cacheable
+from utils.vectors import normalize_rows
+
+VOCAB = ["niacinamide", "vitamin", "order", "apply", "retinol", "sunscreen"]
+
+
+def fake_embed(question: str) -> np.ndarray:
+    words = question.lower().replace("?", "").split()
+    counts = np.array([[words.count(w) for w in VOCAB]], dtype=np.float32) + 1e-3
+    return normalize_rows(counts)[0]
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    cache = SemanticCache(tmp_path, threshold=0.95)
+    monkeypatch.setattr(cache, "_embed", fake_embed)
+    return cache
+
+
+def test_classifier_keeps_personal_and_volatile_questions_out():
+    personal = classify_cacheable("What order do I apply niacinamide and vitamin C?")
+    assert personal == (False, "personal")
+    assert classify_cacheable("Should niacinamide go before vitamin C?") == (
+        True,
+        "generic",
+    )
+    assert classify_cacheable("Where can I buy retinol cheap?")[0] is False
+    assert classify_cacheable("What about at night?")[1] == "follow_up"
+    assert classify_cacheable("thanks!")[1] == "length"
+
+
+def test_lookup_requires_similarity_version_and_freshness(cache, tmp_path):
+    cache.store("order to apply niacinamide vitamin", "Niacinamide first.", "v1")
+
+    hit = cache.lookup("apply niacinamide vitamin order?", "v1")
+    assert hit.reply == "Niacinamide first."
+    assert cache.lookup("retinol sunscreen", "v1").reply is None
+    assert cache.lookup("apply niacinamide vitamin order?", "v2").reply is None
+    assert cache.flush() is True
+    assert [path.name for path in tmp_path.iterdir()] == ["cache.npz"]
+
+    expired = SemanticCache(tmp_path, ttl_seconds=-1)
+    expired._embed = fake_embed
+    assert expired.lookup("order to apply niacinamide vitamin", "v1").reply is None
+    assert cache.snapshot()["hits"] == 1
+    assert cache.snapshot()["hit_p50_ms"] is not None
+
+
+@pytest.mark.asyncio
+async def test_repeat_generic_question_skips_the_model(cache, monkeypatch):
+    monkeypatch.setattr(chat_router, "semantic_cache", cache)
+    monkeypatch.setattr(chat_router, "search_agent", lambda *a, **k: {"found": False})
+    monkeypatch.setattr(chat_router, "store_memory", lambda **kwargs: None)
+    monkeypatch.setattr(chat_router, "_persist_messages", lambda **kwargs: 2)
+    calls = []
+
+    def fake_turn(photo_data_urls, history, country="us", memory=None):
+        calls.append(history[-1]["content"])
+        return "Apply niacinamide, then vitamin C."
+
+    monkeypatch.setattr("agents.cosmetist.run_chat_turn", fake_turn)
+    question = "Should niacinamide or vitamin go first? order to apply"
+
+    async with AsyncClient(
+        transport=ASGITransport(app=app),
+        base_url="http://test",
+    ) as client:
+        for _ in range(2):
+            response = await client.post(
+                "/chat/turn", json={"uid": "u", "message": question, "history": []}
+            )
+            assert response.json()["reply"] == "Apply niacinamide, then vitamin C."
+        # The same words mid-conversation may refer back, so they skip the cache.
+        await client.post(
+            "/chat/turn",
+            json={
+                "uid": "u",
+                "message": question,
+                "history": [{"role": "user", "content": "I use retinol"}],
+            },
+        )
+
+    assert len(calls) == 2
+
+
+def test_entries_from_another_embedding_model_are_ignored(cache, tmp_path):
+    cache.store("order to apply niacinamide vitamin", "Niacinamide first.", "v1")
+    cache.flush()
+
+    upgraded = SemanticCache(tmp_path, model="new-embedding-model")
+    upgraded._embed = fake_embed
+    assert upgraded.lookup("order to apply niacinamide vitamin", "v1").reply is None
+
+
+def test_workers_merge_each_others_saved_entries(cache, tmp_path):
+    other = SemanticCache(tmp_path, threshold=0.95)
+    other._embed = fake_embed
+    cache.store("order to apply niacinamide vitamin", "Niacinamide first.", "v1")
+    other.store("retinol sunscreen", "Wear sunscreen with retinol.", "v1")
+    assert cache.flush() is True
+    assert other.flush() is True
+
+    reader = SemanticCache(tmp_path, threshold=0.95)
+    reader._embed = fake_embed
+    assert reader.lookup("niacinamide vitamin order apply", "v1").reply is not None
+    assert reader.lookup("sunscreen retinol", "v1").reply is not None
+
+
+def test_stale_best_match_does_not_hide_a_fresh_one(cache):
+    question = "order to apply niacinamide vitamin"
+    cache.store(question, "Old answer.", "v0")
+    nearby = normalize_rows(fake_embed(question)[None, :] + 0.1 * fake_embed("retinol"))
+    cache.store("niacinamide or vitamin first?", "New answer.", "v1", nearby[0])
+
+    hit = cache.lookup(question, "v1")
+    assert hit.reply == "New answer."
+    assert cache.threshold <= hit.similarity < 1.0
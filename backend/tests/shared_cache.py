@@ -0,0 +1,64 @@
+import numpy as np
+
+from llm import gemini
+from utils.cache import RedisBackend, SQLiteBackend, TieredCache
+
+
+class StandInRedis:
+    """Minimal Redis-protocol stand-in: get / set(ex=) / delete."""
+
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, ex=None):
+        self.data[key] = value
+
+    def delete(self, key):
+        self.data.pop(key, None)
+
+
+def test_sqlite_tier_is_shared_between_workers_and_versioned(tmp_path):
+    backend = SQLiteBackend(tmp_path / "cache.sqlite3")
+    worker_a = TieredCache("profiles", ttl_seconds=60, shared=backend)
+    worker_b = TieredCache("profiles", ttl_seconds=60, shared=backend)
+    worker_a.set("us:4-3-4-4-3", {"shopping": "cards"})
+
+    assert worker_b.get("us:4-3-4-4-3") == {"shopping": "cards"}
+    assert worker_b.stats["shared_hits"] == 1
+    assert worker_b.get("us:4-3-4-4-3") == {"shopping": "cards"}
+    assert worker_b.stats["local_hits"] == 1
+
+    bumped = TieredCache("profiles", version=2, ttl_seconds=60, shared=backend)
+    assert bumped.get("us:4-3-4-4-3") is None
+    # A restarted worker still sees the entry through the file.
+    restarted = SQLiteBackend(tmp_path / "cache.sqlite3")
+    assert restarted.get(worker_a.key("us:4-3-4-4-3")) is not None
+
+
+def test_redis_backend_accepts_a_stand_in_client():
+    client = StandInRedis()
+    cache = TieredCache("serper", ttl_seconds=60, shared=RedisBackend(client=client))
+    cache.set("us:cleanser", [{"title": "Gel"}])
+    assert list(client.data) == ["glowly:serper:v1:us:cleanser"]
+
+
+def test_embeddings_only_request_uncached_texts(monkeypatch):
+    cache = TieredCache("embeddings-test", ttl_seconds=60, shared=False)
+    monkeypatch.setattr(gemini, "embedding_cache", cache)
+    requested = []
+
+    def fake_embed(texts, task_type, dims, model):
+        requested.append(list(texts))
+        return np.eye(len(texts), 3, dtype=np.float32)
+
+    monkeypatch.setattr(gemini, "_embed_texts", fake_embed)
+
+    gemini.get_gemini_embeddings(["retinol", "sunscreen"])
+    matrix = gemini.get_gemini_embeddings(["sunscreen", "niacinamide", "sunscreen"])
+
+    assert requested == [["retinol", "sunscreen"], ["niacinamide"]]
+    assert matrix.shape == (3, 3)
+    np.testing.assert_array_equal(matrix[0], matrix[2])
@@ -0,0 +1,38 @@
+import io
+
+import numpy as np
+from PIL import Image
+
+from services.skin_metrics import measure_image, ratings_from_measurements
+
+SKIN_RGB = (224, 172, 140)
+
+
+def _encode(pixels: np.ndarray) -> bytes:
+    buffer = io.BytesIO()
+    Image.fromarray(pixels.astype(np.uint8)).save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+def test_even_matte_skin_rates_well():
+    smooth = np.broadcast_to(np.array(SKIN_RGB), (128, 128, 3)).copy()
+    ratings = ratings_from_measurements([measure_image(_encode(smooth))])
+    assert ratings["hydration"] == 5
+    assert ratings["oilBalance"] == 5
+    assert ratings["tone"] == 5
+
+
+def test_texture_and_redness_lower_ratings():
+    rng = np.random.default_rng(0)
+    smooth = np.broadcast_to(np.array(SKIN_RGB), (128, 128, 3)).astype(np.float64)
+    rough = smooth + rng.normal(0, 12, smooth.shape)
+    red = rough + np.array([20, -25, -10])
+
+    calm = measure_image(_encode(smooth))
+    irritated = measure_image(_encode(np.clip(red, 0, 255)))
+    assert irritated["roughness"] > calm["roughness"]
+    assert irritated["redness"] > calm["redness"]
+    assert (
+        ratings_from_measurements([irritated])["sensitivity"]
+        < ratings_from_measurements([calm])["sensitivity"]
+    )
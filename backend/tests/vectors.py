@@ -0,0 +1,128 @@
+import numpy as np
+
+from utils.vectors import (
+    int8_scores,
+    normalize_rows,
+    quantize_binary,
+    quantize_int8,
+    rescore,
+    top_k_indices,
+    truncate_dimensions,
+)
+
+
+def _corpus(size: int = 500, dims: int = 64) -> np.ndarray:
+    rng = np.random.default_rng(0)
+    return normalize_rows(rng.standard_normal((size, dims)))
+
+
+def test_int8_rescoring_recovers_exact_top_k():
+    corpus = _corpus()
+    query = corpus[7]
+    exact = top_k_indices(corpus @ query, 5)
+
+    codes, scale = quantize_int8(corpus)
+    assert codes.dtype == np.int8
+    candidates = top_k_indices(int8_scores(query, codes, scale), 20)
+    np.testing.assert_array_equal(rescore(query, corpus, candidates, 5), exact)
+
+
+def test_binary_packs_eight_dimensions_per_byte():
+    packed = quantize_binary(_corpus(dims=64))
+    assert packed.shape == (500, 8)
+    assert packed.dtype == np.uint8
+
+
+def test_truncation_renormalizes():
+    truncated = truncate_dimensions(_corpus(), 16)
+    assert truncated.shape == (500, 16)
+    np.testing.assert_allclose(np.linalg.norm(truncated, axis=1), 1.0, rtol=1e-5)
+
+
+def test_duplicate_clusters_only_touch_new_rows():
+    from services.consolidation import find_duplicate_clusters
+
+    base = _corpus(size=4, dims=32)
+    near_copy = normalize_rows(base[0] + 0.01 * base[1])
+    embeddings = np.vstack([base, near_copy, base[2]])
+    new_mask = np.array([False, False, False, False, True, False])
+
+    clusters = find_duplicate_clusters(embeddings, new_mask, threshold=0.95)
+    assert clusters == [[0, 4]]
+
+
+def test_incremental_consolidation_checkpoints_newest_processed(monkeypatch):
+    from datetime import datetime, timezone
+
+    from services import consolidation
+
+    base = _corpus(size=3, dims=32)
+    old = {"id": "old", "timestamp": "2026-01-01T00:00:00Z", "content": "a"}
+    new = {"id": "new", "timestamp": "2026-01-03T00:00:00Z", "content": "a again"}
+    old["embedding"] = base[0].tolist()
+    new["embedding"] = base[0].tolist()
+    other = {"id": "x", "timestamp": "2025-12-01T00:00:00Z", "content": "b"}
+    other["embedding"] = base[1].tolist()
+    since = datetime(2026, 1, 2, tzinfo=timezone.utc)
+    fetched, saved, deleted = [], [], []
+
+    def fake_fetch(uid, *, include_embeddings=False, since=None):
+        fetched.append(since)
+        return [new]
+
+    monkeypatch.setattr(consolidation, "_load_checkpoint", lambda uid: since)
+    monkeypatch.setattr(consolidation, "fetch_user_memories", fake_fetch)
+    monkeypatch.setattr(
+        consolidation, "search_vector_db", lambda *a, **k: [new, old, other]
+    )
+    monkeypatch.setattr(consolidation, "summarize_cluster", lambda contents: "")
+    monkeypatch.setattr(
+        consolidation, "_save_checkpoint", lambda uid, ts: saved.append(ts)
+    )
+    monkeypatch.setattr(
+        consolidation, "delete_documents", lambda ids: deleted.extend(ids) or len(ids)
+    )
+
+    stats = consolidation.consolidate_user_memories("u1")
+    assert fetched == [since]
+    assert deleted == ["old"]
+    assert stats["scanned"] == 3
+    assert saved == [datetime(2026, 1, 3, tzinfo=timezone.utc)]
+
+
+def test_checkpoint_trails_the_index_lag(monkeypatch):
+    from datetime import datetime, timezone
+
+    from services import consolidation
+
+    base = _corpus(size=2, dims=32)
+    now = datetime.now(timezone.utc)
+    docs = [
+        {
+            "id": f"m{i}",
+            "timestamp": now.isoformat(),
+            "content": "c",
+            "embedding": base[i].tolist(),
+        }
+        for i in range(2)
+    ]
+    since = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    saved, searched = [], []
+
+    def fake_search(embedding, uid, timestamp, **kwargs):
+        searched.append(embedding)
+        return []
+
+    monkeypatch.setattr(consolidation, "_load_checkpoint", lambda uid: since)
+    monkeypatch.setattr(
+        consolidation, "fetch_user_memories", lambda uid, **kwargs: docs
+    )
+    monkeypatch.setattr(consolidation, "search_vector_db", fake_search)
+    monkeypatch.setattr(
+        consolidation, "_save_checkpoint", lambda uid, ts: saved.append(ts)
+    )
+
+    consolidation.consolidate_user_memories("u1")
+    assert len(searched) == 2
+    # Both memories are newer than the lag margin, so the next pass refetches them.
+    assert since < saved[0] < now
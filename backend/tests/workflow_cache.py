@@ -0,0 +1,114 @@
+import base64
+import os
+import threading
+import time
+
+import pytest
+from httpx import ASGITransport, AsyncClient
+
+from app import app
+from routers import chat as chat_router
+from services import workflow_cache
+from utils.cache import DiskCache, SingleFlight
+
+PHOTO = "data:image/jpeg;base64," + base64.b64encode(b"cached-photo").decode()
+OTHER = "data:image/jpeg;base64," + base64.b64encode(b"other-photo").decode()
+
+
+def test_disk_cache_expires_and_evicts_least_recently_used(tmp_path):
+    cache = DiskCache(tmp_path, ttl_seconds=60, max_entries=2, evict_every=1)
+    cache.set("short", {"v": 0}, ttl_seconds=-1)
+    assert cache.get("short") is None
+
+    cache.set("a", 1)
+    cache.set("b", 2)
+    past = time.time() - 100
+    os.utime(cache._path("a"), (past, past))
+    cache.get("a")  # a hit makes "a" the most recent again
+    os.utime(cache._path("b"), (past - 10, past - 10))
+    cache.set("c", 3)
+
+    assert cache.get("a") == 1
+    assert cache.get("b") is None
+    assert cache.get("c") == 3
+
+
+def test_single_flight_shares_one_computation():
+    flights = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        started.set()
+        release.wait(timeout=5)
+        return "done"
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(flights.do("k", compute)))
+    leader.start()
+    started.wait(timeout=5)
+    follower = threading.Thread(target=lambda: results.append(flights.do("k", compute)))
+    follower.start()
+    time.sleep(0.05)
+    release.set()
+    leader.join()
+    follower.join()
+
+    assert len(calls) == 1
+    assert sorted(leader for _, leader in results) == [False, True]
+
+
+def test_cached_workflow_reports_late_hit_as_not_computed(monkeypatch, tmp_path):
+    cache = DiskCache(tmp_path, ttl_seconds=60)
+    monkeypatch.setattr(workflow_cache, "workflow_cache", cache)
+    misses = iter([None])
+    real_get = cache.get
+    # The first lookup misses; by the leader's re-check another worker stored it.
+    monkeypatch.setattr(cache, "get", lambda key: next(misses, real_get(key)))
+    cache.set("k", {"analysis": "stored"})
+
+    result, computed = workflow_cache.cached_workflow("k", lambda: {"fresh": True})
+    assert result == {"analysis": "stored"}
+    assert computed is False
+
+
+@pytest.mark.asyncio
+async def test_repeat_workflow_is_served_from_cache(monkeypatch, tmp_path):
+    monkeypatch.setattr(
+        workflow_cache, "workflow_cache", DiskCache(tmp_path, ttl_seconds=60)
+    )
+    monkeypatch.setattr(chat_router, "_persist_messages", lambda **kwargs: None)
+    calls = []
+
+    def fake_workflow(photo_data_urls, country="us", on_stage=None):
+        calls.append(country)
+        return {
+            "verification": '{"success": true}',
+            "analysis": "healthy",
+            "ratings": '{"hydration": 4}',
+            "shopping": '{"products": []}',
+            "history": [{"role": "assistant", "content": "healthy"}],
+        }
+
+    monkeypatch.setattr("agents.cosmetist.run_initial_workflow", fake_workflow)
+
+    async with AsyncClient(
+        transport=ASGITransport(app=app),
+        base_url="http://test",
+    ) as client:
+        first = await client.post(
+            "/chat/workflow", json={"uid": "u", "photo_data_urls": [PHOTO, OTHER]}
+        )
+        # Same photos in a different order hit the same entry.
+        second = await client.post(
+            "/chat/workflow", json={"uid": "u", "photo_data_urls": [OTHER, PHOTO]}
+        )
+        other_country = await client.post(
+            "/chat/workflow",
+            json={"uid": "u", "photo_data_urls": [PHOTO, OTHER], "country": "uk"},
+        )
+
+    assert first.json() == second.json()
+    assert other_country.json()["success"] is True
+    assert calls == ["us", "uk"]
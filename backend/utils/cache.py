@@ -0,0 +1,386 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Callable, Protocol, TypeVar
+
+from utils.env import get_env
+from utils.serialization import dumps, loads
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Prefix for every shared-tier key so several apps can share one backend.
+KEY_PREFIX = "glowly"
+SHARED_CACHE_PATH = Path(
+    get_env(
+        "SHARED_CACHE_PATH",
+        str(Path(tempfile.gettempdir()) / "glowly-shared-cache.sqlite3"),
+    )
+)
+
+
+class DiskCache:
+    """Bounded JSON cache with one file per key and per-entry expiry.
+
+    Writes go through a temp file and ``os.replace`` so concurrent workers
+    never read a partial entry. Hits refresh the file's mtime, and when the
+    entry count exceeds ``max_entries`` the least recently used files are
+    removed.
+    """
+
+    def __init__(
+        self,
+        directory: Path,
+        *,
+        ttl_seconds: float,
+        max_entries: int = 1000,
+        evict_every: int = 50,
+    ):
+        self.directory = Path(directory)
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._evict_every = evict_every
+        self._writes = 0
+        self._lock = threading.Lock()
+
+    def _path(self, key: str) -> Path:
+        digest = hashlib.sha256(key.encode()).hexdigest()
+        return self.directory / digest[:2] / f"{digest}.json"
+
+    def get(self, key: str) -> Any | None:
+        path = self._path(key)
+        try:
+            entry = loads(path.read_bytes())
+        except (FileNotFoundError, ValueError):
+            return None
+        if entry.get("expires_at", 0) < time.time():
+            path.unlink(missing_ok=True)
+            return None
+        os.utime(path)
+        return entry["value"]
+
+    def set(self, key: str, value: Any, *, ttl_seconds: float | None = None) -> None:
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        entry = {
+            "expires_at": time.time() + ttl,
+            "value": value,
+        }
+        fd, tmp_name = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        with os.fdopen(fd, "wb") as handle:
+            handle.write(dumps(entry))
+        os.replace(tmp_name, path)
+
+        with self._lock:
+            self._writes += 1
+            should_evict = self._writes % self._evict_every == 0
+        if should_evict:
+            self.evict()
+
+    def delete(self, key: str) -> None:
+        self._path(key).unlink(missing_ok=True)
+
+    def evict(self) -> int:
+        """Keep the ``max_entries`` most recently used files and delete the rest."""
+        entries = []
+        for path in self.directory.glob("*/*.json"):
+            try:
+                entries.append((path.stat().st_mtime, path))
+            except FileNotFoundError:
+                continue
+        overflow = len(entries) - self.max_entries
+        if overflow <= 0:
+            return 0
+        entries.sort()
+        for _, path in entries[:overflow]:
+            path.unlink(missing_ok=True)
+        return overflow
+
+
+class SingleFlight:
+    """Collapse concurrent calls for the same key into one computation."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._inflight: dict[str, Future] = {}
+
+    def do(self, key: str, fn: Callable[[], T]) -> tuple[T, bool]:
+        """Return ``(result, leader)``; followers get the leader's result or error."""
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._inflight[key] = future
+
+        if not leader:
+            return future.result(), False
+
+        try:
+            result = fn()
+        except BaseException as exc:
+            future.set_exception(exc)
+            raise
+        else:
+            future.set_result(result)
+            return result, True
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+
+class CacheBackend(Protocol):
+    """Byte store shared by all workers; values expire after ``ttl`` seconds."""
+
+    def get(self, key: str) -> bytes | None: ...
+
+    def set(self, key: str, value: bytes, ttl: float) -> None: ...
+
+    def delete(self, key: str) -> None: ...
+
+
+class MemoryBackend:
+    """Per-process LRU with expiry; the local tier of every TieredCache."""
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self._data: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Any | None:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            if item[0] < time.time():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return item[1]
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        with self._lock:
+            self._data[key] = (time.time() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+
+class SQLiteBackend:
+    """Single-host shared tier: one SQLite file in WAL mode.
+
+    WAL lets every worker read while one writes, and the file survives
+    restarts. Each thread keeps its own connection.
+    """
+
+    def __init__(
+        self,
+        path: Path = SHARED_CACHE_PATH,
+        *,
+        max_entries: int = 100_000,
+        purge_every: int = 500,
+    ):
+        self.path = Path(path)
+        self.max_entries = max_entries
+        self._purge_every = purge_every
+        self._writes = 0
+        self._local = threading.local()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                "key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS cache_expires ON cache (expires_at)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> bytes | None:
+        row = (
+            self._connect()
+            .execute(
+                "SELECT value FROM cache WHERE key = ? AND expires_at >= ?",
+                (key, time.time()),
+            )
+            .fetchone()
+        )
+        return row[0] if row else None
+
+    def set(self, key: str, value: bytes, ttl: float) -> None:
+        conn = self._connect()
+        conn.execute(
+            "INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)",
+            (key, value, time.time() + ttl),
+        )
+        self._writes += 1
+        if self._writes % self._purge_every == 0:
+            self.purge()
+
+    def delete(self, key: str) -> None:
+        self._connect().execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    def purge(self) -> None:
+        """Drop expired rows, then the soonest-expiring ones beyond the cap."""
+        conn = self._connect()
+        conn.execute("DELETE FROM cache WHERE expires_at < ?", (time.time(),))
+        conn.execute(
+            "DELETE FROM cache WHERE key IN (SELECT key FROM cache "
+            "ORDER BY expires_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        )
+
+
+class RedisBackend:
+    """Shared tier over the Redis protocol.
+
+    ``client`` is anything with Redis-style ``get``/``set(ex=)``/``delete``,
+    so a local stand-in (or a Redis-compatible server such as Valkey or
+    KeyDB) can be dropped in. Without one, ``redis`` is imported lazily.
+    """
+
+    def __init__(self, url: str | None = None, client: Any = None):
+        if client is None:
+            try:
+                import redis
+            except ImportError as exc:
+                raise RuntimeError(
+                    "SHARED_CACHE=redis needs the redis package installed"
+                ) from exc
+            client = redis.Redis.from_url(url or "redis://localhost:6379/0")
+        self._client = client
+
+    def get(self, key: str) -> bytes | None:
+        return self._client.get(key)
+
+    def set(self, key: str, value: bytes, ttl: float) -> None:
+        self._client.set(key, value, ex=max(1, int(ttl)))
+
+    def delete(self, key: str) -> None:
+        self._client.delete(key)
+
+
+@lru_cache(maxsize=1)
+def get_shared_backend() -> CacheBackend | None:
+    """Backend named by SHARED_CACHE: "sqlite" (default), "redis" or "none"."""
+    kind = (get_env("SHARED_CACHE", "sqlite") or "none").lower()
+    try:
+        if kind == "sqlite":
+            return SQLiteBackend()
+        if kind == "redis":
+            return RedisBackend(get_env("REDIS_URL"))
+    except Exception as exc:
+        logger.warning("Shared cache %s unavailable, using local only: %s", kind, exc)
+        return None
+    if kind != "none":
+        logger.warning("Unknown SHARED_CACHE=%s; using local only", kind)
+    return None
+
+
+CACHES: dict[str, "TieredCache"] = {}
+
+
+class TieredCache:
+    """Local LRU in front of the shared backend, under ``prefix:namespace:vN:``.
+
+    Bumping ``version`` orphans every old entry of the namespace at once.
+    The local tier's TTL is capped at ``local_ttl`` so a worker notices
+    shared updates reasonably soon. ``get``/``set`` mirror DiskCache.
+    """
+
+    def __init__(
+        self,
+        namespace: str,
+        *,
+        version: str | int = 1,
+        ttl_seconds: float,
+        local_ttl: float = 300,
+        local_entries: int = 1024,
+        shared: "CacheBackend | None | bool" = True,
+        encode: Callable[[Any], bytes] = dumps,
+        decode: Callable[[bytes], Any] = loads,
+    ):
+        self.namespace = namespace
+        self.version = str(version)
+        self.ttl_seconds = ttl_seconds
+        self.local_ttl = local_ttl
+        self._local = MemoryBackend(local_entries)
+        self._shared = shared
+        self._encode = encode
+        self._decode = decode
+        self.stats = {"local_hits": 0, "shared_hits": 0, "misses": 0, "errors": 0}
+        CACHES[namespace] = self
+
+    @property
+    def shared(self) -> CacheBackend | None:
+        if self._shared is True:
+            return get_shared_backend()
+        return self._shared or None
+
+    def key(self, key: str) -> str:
+        return f"{KEY_PREFIX}:{self.namespace}:v{self.version}:{key}"
+
+    def get(self, key: str) -> Any | None:
+        full_key = self.key(key)
+        value = self._local.get(full_key)
+        if value is not None:
+            self.stats["local_hits"] += 1
+            return value
+        shared = self.shared
+        if shared is not None:
+            try:
+                raw = shared.get(full_key)
+            except Exception as exc:
+                self.stats["errors"] += 1
+                logger.warning("Shared cache read failed for %s: %s", full_key, exc)
+                raw = None
+            if raw is not None:
+                value = self._decode(raw)
+                self._local.set(full_key, value, min(self.local_ttl, self.ttl_seconds))
+                self.stats["shared_hits"] += 1
+                return value
+        self.stats["misses"] += 1
+        return None
+
+    def set(self, key: str, value: Any, *, ttl_seconds: float | None = None) -> None:
+        full_key = self.key(key)
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        if ttl <= 0:
+            # Already expired; Redis would otherwise keep it for a second.
+            return
+        self._local.set(full_key, value, min(self.local_ttl, ttl))
+        shared = self.shared
+        if shared is not None:
+            try:
+                shared.set(full_key, self._encode(value), ttl)
+            except Exception as exc:
+                self.stats["errors"] += 1
+                logger.warning("Shared cache write failed for %s: %s", full_key, exc)
+
+    def delete(self, key: str) -> None:
+        full_key = self.key(key)
+        self._local.delete(full_key)
+        if self.shared is not None:
+            self.shared.delete(full_key)
@@ -0,0 +1,210 @@
+"""Record/replay of outbound provider calls.
+
+``CASSETTE_MODE`` selects the behaviour:
+
+- ``passthrough`` (default): calls go straight to the provider.
+- ``record``: calls go to the provider and each response is saved.
+- ``replay``: responses come from saved cassettes; a call without one
+  raises ``CassetteMiss`` instead of going out.
+
+A cassette is keyed by the provider and a hash of the normalized request:
+keys sorted, ``None`` values dropped, ISO timestamps masked, floats rounded
+and data URLs reduced to their digest, so runs on another day replay the
+same entries. Each is stored as one gzip-compressed JSON file. Replays sleep
+for the recorded latency times ``CASSETTE_LATENCY_SCALE`` plus
+``CASSETTE_EXTRA_LATENCY_MS``, so offline load tests keep realistic timings.
+"""
+
+import gzip
+import hashlib
+import os
+import re
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, TypeVar
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+from utils.env import get_env
+from utils.serialization import dumps, loads
+
+T = TypeVar("T")
+
+MODES = ("passthrough", "record", "replay")
+CASSETTE_DIR = Path(
+    get_env("CASSETTE_DIR", str(Path(__file__).resolve().parents[1] / "cassettes"))
+)
+CASSETTE_MODE = get_env("CASSETTE_MODE", "passthrough").lower()
+CASSETTE_LATENCY_SCALE = float(get_env("CASSETTE_LATENCY_SCALE", "1"))
+CASSETTE_EXTRA_LATENCY_MS = float(get_env("CASSETTE_EXTRA_LATENCY_MS", "0"))
+# Digits kept when hashing floats (embeddings, scores).
+FLOAT_DIGITS = 6
+
+_ISO_TIMESTAMP = re.compile(
+    r"\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}:\d{2}(?:\.\d+)?(?:Z|[+-]\d{2}:?\d{2})?"
+)
+_DATA_URL = re.compile(r"^data:([\w/+.-]+);base64,(.*)$", re.DOTALL)
+
+
+class CassetteMiss(RuntimeError):
+    """Raised in replay mode when no cassette matches a request."""
+
+
+def normalize_request(value: Any) -> Any:
+    """Canonical form of a request payload for hashing."""
+    if isinstance(value, dict):
+        return {
+            str(key): normalize_request(value[key])
+            for key in sorted(value, key=str)
+            if value[key] is not None
+        }
+    if isinstance(value, (list, tuple)):
+        return [normalize_request(item) for item in value]
+    if isinstance(value, float):
+        return round(value, FLOAT_DIGITS)
+    if isinstance(value, str):
+        match = _DATA_URL.match(value)
+        if match:
+            digest = hashlib.sha256(match.group(2).encode()).hexdigest()
+            return f"data:{match.group(1)};sha256={digest}"
+        return _ISO_TIMESTAMP.sub("<timestamp>", value)
+    if hasattr(value, "tolist"):
+        return normalize_request(value.tolist())
+    return value
+
+
+def request_key(provider: str, request: Any) -> str:
+    payload = dumps({"provider": provider, "request": normalize_request(request)})
+    return hashlib.sha256(payload).hexdigest()
+
+
+def _to_response(entry: dict[str, Any], url: str) -> requests.Response:
+    response = requests.Response()
+    response.status_code = entry["status"]
+    response.headers = CaseInsensitiveDict(entry.get("headers") or {})
+    response._content = entry["body"].encode()
+    response._content_consumed = True
+    response.encoding = "utf-8"
+    response.url = url
+    return response
+
+
+class CassetteRecorder:
+    def __init__(
+        self,
+        directory: Path = CASSETTE_DIR,
+        mode: str = CASSETTE_MODE,
+        *,
+        latency_scale: float = CASSETTE_LATENCY_SCALE,
+        extra_latency_ms: float = CASSETTE_EXTRA_LATENCY_MS,
+    ):
+        if mode not in MODES:
+            raise ValueError(f"CASSETTE_MODE must be one of {MODES}")
+        self.directory = Path(directory)
+        self.mode = mode
+        self.latency_scale = latency_scale
+        self.extra_latency_ms = extra_latency_ms
+        self._lock = threading.Lock()
+        self.stats = {"recorded": 0, "replayed": 0, "missed": 0}
+
+    @property
+    def live(self) -> bool:
+        """Whether calls reach the real provider."""
+        return self.mode != "replay"
+
+    def _path(self, provider: str, key: str) -> Path:
+        return self.directory / provider / key[:2] / f"{key}.json.gz"
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self.stats[name] += 1
+
+    def _load(self, provider: str, key: str) -> dict[str, Any] | None:
+        try:
+            return loads(gzip.decompress(self._path(provider, key).read_bytes()))
+        except FileNotFoundError:
+            return None
+
+    def _save(self, provider: str, key: str, entry: dict[str, Any]) -> None:
+        path = self._path(provider, key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as handle:
+                handle.write(gzip.compress(dumps(entry)))
+            os.replace(tmp, path)
+        except BaseException:
+            Path(tmp).unlink(missing_ok=True)
+            raise
+
+    def call(self, provider: str, request: Any, perform: Callable[[], T]) -> T:
+        """Run ``perform()`` (which must return JSON-serializable data) per the mode."""
+        if self.mode == "passthrough":
+            return perform()
+
+        key = request_key(provider, request)
+        if self.mode == "replay":
+            entry = self._load(provider, key)
+            if entry is None:
+                self._count("missed")
+                raise CassetteMiss(f"No {provider} cassette for request {key[:12]}")
+            delay = entry["seconds"] * self.latency_scale + self.extra_latency_ms / 1000
+            if delay > 0:
+                time.sleep(delay)
+            self._count("replayed")
+            return entry["response"]
+
+        started = time.perf_counter()
+        response = perform()
+        seconds = time.perf_counter() - started
+        entry = {
+            "provider": provider,
+            "request": normalize_request(request),
+            "response": response,
+            "seconds": seconds,
+        }
+        self._save(provider, key, entry)
+        self._count("recorded")
+        # Hand back the stored form so recorded and replayed runs match.
+        return loads(dumps(response))
+
+    def post(
+        self,
+        provider: str,
+        url: str,
+        *,
+        json: Any,
+        headers: dict[str, str] | None = None,
+        timeout: float | None = None,
+        stream: bool = False,
+    ) -> requests.Response:
+        """``requests.post`` through the recorder; only the URL and body are keyed.
+
+        Outside passthrough mode streamed bodies are read in full before
+        returning, then iterated from memory.
+        """
+        if self.mode == "passthrough":
+            return requests.post(
+                url, headers=headers, json=json, timeout=timeout, stream=stream
+            )
+
+        def perform() -> dict[str, Any]:
+            response = requests.post(url, headers=headers, json=json, timeout=timeout)
+            return {
+                "status": response.status_code,
+                "headers": {
+                    name: response.headers[name]
+                    for name in ("content-type",)
+                    if name in response.headers
+                },
+                "body": response.content.decode("utf-8", "replace"),
+            }
+
+        entry = self.call(provider, {"url": url, "json": json}, perform)
+        return _to_response(entry, url)
+
+
+cassettes = CassetteRecorder()
@@ -0,0 +1,150 @@
+"""Negotiated gzip/brotli compression for large responses.
+
+Bodies under ``RESPONSE_COMPRESSION_MIN_BYTES`` go out as they are; the
+compression overhead outweighs the savings there. Brotli is used when the
+client prefers it and the optional ``brotli`` package is installed
+(``pip install brotli``; it is not in requirements.txt), otherwise gzip.
+Server-sent event streams are never compressed so events are not held back
+in a compressor buffer.
+"""
+
+import gzip
+import zlib
+from typing import Callable
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from utils.env import get_env
+
+MIN_COMPRESS_BYTES = int(get_env("RESPONSE_COMPRESSION_MIN_BYTES", "1024"))
+GZIP_LEVEL = 6
+# Quality 4-5 is the usual sweet spot for on-the-fly brotli.
+BROTLI_QUALITY = 4
+_UNCOMPRESSED_TYPES = ("text/event-stream", "image/", "video/", "audio/")
+
+
+def _brotli():
+    try:
+        import brotli
+    except ImportError:
+        return None
+    return brotli
+
+
+def negotiate_encoding(accept_encoding: str) -> str | None:
+    """Pick ``br`` or ``gzip`` from an Accept-Encoding header, honoring q-values."""
+    available = ("br", "gzip") if _brotli() else ("gzip",)
+    best, best_q = None, 0.0
+    for part in accept_encoding.lower().split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        if params.strip().startswith("q="):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                continue
+        candidates = available if name == "*" else (name,)
+        for encoding in candidates:
+            # On equal q the order of ``available`` (br first) breaks the tie.
+            if encoding in available and (
+                q > best_q
+                or (
+                    q == best_q
+                    and best
+                    and available.index(encoding) < available.index(best)
+                )
+            ):
+                best, best_q = encoding, q
+    return best
+
+
+def _compressor(encoding: str) -> tuple[Callable[[bytes], bytes], Callable[[], bytes]]:
+    """(compress chunk, flush remaining) for a streamed body."""
+    if encoding == "br":
+        compressor = _brotli().Compressor(quality=BROTLI_QUALITY)
+        return compressor.process, compressor.finish
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+    return compressor.compress, compressor.flush
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return _brotli().compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL)
+
+
+class CompressionMiddleware:
+    def __init__(self, app: ASGIApp, minimum_size: int = MIN_COMPRESS_BYTES):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        await _CompressedResponder(encoding, self.minimum_size, send)(
+            self.app, scope, receive
+        )
+
+
+class _CompressedResponder:
+    def __init__(self, encoding: str, minimum_size: int, send: Send):
+        self.encoding = encoding
+        self.minimum_size = minimum_size
+        self.send = send
+        self.start: Message | None = None
+        self.streaming: tuple[Callable, Callable] | None = None
+        self.passthrough = False
+
+    async def __call__(self, app: ASGIApp, scope: Scope, receive: Receive) -> None:
+        await app(scope, receive, self.on_message)
+
+    async def on_message(self, message: Message) -> None:
+        if message["type"] == "http.response.start":
+            self.start = message
+            headers = Headers(raw=message["headers"])
+            content_type = headers.get("content-type", "")
+            self.passthrough = "content-encoding" in headers or content_type.startswith(
+                _UNCOMPRESSED_TYPES
+            )
+            if self.passthrough:
+                await self.send(message)
+            return
+        if message["type"] != "http.response.body" or self.passthrough:
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if self.start is not None:
+            start, self.start = self.start, None
+            headers = MutableHeaders(raw=start["headers"])
+            if not more_body and len(body) < self.minimum_size:
+                self.passthrough = True
+                await self.send(start)
+                await self.send(message)
+                return
+            headers["Content-Encoding"] = self.encoding
+            headers.add_vary_header("Accept-Encoding")
+            if not more_body:
+                body = compress(body, self.encoding)
+                headers["Content-Length"] = str(len(body))
+                await self.send(start)
+                await self.send({"type": "http.response.body", "body": body})
+                return
+            del headers["Content-Length"]
+            self.streaming = _compressor(self.encoding)
+            await self.send(start)
+
+        process, finish = self.streaming
+        chunk = process(body)
+        if not more_body:
+            chunk += finish()
+        await self.send(
+            {"type": "http.response.body", "body": chunk, "more_body": more_body}
+        )
@@ -0,0 +1,21 @@
+import os
+from functools import lru_cache
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+ENV_PATH = PROJECT_ROOT / ".env"
+
+
+@lru_cache(maxsize=1)
+def load_env() -> bool:
+    """Load the project .env once per process; later calls are free."""
+    if ENV_PATH.exists():
+        return load_dotenv(ENV_PATH)
+    return load_dotenv()
+
+
+def get_env(name: str, default: str | None = None) -> str | None:
+    load_env()
+    return os.environ.get(name, default)
@@ -0,0 +1,39 @@
+import base64
+import binascii
+import io
+
+import numpy as np
+
+
+def decode_data_url(url: str) -> bytes:
+    """Return the raw bytes of a ``data:image/...;base64,`` URL (or bare base64)."""
+    _, _, encoded = url.partition(",") if url.startswith("data:") else ("", "", url)
+    try:
+        return base64.b64decode(encoded, validate=False)
+    except (binascii.Error, ValueError) as exc:
+        raise ValueError("Image is not valid base64 data") from exc
+
+
+def load_rgb(data: bytes, *, max_side: int | None = None) -> np.ndarray:
+    """Decode image bytes to an (H, W, 3) uint8 array, optionally downscaled."""
+    from PIL import Image, ImageOps
+
+    with Image.open(io.BytesIO(data)) as image:
+        image = ImageOps.exif_transpose(image).convert("RGB")
+        if max_side and max(image.size) > max_side:
+            image.thumbnail((max_side, max_side))
+        return np.asarray(image)
+
+
+def letterbox(image: np.ndarray, size: int) -> tuple[np.ndarray, float, int, int]:
+    """Resize into a square ``size`` canvas keeping aspect; returns scale and padding."""
+    from PIL import Image
+
+    height, width = image.shape[:2]
+    scale = size / max(height, width)
+    new_w, new_h = max(1, round(width * scale)), max(1, round(height * scale))
+    resized = np.asarray(Image.fromarray(image).resize((new_w, new_h)))
+    canvas = np.zeros((size, size, 3), dtype=np.uint8)
+    pad_x, pad_y = (size - new_w) // 2, (size - new_h) // 2
+    canvas[pad_y : pad_y + new_h, pad_x : pad_x + new_w] = resized
+    return canvas, scale, pad_x, pad_y
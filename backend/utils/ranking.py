@@ -0,0 +1,185 @@
+import math
+import re
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any
+
+import numpy as np
+
+RRF_K = 60
+# Stored memories written before importance existed score as average.
+DEFAULT_IMPORTANCE = 0.5
+
+_TOKEN = re.compile(r"[a-z0-9]+(?:[-'][a-z0-9]+)*")
+_STOPWORDS = frozenset(
+    "a an and are as at be but by did do does for from had has have how i in is it "
+    "my of on or so that the this to used was we were what when where which who "
+    "why will with you your".split()
+)
+# Facts that should keep surfacing however old they are.
+_CRITICAL_TERMS = frozenset(
+    "allergic allergy allergies reaction reacted rash hives burning stinging "
+    "irritation irritated eczema rosacea psoriasis dermatitis dermatologist "
+    "prescribed prescription tretinoin isotretinoin accutane pregnant pregnancy "
+    "breastfeeding sensitive sensitivity avoid never".split()
+)
+# Routine changes: useful, but superseded by the next change.
+_ROUTINE_TERMS = frozenset(
+    "started stopped switched swapped added dropped replaced quit routine "
+    "cleanser toner serum moisturizer sunscreen spf retinol retinoid acid "
+    "exfoliant mask morning night daily weekly".split()
+)
+_SMALL_TALK = frozenset("hi hello hey thanks thank ok okay cool great bye".split())
+
+
+def tokenize(text: str) -> list[str]:
+    return [t for t in _TOKEN.findall(text.lower()) if t not in _STOPWORDS]
+
+
+def reciprocal_rank_fusion(
+    result_lists: list[list[dict[str, Any]]],
+    *,
+    k: int = RRF_K,
+    key: str = "id",
+) -> list[dict[str, Any]]:
+    """Fuse ranked lists with RRF: score = sum(1 / (k + rank)) across lists.
+
+    Per-list ``@search.score`` values (cosine for vector hits, BM25 for text
+    hits) are dropped, so later ranking reads ``rrf_score`` instead.
+    """
+    fused: dict[str, dict[str, Any]] = {}
+    for results in result_lists:
+        for rank, result in enumerate(results, start=1):
+            doc_id = result.get(key)
+            if doc_id is None:
+                continue
+            entry = fused.get(doc_id)
+            if entry is None:
+                entry = fused[doc_id] = {
+                    **{
+                        name: value
+                        for name, value in result.items()
+                        if name != "@search.score"
+                    },
+                    "rrf_score": 0.0,
+                }
+            entry["rrf_score"] += 1.0 / (k + rank)
+
+    return sorted(fused.values(), key=lambda item: item["rrf_score"], reverse=True)
+
+
+def rerank_by_term_overlap(
+    query: str,
+    candidates: list[dict[str, Any]],
+    *,
+    top_k: int,
+    field: str = "content",
+    overlap_weight: float = 0.5,
+) -> list[dict[str, Any]]:
+    """Cheap local rerank: fused rank plus the share of query terms in the text.
+
+    Exact product and brand names are rare tokens, so a candidate that repeats
+    them is promoted over one that is merely semantically close.
+    """
+    query_terms = set(tokenize(query))
+    if not candidates:
+        return []
+
+    top_rrf = max(c.get("rrf_score", 0.0) for c in candidates) or 1.0
+    scored = []
+    for candidate in candidates:
+        overlap = 0.0
+        if query_terms:
+            terms = set(tokenize(candidate.get(field) or ""))
+            overlap = len(query_terms & terms) / len(query_terms)
+        score = candidate.get("rrf_score", 0.0) / top_rrf + overlap_weight * overlap
+        scored.append({**candidate, "rerank_score": score})
+
+    scored.sort(key=lambda item: item["rerank_score"], reverse=True)
+    return scored[:top_k]
+
+
+def estimate_importance(text: str) -> float:
+    """Write-time importance in [0, 1] from the terms a memory mentions.
+
+    Allergies, reactions, diagnoses and prescriptions score highest, routine
+    changes next, small talk lowest.
+    """
+    terms = set(tokenize(text))
+    if not terms or terms <= _SMALL_TALK:
+        return 0.1
+    score = 0.3
+    if terms & _CRITICAL_TERMS:
+        score += 0.5
+    if terms & _ROUTINE_TERMS:
+        score += 0.2
+    return min(1.0, score)
+
+
+@dataclass(frozen=True)
+class MemoryScoring:
+    """Weights for blending relevance with recency and importance.
+
+    Recency decays exponentially with the memory's age at query time and
+    halves every ``half_life_days``.
+    """
+
+    half_life_days: float = 30.0
+    relevance_weight: float = 1.0
+    recency_weight: float = 0.5
+    importance_weight: float = 0.5
+
+
+def _relevance(candidate: dict[str, Any]) -> float:
+    if "rerank_score" in candidate:
+        return candidate["rerank_score"]
+    if "@search.score" in candidate:
+        # Azure reports cosine hits as 1 / (1 + cosine distance).
+        return 2.0 - 1.0 / max(candidate["@search.score"], 1e-6)
+    return candidate.get("rrf_score", 0.0)
+
+
+def _epoch_seconds(value: Any) -> float:
+    if value is None:
+        return math.nan
+    if not isinstance(value, datetime):
+        try:
+            value = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+        except ValueError:
+            return math.nan
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+def score_memories(
+    candidates: list[dict[str, Any]],
+    scoring: MemoryScoring,
+    *,
+    now: datetime,
+    top_k: int,
+) -> list[dict[str, Any]]:
+    """Rank candidates by relevance, recency decay and importance together.
+
+    Relevance is scaled by the best candidate's so the weights mean the same
+    thing for vector and hybrid results. Memories without a timestamp get no
+    recency credit.
+    """
+    if not candidates:
+        return []
+
+    relevance = np.array([_relevance(c) for c in candidates], dtype=np.float64)
+    relevance /= np.abs(relevance).max() or 1.0
+    written = np.array([_epoch_seconds(c.get("timestamp")) for c in candidates])
+    age_days = np.maximum(0.0, (_epoch_seconds(now) - written) / 86400)
+    recency = np.nan_to_num(np.exp2(-age_days / scoring.half_life_days), nan=0.0)
+    importance = np.array([c.get("importance") for c in candidates], dtype=np.float64)
+    importance = np.nan_to_num(importance, nan=DEFAULT_IMPORTANCE)
+
+    scores = (
+        scoring.relevance_weight * relevance
+        + scoring.recency_weight * recency
+        + scoring.importance_weight * importance
+    )
+    order = np.argsort(-scores, kind="stable")[:top_k]
+    return [{**candidates[i], "memory_score": float(scores[i])} for i in order]
@@ -1,30 +1,32 @@
-import os
 from datetime import datetime, timezone
 from functools import lru_cache
-from pathlib import Path
-from typing import Any
+from typing import TYPE_CHECKING, Any
 from uuid import uuid4
 
-from azure.core.credentials import AzureKeyCredential
-from azure.search.documents import SearchClient
-from azure.search.documents.models import VectorizedQuery
-from dotenv import load_dotenv
+from utils.cassettes import cassettes
+from utils.env import get_env
+from utils.ranking import DEFAULT_IMPORTANCE
+from utils.vectors import to_json_vector
 
+if TYPE_CHECKING:
+    import numpy as np
+    from azure.search.documents import SearchClient
 
-PROJECT_ROOT = Path(__file__).resolve().parents[2]
-ENV_PATH = PROJECT_ROOT / ".env"
 
-if ENV_PATH.exists():
-    load_dotenv(ENV_PATH)
-
-
-INDEX_NAME = os.environ.get("AZURE_SEARCH_INDEX", "glowly-memory")
+INDEX_NAME = get_env("AZURE_SEARCH_INDEX", "glowly-memory")
+# Only valid for indexes built with --compression; widens the quantized
+# candidate set that Azure rescores with the original vectors.
+VECTOR_OVERSAMPLING = get_env("AZURE_SEARCH_OVERSAMPLING")
+MEMORY_FIELDS = ["id", "uid", "timestamp", "content", "importance"]
 
 
 @lru_cache(maxsize=1)
-def get_search_client() -> SearchClient:
-    endpoint = os.environ.get("AZURE_SEARCH_ENDPOINT")
-    api_key = os.environ.get("AZURE_SEARCH_API_KEY")
+def get_search_client() -> "SearchClient":
+    from azure.core.credentials import AzureKeyCredential
+    from azure.search.documents import SearchClient
+
+    endpoint = get_env("AZURE_SEARCH_ENDPOINT")
+    api_key = get_env("AZURE_SEARCH_API_KEY")
 
     if not endpoint or not api_key:
         raise RuntimeError(
@@ -49,32 +51,13 @@ def _format_timestamp(value: datetime) -> str:
     return value.isoformat().replace("+00:00", "Z")
 
 
-def search_vector_db(
-    embedding: list[float],
-    uid: str,
-    timestamp: datetime,
-    *,
-    top_k: int = 20,
-) -> list[dict[str, Any]]:
-    client = get_search_client()
-
+def _memory_filter(uid: str, timestamp: datetime) -> str:
     filters = [f"uid eq '{_escape_filter_value(uid)}'"]
     filters.append(f"timestamp le {_format_timestamp(timestamp)}")
-    filter_expr = " and ".join(filters)
+    return " and ".join(filters)
 
-    vector_query = VectorizedQuery(
-        vector=embedding,
-        k_nearest_neighbors=top_k,
-        fields="embedding",
-    )
-
-    results = client.search(
-        search_text=None,
-        vector_queries=[vector_query],
-        filter=filter_expr,
-        select=["id", "uid", "timestamp", "content"],
-    )
 
+def _to_payload(results) -> list[dict[str, Any]]:
     payload = []
     for result in results:
         data = dict(result)
@@ -86,22 +69,178 @@ def search_vector_db(
     return payload
 
 
+def search_vector_db(
+    embedding: "np.ndarray | list[float]",
+    uid: str,
+    timestamp: datetime,
+    *,
+    top_k: int = 20,
+    oversampling: float | None = None,
+    include_embeddings: bool = False,
+) -> list[dict[str, Any]]:
+    vector = to_json_vector(embedding)
+    oversampling = oversampling or VECTOR_OVERSAMPLING
+    query_filter = _memory_filter(uid, timestamp)
+    select = MEMORY_FIELDS + ["embedding"] if include_embeddings else MEMORY_FIELDS
+
+    def search() -> list[dict[str, Any]]:
+        from azure.search.documents.models import VectorizedQuery
+
+        vector_query = VectorizedQuery(
+            vector=vector,
+            k_nearest_neighbors=top_k,
+            fields="embedding",
+        )
+        if oversampling:
+            vector_query.oversampling = float(oversampling)
+
+        results = get_search_client().search(
+            search_text=None,
+            vector_queries=[vector_query],
+            filter=query_filter,
+            select=select,
+        )
+        return _to_payload(results)
+
+    return cassettes.call(
+        "azure_search",
+        {
+            "index": INDEX_NAME,
+            "vector": vector,
+            "top_k": top_k,
+            "oversampling": oversampling,
+            "filter": query_filter,
+            "select": None if select is MEMORY_FIELDS else select,
+        },
+        search,
+    )
+
+
+def search_text_db(
+    query: str,
+    uid: str,
+    timestamp: datetime,
+    *,
+    top_k: int = 20,
+) -> list[dict[str, Any]]:
+    """Full-text search over ``content`` (en.microsoft analyzer) for exact terms."""
+    query_filter = _memory_filter(uid, timestamp)
+
+    def search() -> list[dict[str, Any]]:
+        results = get_search_client().search(
+            search_text=query,
+            search_fields=["content"],
+            filter=query_filter,
+            select=MEMORY_FIELDS,
+            top=top_k,
+        )
+        return _to_payload(results)
+
+    return cassettes.call(
+        "azure_search",
+        {"index": INDEX_NAME, "text": query, "top_k": top_k, "filter": query_filter},
+        search,
+    )
+
+
 def upload_documents(
     uid: str,
     content: str,
-    embedding: list[float],
+    embedding: "np.ndarray | list[float]",
+    timestamp: datetime,
+    importance: float | None = None,
+) -> str:
+    return upload_document_batch(
+        uid,
+        [content],
+        [embedding],
+        timestamp,
+        importances=None if importance is None else [importance],
+    )
+
+
+def upload_document_batch(
+    uid: str,
+    contents: list[str],
+    embeddings: "np.ndarray | list[list[float]]",
     timestamp: datetime,
+    *,
+    importances: list[float] | None = None,
 ) -> str:
-    client = get_search_client()
-    client.upload_documents(
-        documents=[
-            {
-                "id": str(uuid4()),
-                "uid": uid,
-                "timestamp": timestamp.isoformat(),
-                "content": content,
-                "embedding": embedding,
-            }
-        ]
+    """Upload several memories in one request; vectors become JSON lists here only."""
+    if importances is None:
+        importances = [DEFAULT_IMPORTANCE] * len(contents)
+    documents = [
+        {
+            "id": str(uuid4()),
+            "uid": uid,
+            "timestamp": timestamp.isoformat(),
+            "content": content,
+            "importance": importance,
+            "embedding": to_json_vector(embedding),
+        }
+        for content, embedding, importance in zip(
+            contents, embeddings, importances, strict=True
+        )
+    ]
+
+    def upload() -> int:
+        get_search_client().upload_documents(documents=documents)
+        return len(documents)
+
+    # Ids are random and vectors follow from the contents; neither is keyed.
+    cassettes.call(
+        "azure_search",
+        {
+            "index": INDEX_NAME,
+            "upload": uid,
+            "contents": contents,
+            "importances": importances,
+        },
+        upload,
     )
     return "Documents uploaded"
+
+
+def fetch_user_memories(
+    uid: str,
+    *,
+    include_embeddings: bool = False,
+    since: datetime | None = None,
+) -> list[dict[str, Any]]:
+    """Page through a user's memories stamped after ``since`` (default all), oldest first."""
+    select = list(MEMORY_FIELDS)
+    if include_embeddings:
+        select.append("embedding")
+    query_filter = f"uid eq '{_escape_filter_value(uid)}'"
+    if since is not None:
+        query_filter += f" and timestamp gt {_format_timestamp(since)}"
+
+    def fetch() -> list[dict[str, Any]]:
+        results = get_search_client().search(
+            search_text="*",
+            filter=query_filter,
+            select=select,
+            order_by=["timestamp asc"],
+        )
+        return _to_payload(results)
+
+    return cassettes.call(
+        "azure_search",
+        {"index": INDEX_NAME, "fetch": query_filter, "select": select},
+        fetch,
+    )
+
+
+def delete_documents(ids: list[str]) -> int:
+    """Delete memories by id in a single batch request."""
+    if not ids:
+        return 0
+
+    def delete() -> int:
+        results = get_search_client().delete_documents(
+            documents=[{"id": doc_id} for doc_id in ids]
+        )
+        return sum(1 for result in results if result.succeeded)
+
+    return cassettes.call("azure_search", {"index": INDEX_NAME, "delete": ids}, delete)
@@ -0,0 +1,42 @@
+"""orjson-backed JSON helpers and the response class built on them."""
+
+from typing import Any
+
+import orjson
+from fastapi.responses import JSONResponse
+
+_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+JSONDecodeError = orjson.JSONDecodeError
+
+
+def _default(value: Any) -> Any:
+    if hasattr(value, "model_dump"):
+        return value.model_dump(mode="json")
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+
+def dumps(value: Any) -> bytes:
+    """Compact UTF-8 JSON; handles NumPy arrays, datetimes and Pydantic models."""
+    return orjson.dumps(value, default=_default, option=_OPTIONS)
+
+
+def dumps_str(value: Any) -> str:
+    return dumps(value).decode()
+
+
+def loads(data: bytes | str) -> Any:
+    return orjson.loads(data)
+
+
+class FastJSONResponse(JSONResponse):
+    """For endpoints without a response model.
+
+    Endpoints that declare one keep FastAPI's default class, which already
+    serializes straight to bytes through Pydantic.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
@@ -0,0 +1,80 @@
+import numpy as np
+
+VECTOR_DTYPE = np.float32
+
+
+def as_vector_matrix(vectors) -> np.ndarray:
+    """View ``vectors`` as a C-contiguous 2-D float32 array, copying only if needed."""
+    matrix = np.asarray(vectors, dtype=VECTOR_DTYPE)
+    if matrix.ndim == 1:
+        matrix = matrix[np.newaxis, :]
+    return np.ascontiguousarray(matrix)
+
+
+def normalize_rows(vectors) -> np.ndarray:
+    """L2-normalize every row in one pass; zero rows are left untouched."""
+    matrix = as_vector_matrix(vectors)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def to_json_vector(vector) -> list[float]:
+    """Convert a vector to plain floats; only call this at the Azure boundary."""
+    return np.asarray(vector, dtype=VECTOR_DTYPE).tolist()
+
+
+def truncate_dimensions(vectors, dimensions: int) -> np.ndarray:
+    """Matryoshka truncation: keep the leading ``dimensions`` and renormalize."""
+    matrix = as_vector_matrix(vectors)
+    if dimensions >= matrix.shape[1]:
+        return matrix
+    return normalize_rows(matrix[:, :dimensions])
+
+
+def quantize_int8(vectors) -> tuple[np.ndarray, np.ndarray]:
+    """Symmetric per-dimension scalar quantization to int8 codes plus float32 scales."""
+    matrix = as_vector_matrix(vectors)
+    scale = np.abs(matrix).max(axis=0) / 127.0
+    scale[scale == 0] = 1.0
+    codes = np.clip(np.rint(matrix / scale), -127, 127).astype(np.int8)
+    return codes, scale.astype(VECTOR_DTYPE)
+
+
+def quantize_binary(vectors) -> np.ndarray:
+    """Sign-bit quantization packed 8 dimensions per byte."""
+    return np.packbits(as_vector_matrix(vectors) > 0, axis=1)
+
+
+_POPCOUNT = np.unpackbits(np.arange(256, dtype=np.uint8)[:, np.newaxis], axis=1).sum(
+    axis=1
+)
+
+
+def int8_scores(query, codes: np.ndarray, scale: np.ndarray) -> np.ndarray:
+    """Approximate dot products against int8 codes without dequantizing the corpus."""
+    return codes @ (as_vector_matrix(query)[0] * scale)
+
+
+def binary_scores(query, packed: np.ndarray) -> np.ndarray:
+    """Negative Hamming distance, so larger is closer like the other scorers."""
+    query_bits = quantize_binary(query)[0]
+    distances = _POPCOUNT[np.bitwise_xor(packed, query_bits)].sum(axis=1)
+    return -distances.astype(VECTOR_DTYPE)
+
+
+def top_k_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the ``k`` largest scores, best first."""
+    k = min(k, scores.shape[0])
+    if k <= 0:
+        return np.empty(0, dtype=np.intp)
+    candidates = np.argpartition(-scores, k - 1)[:k]
+    return candidates[np.argsort(-scores[candidates])]
+
+
+def rescore(query, full_vectors, candidates: np.ndarray, k: int) -> np.ndarray:
+    """Rerank quantized candidates with full-precision cosine and keep the top ``k``."""
+    if candidates.size == 0:
+        return candidates
+    exact = as_vector_matrix(full_vectors)[candidates] @ as_vector_matrix(query)[0]
+    return candidates[top_k_indices(exact, k)]
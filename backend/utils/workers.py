@@ -0,0 +1,18 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
+from utils.env import get_env
+
+
+@lru_cache(maxsize=1)
+def get_cpu_pool() -> ProcessPoolExecutor:
+    """Shared process pool for NumPy/model work that should not hold the GIL.
+
+    Workers are spawned rather than forked: forking a threaded server can
+    copy a lock held by another thread into the child and deadlock it.
+    """
+    return ProcessPoolExecutor(
+        max_workers=int(get_env("CPU_WORKERS", "2")),
+        mp_context=multiprocessing.get_context("spawn"),
+    )